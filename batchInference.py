@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from responseCache import ResponseCache, cache_key
+
+INFERENCE_CACHE_PATH = './data/cache/inference.sqlite'
+DATASET_ID = 'napa_wildfire_demo'
+MODEL_NAME = 'gemini_firesim_model'
+CONNECTION_ID = 'gcs-connection'
+GENERATION_OPTIONS = {'max_output_tokens': 2048, 'temperature': 0.1}
+
+# Weather is bucketed before it goes into a prompt so near-identical days share one request
+WEATHER_BUCKETS = {'temp_max': 5, 'humidity': 5, 'wind_speed': 5}
+
+PROMPT_TEMPLATE = (
+    "You are a CAL FIRE wildfire analyst. Your task is to provide a risk forecast by analyzing all the following "
+    "data sources. Image and text are provided as links to Google cloud bucket content\n\n"
+    "## CONTEXT DATA ##\n"
+    "*   **Weather:** Temp: {temp_max}°F, Humidity: {humidity}%, Wind: {wind_speed} mph.\n"
+    "*   **Text Alert:** {alert_line}\n"
+    "*   **Satellite Image:** {image_line}\n\n"
+    "## YOUR TASK ##\n"
+    "1.  **Image Analysis:** Based on the satellite image, describe the vegetation condition in one phrase "
+    "(e.g., 'Lush and green', 'Dry and stressed', 'Extremely dry and brown').\n"
+    "2.  **Data Synthesis:** Do the weather data and the text alert strongly correlate with the visual evidence in "
+    "the image? (Answer Yes or No with 1 line summary).\n"
+    "3.  **Risk Score:** Provide a final 'Fire Risk Score' from 1 (Low) to 10 (Extreme).\n"
+    "4.  **Recommendation:** State the single most important action for emergency crews."
+)
+
+
+def _bucket_label(value, width):
+    low = int(np.floor(value / width) * width)
+    return f"{low}-{low + width}"
+
+
+def object_ref(uri, version=None):
+    """ObjectRef as the notebook passes it to ML.GENERATE_TEXT"""
+    if not uri:
+        return None
+    return {'uri': uri, 'authorizer': CONNECTION_ID, 'version': None if version is None else str(version)}
+
+
+def object_versions(data_dir='./data'):
+    """File name -> object generation for the local alert and image object tables"""
+    from localQueryEngine import OBJECT_TABLES, object_metadata
+    versions = {}
+    for table_name in OBJECT_TABLES:
+        metadata = object_metadata(table_name, data_dir)
+        versions.update(zip(metadata['uri'].str.rsplit('/', n=1).str[-1], metadata['generation']))
+    return versions
+
+
+def build_requests(rows, bucket_name=None, versions=None):
+    """One inference request per row: bucketed prompt, ObjectRefs and the cache key they share.
+
+    rows are fused weather rows (temporalJoin.fuse) with temp_max, humidity, wind_speed and
+    optional alert_reference / image_uri. The key is the prompt hash plus the version of each
+    referenced object, so a re-uploaded image or alert invalidates exactly its entries.
+    """
+    bucket_name = bucket_name or f"{os.environ.get('PROJECT_ID', 'local')}-napa-fire-data"
+    versions = versions if versions is not None else object_versions()
+    requests = []
+    for row in rows.itertuples(index=False):
+        weather = {column: _bucket_label(getattr(row, column), width) for column, width in WEATHER_BUCKETS.items()}
+        alert = getattr(row, 'alert_reference', None)
+        alert = alert if isinstance(alert, str) and alert else None
+        image = getattr(row, 'image_uri', None)
+        image = image if isinstance(image, str) and image else None
+        alert_ref = object_ref(f"gs://{bucket_name}/alerts/{alert}" if alert else None,
+                               versions.get(alert) if alert else None)
+        image_ref = object_ref(image, versions.get(image.rsplit('/', 1)[-1]) if image else None)
+        prompt = PROMPT_TEMPLATE.format(
+            alert_line="See the attached official NWS text file." if alert_ref else "No active NWS alert.",
+            image_line="See the attached satellite photo of the region." if image_ref else "No image available.",
+            **weather)
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        key = cache_key(MODEL_NAME, GENERATION_OPTIONS, prompt_hash,
+                        alert_ref and alert_ref['version'], alert_ref and alert_ref['uri'],
+                        image_ref and image_ref['version'], image_ref and image_ref['uri'])
+        requests.append({'key': key, 'prompt': prompt, 'alert_ref': alert_ref, 'image_ref': image_ref})
+    return requests
+
+
+def parse_response(raw):
+    """Parse a Gemini response (JSON candidates or plain text) into the four answers the prompt asks for"""
+    try:
+        text = json.loads(raw)['candidates'][0]['content']['parts'][0]['text']
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError):
+        text = raw or ''
+    score = re.search(r'Risk Score[^0-9]{0,20}(\d{1,2})', text, re.IGNORECASE)
+    correlates = re.search(r'Data Synthesis[^A-Za-z]*\s*(Yes|No)\b', text, re.IGNORECASE)
+    vegetation = re.search(r'Image Analysis[:*\s]*(.+)', text, re.IGNORECASE)
+    recommendation = re.search(r'Recommendation[:*\s]*(.+)', text, re.IGNORECASE)
+    return {
+        'risk_score': int(score.group(1)) if score else None,
+        'correlates': correlates.group(1).capitalize() if correlates else None,
+        'vegetation': vegetation.group(1).strip() if vegetation else None,
+        'recommendation': recommendation.group(1).strip() if recommendation else None,
+        'text': text
+    }
+
+
+class MockGeminiModel:
+    """Local stand-in for the remote model: fixed per-request latency plus a per-prompt cost.
+
+    Answers are deterministic functions of the prompt's weather buckets, wrapped in the same
+    candidates JSON the real endpoint returns.
+    """
+
+    def __init__(self, request_latency=0.05, item_latency=0.002):
+        self.request_latency = request_latency
+        self.item_latency = item_latency
+        self.requests = 0
+        self.items = 0
+        self.lock = threading.Lock()
+
+    def generate(self, batch):
+        time.sleep(self.request_latency + self.item_latency * len(batch))
+        with self.lock:
+            self.requests += 1
+            self.items += len(batch)
+        responses = {}
+        for request in batch:
+            temp, humidity, wind = (int(value) for value in re.findall(
+                r'Temp: (\d+)-\d+°F, Humidity: (\d+)-\d+%, Wind: (\d+)-\d+ mph', request['prompt'])[0])
+            score = int(np.clip(1 + (temp - 60) / 6 + (40 - humidity) / 8 + wind / 6, 1, 10))
+            vegetation = 'Extremely dry and brown' if score >= 8 else 'Dry and stressed' if score >= 5 else 'Lush and green'
+            text = (f"1. **Image Analysis:** {vegetation}\n"
+                    f"2. **Data Synthesis:** {'Yes' if score >= 5 else 'No'}, conditions match the imagery.\n"
+                    f"3. **Risk Score:** {score}\n"
+                    f"4. **Recommendation:** {'Pre-position crews' if score >= 7 else 'Maintain normal readiness'}.")
+            responses[request['key']] = json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]})
+        return responses
+
+
+class BigQueryModel:
+    """Batched ML.GENERATE_TEXT: one query per batch with the requests passed as an array parameter"""
+
+    def __init__(self, bq_client, model_id):
+        self.client = bq_client
+        self.model_id = model_id
+        self.requests = 0
+        self.items = 0
+
+    def batch_sql(self):
+        options = ", ".join(f"{value} AS {name}" for name, value in GENERATION_OPTIONS.items())
+        return f"""
+        SELECT request_key, ml_generate_text_result AS ai_analysis
+        FROM ML.GENERATE_TEXT(
+          MODEL `{self.model_id}`,
+          (
+            SELECT request_key, prompt, PARSE_JSON(alert_ref) AS alert_file, PARSE_JSON(image_ref) AS satellite_image
+            FROM UNNEST(@requests)
+          ),
+          STRUCT({options})
+        )
+        """
+
+    def generate(self, batch):
+        from google.cloud import bigquery
+
+        items = [bigquery.StructQueryParameter(
+            None,
+            bigquery.ScalarQueryParameter('request_key', 'STRING', request['key']),
+            bigquery.ScalarQueryParameter('prompt', 'STRING', request['prompt']),
+            bigquery.ScalarQueryParameter('alert_ref', 'STRING', json.dumps(request['alert_ref'])),
+            bigquery.ScalarQueryParameter('image_ref', 'STRING', json.dumps(request['image_ref']))
+        ) for request in batch]
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter('requests', 'STRUCT', items)
+        ])
+        df = self.client.query(self.batch_sql(), job_config=job_config).to_dataframe()
+        self.requests += 1
+        self.items += len(batch)
+        return dict(zip(df['request_key'], df['ai_analysis']))
+
+
+def score_rows(rows, model, cache=None, batch_size=32, max_concurrency=4, versions=None, bucket_name=None):
+    """Run the multimodal analysis for many fused rows with dedupe, caching and batching.
+
+    Identical requests are collapsed, cached answers are reused, and the remaining unique
+    prompts go to the model in batches of batch_size with at most max_concurrency batches in
+    flight. Returns (results aligned with rows, report).
+    """
+    start = time.perf_counter()
+    requests = build_requests(rows, bucket_name, versions)
+    unique = {}
+    for request in requests:
+        unique.setdefault(request['key'], request)
+
+    answers, hits = {}, 0
+    if cache is not None:
+        for key in unique:
+            cached = cache.get(key)
+            if cached is not None:
+                answers[key] = cached
+                hits += 1
+    pending = [request for key, request in unique.items() if key not in answers]
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+    latencies = []
+
+    def run(batch):
+        batch_start = time.perf_counter()
+        raw = model.generate(batch)
+        latencies.append(time.perf_counter() - batch_start)
+        return {key: parse_response(text) for key, text in raw.items()}
+
+    if batches:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for parsed in executor.map(run, batches):
+                answers.update(parsed)
+                if cache is not None:
+                    # Only answers the parser understood are kept; a fallback is asked again next run
+                    for key, answer in parsed.items():
+                        if answer['risk_score'] is not None:
+                            cache.put(key, answer)
+
+    empty = parse_response(None)
+    results = pd.DataFrame([answers.get(request['key'], empty) for request in requests], columns=list(empty))
+    results.insert(0, 'request_key', [request['key'] for request in requests])
+    report = {
+        'rows': len(requests),
+        'unique_requests': len(unique),
+        'duplicates_collapsed': len(requests) - len(unique),
+        'cache_hits': hits,
+        'cache_hit_rate': round(hits / len(unique), 3) if unique else None,
+        'prompts_sent': len(pending),
+        'model_calls': len(batches),
+        'requests_saved': len(requests) - len(batches),
+        'p50_latency_ms': round(float(np.percentile(latencies, 50)) * 1000, 1) if latencies else None,
+        'p95_latency_ms': round(float(np.percentile(latencies, 95)) * 1000, 1) if latencies else None,
+        'wall_time_s': round(time.perf_counter() - start, 3)
+    }
+    return results, report
+
+
+def print_report(report):
+    print(f"  {report['rows']} rows -> {report['unique_requests']} unique requests "
+          f"({report['duplicates_collapsed']} duplicates collapsed), {report['cache_hits']} cache hits "
+          f"(hit rate {report['cache_hit_rate']})")
+    print(f"  {report['prompts_sent']} prompts sent in {report['model_calls']} model calls "
+          f"({report['requests_saved']} round-trips saved vs one query per row), "
+          f"p50 {report['p50_latency_ms']} ms, p95 {report['p95_latency_ms']} ms, wall {report['wall_time_s']}s")
+
+
+def high_risk_rows(min_score=0.6, ambiguous_only=False):
+    """High-risk fused weather rows, optionally only those whose matched image is ambiguous"""
+    from temporalJoin import fused_history
+    rows = fused_history()
+    rows = rows[rows['fire_risk_score'] > min_score]
+    if ambiguous_only:
+        from imageFeatures import image_features, join_to_weather
+        rows = join_to_weather(rows, image_features())
+        rows = rows[rows['needs_model'].fillna(True).astype(bool)]
+    return rows.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    rows = high_risk_rows(ambiguous_only="--ambiguous-only" in sys.argv)
+    cache = ResponseCache(INFERENCE_CACHE_PATH)
+    if "--bigquery" in sys.argv:
+        from localQueryEngine import get_client
+        project_id = os.environ["PROJECT_ID"]
+        model = BigQueryModel(get_client(project_id, backend='bigquery'), f"{project_id}.{DATASET_ID}.{MODEL_NAME}")
+    else:
+        model = MockGeminiModel()
+
+    naive_seconds = len(rows) * (getattr(model, 'request_latency', 0) + getattr(model, 'item_latency', 0))
+    print(f"Scoring {len(rows)} high-risk rows ({type(model).__name__}; one query per row would take "
+          f"~{naive_seconds:.1f}s of model latency)")
+    results, report = score_rows(rows, model, cache)
+    print_report(report)
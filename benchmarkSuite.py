@@ -0,0 +1,335 @@
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from runMetrics import PeakMemory
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_PATH = os.path.join(REPO_DIR, 'data', 'benchmarks', 'history.json')
+
+# Scales per stage for each profile: row counts, or station counts for the collector
+PROFILES = {
+    'quick': {
+        'generate': [1_000, 10_000], 'score': [1_000, 10_000], 'collect': [5, 50], 'collect_noaa': [5, 50],
+        'load_fire_history': [1_000, 10_000], 'upload': [1_000, 10_000], 'query': [1_000, 10_000]
+    },
+    'default': {
+        'generate': [1_000, 100_000, 1_000_000], 'score': [1_000, 100_000, 1_000_000], 'collect': [5, 50, 500],
+        'collect_noaa': [5, 50, 500],
+        'load_fire_history': [1_000, 100_000, 1_000_000], 'upload': [1_000, 100_000, 1_000_000],
+        'query': [1_000, 100_000, 1_000_000]
+    },
+    'full': {
+        'generate': [1_000, 10_000, 100_000, 1_000_000, 10_000_000],
+        'score': [1_000, 10_000, 100_000, 1_000_000, 10_000_000],
+        'collect': [5, 50, 500, 5_000],
+        'collect_noaa': [5, 50, 500, 5_000],
+        'load_fire_history': [1_000, 10_000, 100_000, 1_000_000],
+        'upload': [1_000, 10_000, 100_000, 1_000_000, 10_000_000],
+        'query': [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+    }
+}
+
+# A case regresses when it is this much slower (or uses this much more memory) than the baseline
+REGRESSION_THRESHOLD = 0.20
+# Cases faster than this are dominated by noise and never flagged on time alone
+MIN_COMPARABLE_SECONDS = 0.05
+# Peak RSS growth below this many MB is allocator noise and never flagged on memory alone
+MIN_COMPARABLE_MB = 16
+# Collector window per station: one archive request of this many days
+COLLECT_DAYS = 31
+
+
+def _weather(rows, seed=0):
+    from generateSimulatedData import generate_weather_data_vectorized, simulation_dates
+    days = len(simulation_dates('2017-01-01', '2024-12-31'))
+    return generate_weather_data_vectorized(locations=-(-rows // days), seed=seed, num_records=rows)
+
+
+def _fire_snapshots(rows, directory, files=3, seed=0):
+    """Write fire history CSV snapshots that overlap like the real timestamped exports"""
+    rng = np.random.default_rng(seed)
+    alarm = np.datetime64('2000-01-01') + rng.integers(0, 9000, rows).astype('timedelta64[D]')
+    fires = pd.DataFrame({
+        'fire_name': [f"FIRE_{i:08d}" for i in range(rows)],
+        'fire_year': alarm.astype('datetime64[Y]').astype(int) + 1970,
+        'alarm_date': alarm,
+        'contained_date': alarm + rng.integers(1, 40, rows).astype('timedelta64[D]'),
+        'acres': np.round(rng.lognormal(5, 2, rows), 1),
+        'cause': rng.choice(['Lightning', 'Equipment', 'Arson', 'Unknown'], rows),
+        'latitude': np.round(rng.uniform(38.1, 38.9, rows), 4),
+        'longitude': np.round(rng.uniform(-122.7, -122.0, rows), 4),
+        'county': 'Napa'
+    })
+    os.makedirs(directory, exist_ok=True)
+    for i in range(files):
+        # Each snapshot holds an overlapping 60% slice, so the loader has duplicates to collapse
+        start = int(rows * 0.2 * i)
+        fires.iloc[start:start + int(rows * 0.6)].to_csv(
+            os.path.join(directory, f"fire_history_2025090{i + 1}_000000.csv"), index=False)
+
+
+def _stations(count):
+    rng = np.random.default_rng(count)
+    return [{'name': f"Station_{i:05d}", 'lat': round(float(lat), 4), 'lon': round(float(lon), 4)}
+            for i, (lat, lon) in enumerate(zip(rng.uniform(32.5, 42.0, count), rng.uniform(-124.4, -114.1, count)))]
+
+
+def _setup(stage, scale, workdir):
+    """Build the inputs for one case outside the timed section; returns the timed callable"""
+    if stage == 'generate':
+        from generateSimulatedData import iter_weather_data, simulation_dates
+        stations = -(-scale // len(simulation_dates('2017-01-01', '2024-12-31')))
+        return lambda: sum(len(chunk) for chunk in iter_weather_data(locations=stations, seed=0, num_records=scale))
+
+    if stage == 'score':
+        from fireRiskScoring import score_frame
+        weather = _weather(scale)
+        return lambda: len(score_frame(weather))
+
+    if stage == 'collect':
+        from collectRealData import collect_open_meteo_weather
+        from devStubs import StubServer
+        stations = _stations(scale)
+        end = (pd.Timestamp('2024-08-01') + pd.Timedelta(days=COLLECT_DAYS - 1)).strftime('%Y-%m-%d')
+
+        def collect():
+            with StubServer() as stub:
+                return len(collect_open_meteo_weather(stations, [('2024-08-01', end)], base_url=stub.url,
+                                                      max_workers=16, requests_per_second=None))
+        return collect
+
+    if stage == 'collect_noaa':
+        from collectRealData import collect_noaa_weather
+        from devStubs import StubServer, noaa_cdo_responder
+        stations = [dict(station, ghcnd_id=f"GHCND:USC{i:08d}") for i, station in enumerate(_stations(scale))]
+        end = (pd.Timestamp('2024-08-01') + pd.Timedelta(days=COLLECT_DAYS - 1)).strftime('%Y-%m-%d')
+
+        def collect_noaa():
+            with StubServer(noaa_cdo_responder) as stub:
+                return len(collect_noaa_weather(stations, [('2024-08-01', end)], base_url=stub.url, token='benchmark',
+                                                max_workers=16, requests_per_second=None))
+        return collect_noaa
+
+    # The loaders import the BigQuery SDK on first use; keep that one-off cost out of the timings
+    if stage in ('load_fire_history', 'upload'):
+        import google.cloud.bigquery  # noqa: F401
+
+    if stage == 'load_fire_history':
+        from dataCollector_v3 import load_fire_history
+        from devStubs import FakeBigQueryClient
+        _fire_snapshots(scale, os.path.join(workdir, 'data'))
+
+        def load():
+            client = FakeBigQueryClient('benchmark')
+            load_fire_history('benchmark', 'napa_wildfire_demo', client=client, include_store=False)
+            return client.get_table('benchmark.napa_wildfire_demo.fire_history').num_rows
+        return load
+
+    if stage == 'upload':
+        from dataCollector_v3 import upload_to_bigquery
+        from devStubs import FakeBigQueryClient
+        weather = _weather(scale)
+        return lambda: len(weather) if upload_to_bigquery(weather, 'weather_data', mode='incremental',
+                                                          bq_client=FakeBigQueryClient('benchmark')) else 0
+
+    if stage == 'query':
+        from localQueryEngine import DEMO_QUERIES, LocalClient
+        from localStore import write_table
+        store_root = os.path.join(workdir, 'data', 'store')
+        write_table(_weather(scale), 'weather_data', store_root)
+
+        def query():
+            client = LocalClient('benchmark', data_dir=os.path.join(workdir, 'data'), store_root=store_root)
+            for name in ('high_risk_weather', 'fire_risk_analysis'):
+                client.query(DEMO_QUERIES[name].format(dataset_ref='benchmark.napa_wildfire_demo')).result()
+            client.close()
+            return scale
+        return query
+
+    raise ValueError(f"Unknown benchmark stage: {stage}")
+
+
+def _run_case(stage, scale, queue):
+    """Child-process entry point: set up, time and measure one case in a scratch directory"""
+    workdir = tempfile.mkdtemp(prefix=f"bench_{stage}_")
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    os.environ.setdefault('PROJECT_ID', 'benchmark')
+    try:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):
+            timed = _setup(stage, scale, workdir)
+            with PeakMemory() as memory:
+                start = time.perf_counter()
+                rows = timed()
+                elapsed = time.perf_counter() - start
+        queue.put({
+            'stage': stage, 'scale': scale, 'rows': int(rows), 'wall_s': round(elapsed, 4),
+            'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else None,
+            'peak_rss_mb': round(memory.peak / 2**20, 1),
+            'stage_rss_mb': round((memory.peak - memory.baseline) / 2**20, 1)
+        })
+    except Exception as e:
+        queue.put({'stage': stage, 'scale': scale, 'error': f"{type(e).__name__}: {e}"})
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_case(stage, scale, repeat=1):
+    """Run one case in fresh processes so peak memory is not inherited from earlier cases.
+
+    With repeat > 1 the fastest wall time and the largest memory footprint are kept.
+    """
+    context = multiprocessing.get_context('spawn')
+    best = None
+    for _ in range(repeat):
+        queue = context.Queue()
+        process = context.Process(target=_run_case, args=(stage, scale, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if 'error' in result:
+            return result
+        if best is None:
+            best = result
+        else:
+            peak, stage_rss = max(best['peak_rss_mb'], result['peak_rss_mb']), max(best['stage_rss_mb'], result['stage_rss_mb'])
+            best = min(best, result, key=lambda r: r['wall_s'])
+            best.update({'peak_rss_mb': peak, 'stage_rss_mb': stage_rss})
+    return best
+
+
+def _git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_suite(profile='default', stages=None, repeat=1, history_path=HISTORY_PATH):
+    """Run every (stage, scale) case of a profile and append the run to the JSON history"""
+    scales = PROFILES[profile]
+    stages = stages or list(scales)
+    run = {
+        'commit': _git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'profile': profile,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': []
+    }
+    print(f"Benchmark run at {run['commit']} (profile {profile}, {run['cpu_count']} CPUs)")
+    print(f"  {'stage':<18} {'scale':>10} {'rows':>12} {'wall s':>9} {'rows/sec':>13} {'peak MB':>9} {'stage MB':>9}")
+    for stage in stages:
+        for scale in scales[stage]:
+            result = run_case(stage, scale, repeat)
+            run['results'].append(result)
+            if 'error' in result:
+                print(f"  {stage:<18} {scale:>10,}  failed: {result['error']}")
+            else:
+                print(f"  {stage:<18} {scale:>10,} {result['rows']:>12,} {result['wall_s']:>9.3f} "
+                      f"{result['rows_per_sec']:>13,.0f} {result['peak_rss_mb']:>9.1f} {result['stage_rss_mb']:>9.1f}")
+
+    history = load_history(history_path)
+    history.append(run)
+    os.makedirs(os.path.dirname(history_path), exist_ok=True)
+    with open(history_path, 'w') as f:
+        json.dump(history, f, indent=1)
+    print(f"Saved run {len(history) - 1} to {history_path}")
+    return run
+
+
+def _find_run(history, ref):
+    """Resolve a history entry by commit prefix (the latest match wins), else by index (e.g. -1)"""
+    for run in reversed(history):
+        if run['commit'].startswith(str(ref)):
+            return run
+    try:
+        return history[int(ref)]
+    except (ValueError, IndexError):
+        pass
+    raise KeyError(f"No benchmark run matches {ref!r}")
+
+
+def compare_runs(base, head, threshold=REGRESSION_THRESHOLD):
+    """Compare two runs case by case; returns the comparison table and the regressed cases"""
+    base_results = {(r['stage'], r['scale']): r for r in base['results'] if 'error' not in r}
+    rows = []
+    for result in head['results']:
+        previous = base_results.get((result['stage'], result['scale']))
+        if previous is None or 'error' in result:
+            continue
+        time_change = result['wall_s'] / previous['wall_s'] - 1 if previous['wall_s'] else 0.0
+        memory_change = result['peak_rss_mb'] / previous['peak_rss_mb'] - 1 if previous['peak_rss_mb'] else 0.0
+        slower = time_change > threshold and max(result['wall_s'], previous['wall_s']) >= MIN_COMPARABLE_SECONDS
+        bigger = memory_change > threshold and result['peak_rss_mb'] - previous['peak_rss_mb'] >= MIN_COMPARABLE_MB
+        rows.append({
+            'stage': result['stage'], 'scale': result['scale'],
+            'base_s': previous['wall_s'], 'head_s': result['wall_s'], 'time_change': round(time_change, 3),
+            'base_mb': previous['peak_rss_mb'], 'head_mb': result['peak_rss_mb'], 'memory_change': round(memory_change, 3),
+            'regressed': slower or bigger
+        })
+    table = pd.DataFrame(rows)
+    regressions = table[table['regressed']] if len(table) else table
+    return table, regressions
+
+
+def print_comparison(base, head, table, regressions, threshold=REGRESSION_THRESHOLD):
+    print(f"Comparing {base['commit']} ({base['timestamp']}) -> {head['commit']} ({head['timestamp']})")
+    if base.get('platform') != head.get('platform') or base.get('cpu_count') != head.get('cpu_count'):
+        print("  Warning: runs were recorded on different machines; timings may not be comparable")
+    for row in table.itertuples():
+        flag = 'REGRESSION' if row.regressed else ''
+        print(f"  {row.stage:<18} {row.scale:>10,} {row.base_s:>9.3f}s -> {row.head_s:>9.3f}s ({row.time_change:+7.1%})"
+              f" {row.base_mb:>8.1f} -> {row.head_mb:>8.1f} MB ({row.memory_change:+7.1%}) {flag}")
+    print(f"{len(regressions)} regression(s) over {threshold:.0%} in {len(table)} comparable cases")
+
+
+def _option(name, default=None):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+if __name__ == "__main__":
+    history_path = _option('--history', HISTORY_PATH)
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        refs = [arg for arg in sys.argv[2:4] if not arg.startswith('--')]
+        history = load_history(history_path)
+        if len(history) < 2 and len(refs) < 2:
+            print(f"Need at least two runs in {history_path} to compare")
+            sys.exit(1)
+        base = _find_run(history, refs[0] if refs else -2)
+        head = _find_run(history, refs[1] if len(refs) > 1 else -1)
+        threshold = float(_option('--threshold', REGRESSION_THRESHOLD))
+        table, regressions = compare_runs(base, head, threshold)
+        print_comparison(base, head, table, regressions, threshold)
+        sys.exit(1 if len(regressions) else 0)
+    else:
+        stages = _option('--stages')
+        run_suite(_option('--profile', 'default'), stages.split(',') if stages else None,
+                  int(_option('--repeat', 1)), history_path)
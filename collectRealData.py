@@ -1,141 +1,576 @@
 import os
+import random
+import sys
+import threading
+from collections import deque
 import requests
 import pandas as pd
-from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
 import time
-
-print(os.environ["PROJECT_ID"]) 
+import numpy as np
+import runMetrics
+import tableSchemas
+from tableSchemas import DATE_DTYPE
+from responseCache import ResponseCache, cache_key
+from fireRiskScoring import risk_scores
+from localStore import STORE_ROOT, read_weather, write_table
+from stationRegistry import load_registry
 
 OPENWEATHER_API_KEY = "*********"
-NOAA_TOKEN = "************"
+NOAA_TOKEN = os.environ.get('NOAA_TOKEN', '')
 
+NOAA_CDO_URL = "https://www.ncei.noaa.gov/cdo-web/api/v2/data"
+NOAA_DATATYPES = ['TMAX', 'TMIN', 'PRCP']
+# CDO limits: 5 requests/s per token, 1000 results per page, GHCND requests under a year long
+NOAA_REQUESTS_PER_SECOND = 5.0
+NOAA_PAGE_LIMIT = 1000
+NOAA_MAX_WINDOW_DAYS = 365
 
-def collect_open_meteo_weather():
-    """Collect weather data from Open-Meteo API (free)"""
-    print("Collecting weather data from Open-Meteo...")
-    
-    locations = [
-        {"name": "Napa_Airport", "lat": 38.2139, "lon": -122.2803},
-        {"name": "St_Helena", "lat": 38.5050, "lon": -122.4700},
-        {"name": "Calistoga", "lat": 38.5788, "lon": -122.5800},
-        {"name": "Yountville", "lat": 38.4016, "lon": -122.3583},
-        {"name": "American_Canyon", "lat": 38.1749, "lon": -122.2608}
-    ]
-    
-    date_ranges = [
-        ("2020-09-15", "2020-10-15"),
-        ("2017-10-01", "2017-10-31"),
-        ("2023-09-01", "2023-09-30"),
-        ("2024-08-15", "2024-09-15"),
-        ("2021-03-15", "2021-04-15"),
-        ("2022-03-01", "2022-03-31"),
-        ("2023-03-01", "2023-03-31"),
-        ("2024-03-01", "2024-03-31")
+OPEN_METEO_ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+OPEN_METEO_DAILY_VARIABLES = 'temperature_2m_max,relative_humidity_2m,wind_speed_10m_max,wind_direction_10m_dominant,pressure_msl,sunshine_duration'
+OPEN_METEO_HOURLY_VARIABLES = 'temperature_2m,relative_humidity_2m,wind_speed_10m,wind_gusts_10m,wind_direction_10m,pressure_msl,sunshine_duration'
+# 24x the values per day, so hourly requests cover a month rather than a year
+HOURLY_WINDOW_DAYS = 31
+
+OPEN_METEO_LOCATIONS = load_registry().locations()
+
+OPEN_METEO_DATE_RANGES = [
+    ("2020-09-15", "2020-10-15"),
+    ("2017-10-01", "2017-10-31"),
+    ("2023-09-01", "2023-09-30"),
+    ("2024-08-15", "2024-09-15"),
+    ("2021-03-15", "2021-04-15"),
+    ("2022-03-01", "2022-03-31"),
+    ("2023-03-01", "2023-03-31"),
+    ("2024-03-01", "2024-03-31")
+]
+
+WEATHER_COLUMNS = tableSchemas.columns('weather_data')
+# weather_data 'source' of rows from the daily archive; incremental runs only count these as collected
+OPEN_METEO_SOURCE = 'open_meteo'
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# The archive lags real time by a few days; only windows older than this are final and cacheable
+ARCHIVE_DELAY_DAYS = 7
+
+_stats_lock = threading.Lock()
+
+
+def _count(stats, key, amount=1):
+    """Increment a shared stats counter from any worker thread"""
+    if stats is not None:
+        with _stats_lock:
+            stats[key] = stats.get(key, 0) + amount
+
+
+class TokenBucket:
+    """Thread-safe token bucket that limits how many requests start per second"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def create_session(pool_size=16):
+    """Create a requests session with a keep-alive connection pool sized for the worker count"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def split_date_range(start_date, end_date, max_days=366):
+    """Split an inclusive date range into consecutive windows of at most max_days"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    windows = []
+    while start <= end:
+        window_end = min(end, start + timedelta(days=max_days - 1))
+        windows.append((start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def get_with_retries(session, url, params=None, headers=None, rate_limiter=None, max_retries=5,
+                     backoff=0.5, max_backoff=30.0, timeout=30, stats=None):
+    """GET a URL, retrying 429/5xx responses and connection errors with jittered exponential backoff"""
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        _count(stats, 'requests')
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            runMetrics.observe('http_request_seconds', time.perf_counter() - start, host=host)
+            runMetrics.count('http_requests', host=host, status=type(e).__name__)
+            if attempt == max_retries:
+                raise
+            retry_after = None
+        else:
+            runMetrics.observe('http_request_seconds', time.perf_counter() - start, host=host)
+            runMetrics.count('http_requests', host=host, status=response.status_code)
+            runMetrics.count('http_response_bytes', len(response.content), host=host)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                return response
+            retry_after = response.headers.get('Retry-After')
+
+        _count(stats, 'retries')
+        runMetrics.count('http_retries', host=host)
+        delay = min(max_backoff, backoff * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        time.sleep(delay)
+
+
+def _daily_column(daily_data, name, length):
+    """Return a float array for one daily variable, padded with NaN for missing values"""
+    values = pd.to_numeric(pd.Series(daily_data.get(name, [])[:length], dtype=object), errors='coerce').to_numpy(np.float64)
+    if len(values) < length:
+        values = np.concatenate([values, np.full(length - len(values), np.nan)])
+    return values
+
+
+def _open_meteo_records(location, daily_data):
+    """Convert an Open-Meteo daily payload into a weather_data frame"""
+    dates = daily_data.get('time', [])
+    n = len(dates)
+    temps = _daily_column(daily_data, 'temperature_2m_max', n)
+    keep = ~np.isnan(temps)
+
+    temp_f = (temps[keep] * 9/5) + 32
+    hum = np.nan_to_num(_daily_column(daily_data, 'relative_humidity_2m', n)[keep], nan=50)
+    wind = np.nan_to_num(_daily_column(daily_data, 'wind_speed_10m_max', n)[keep] * 2.237, nan=5)
+    pres = np.nan_to_num(_daily_column(daily_data, 'pressure_msl', n)[keep], nan=1013)
+    sun = np.nan_to_num(_daily_column(daily_data, 'sunshine_duration', n)[keep], nan=3600)
+    wind_d = np.nan_to_num(_daily_column(daily_data, 'wind_direction_10m_dominant', n)[keep], nan=0)
+
+    # Written straight into the compact weather_data types (tableSchemas); Open-Meteo has no
+    # temp_min or precipitation in this request, so those stay null
+    kept = int(keep.sum())
+    return tableSchemas.to_typed(pd.DataFrame({
+        'location': pd.Categorical.from_codes(np.zeros(kept, dtype=np.int8), categories=[location['name']]),
+        'date': np.asarray(dates, dtype='datetime64[D]')[keep].astype(DATE_DTYPE),
+        'temp_max': np.round(temp_f, 1).astype(np.float32),
+        'humidity': np.round(hum).astype(np.int8),
+        'wind_speed': np.round(wind, 1).astype(np.float32),
+        'wind_deg': np.round(wind_d).astype(np.int16),
+        'pressure': np.round(pres).astype(np.int16),
+        'visibility': np.full(kept, 15000, dtype=np.int32),
+        'uvi': np.clip((sun / 3600) * 0.8, 0, 10).astype(np.float32),
+        'fire_risk_score': risk_scores(temp_f, hum, wind, sun, version='open_meteo_v1').astype(np.float32),
+        'sunshine': np.round(sun).astype(np.int32),
+        'source': pd.Categorical.from_codes(np.zeros(kept, dtype=np.int8), categories=[OPEN_METEO_SOURCE])
+    }).reindex(columns=WEATHER_COLUMNS), 'weather_data')
+
+
+def _open_meteo_hourly_records(location, hourly_data):
+    """Convert an Open-Meteo hourly payload into a weather_hourly frame"""
+    times = np.asarray(hourly_data.get('time', []), dtype='datetime64[m]')
+    n = len(times)
+    temps = _daily_column(hourly_data, 'temperature_2m', n)
+    keep = ~np.isnan(temps)
+
+    # Requested with wind_speed_unit=ms, so the daily collector's m/s -> mph factor applies
+    wind = np.nan_to_num(_daily_column(hourly_data, 'wind_speed_10m', n)[keep] * 2.237, nan=5)
+    gust = _daily_column(hourly_data, 'wind_gusts_10m', n)[keep] * 2.237
+    kept = int(keep.sum())
+    return pd.DataFrame({
+        'location': pd.Categorical.from_codes(np.zeros(kept, dtype=np.int8), categories=[location['name']]),
+        'date': times[keep].astype('datetime64[D]').astype(DATE_DTYPE),
+        'hour': (times[keep] - times[keep].astype('datetime64[D]')).astype('timedelta64[h]').astype(np.int8),
+        'temperature': np.round(temps[keep] * 9/5 + 32, 1).astype(np.float32),
+        'humidity': np.round(np.nan_to_num(_daily_column(hourly_data, 'relative_humidity_2m', n)[keep], nan=50)).astype(np.int8),
+        'wind_speed': np.round(wind, 1).astype(np.float32),
+        'wind_gust': np.round(np.where(np.isnan(gust), wind, gust), 1).astype(np.float32),
+        'wind_deg': np.round(np.nan_to_num(_daily_column(hourly_data, 'wind_direction_10m', n)[keep], nan=0)).astype(np.int16),
+        'pressure': np.round(np.nan_to_num(_daily_column(hourly_data, 'pressure_msl', n)[keep], nan=1013)).astype(np.int16),
+        'sunshine': np.round(np.nan_to_num(_daily_column(hourly_data, 'sunshine_duration', n)[keep], nan=0)).astype(np.int16)
+    }, columns=tableSchemas.columns('weather_hourly'))
+
+
+# resolution -> (payload key, variables, extra request parameters, payload converter)
+OPEN_METEO_RESOLUTIONS = {
+    'daily': ('daily', OPEN_METEO_DAILY_VARIABLES, {}, _open_meteo_records),
+    'hourly': ('hourly', OPEN_METEO_HOURLY_VARIABLES, {'wind_speed_unit': 'ms'}, _open_meteo_hourly_records)
+}
+
+
+def missing_date_ranges(start_date, end_date, stored_dates, max_days=366):
+    """Return the windows of [start_date, end_date] not covered by stored_dates"""
+    days = pd.date_range(start_date, end_date, freq='D')
+    if len(days) == 0:
+        return []
+    missing = ~days.isin(pd.to_datetime(pd.Index(list(stored_dates)), errors='coerce'))
+    if not missing.any():
+        return []
+    edges = np.diff(np.concatenate(([0], missing.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1) - 1
+    windows = []
+    for run_start, run_end in zip(run_starts, run_ends):
+        windows.extend(split_date_range(days[run_start].strftime('%Y-%m-%d'), days[run_end].strftime('%Y-%m-%d'), max_days))
+    return windows
+
+
+def _is_final(end_date):
+    return datetime.strptime(end_date, '%Y-%m-%d') <= datetime.now() - timedelta(days=ARCHIVE_DELAY_DAYS)
+
+
+def _fetch_open_meteo_window(session, url, location, start_date, end_date, rate_limiter, stats, cache=None,
+                             resolution='daily'):
+    """Fetch one (location, window) from Open-Meteo, or the response cache, and return its records frame"""
+    payload_key, variables, extra_params, to_records = OPEN_METEO_RESOLUTIONS[resolution]
+    key = cache_key(url, location['lat'], location['lon'], variables, start_date, end_date)
+    cacheable = cache is not None and _is_final(end_date)
+    if cacheable:
+        data = cache.get(key)
+        if data is not None:
+            _count(stats, 'cache_hits')
+            return to_records(location, data)
+
+    params = {
+        'latitude': location['lat'],
+        'longitude': location['lon'],
+        'start_date': start_date,
+        'end_date': end_date,
+        payload_key: variables,
+        'timezone': 'America/Los_Angeles',
+        **extra_params
+    }
+    try:
+        response = get_with_retries(session, url, params=params, rate_limiter=rate_limiter, stats=stats)
+        if response.status_code == 200:
+            data = response.json().get(payload_key, {})
+            if cacheable:
+                cache.put(key, data)
+            return to_records(location, data)
+        print(f"    Error: {location['name']} {start_date}..{end_date} returned HTTP {response.status_code}")
+    except Exception as e:
+        print(f"    Error: {str(e)}")
+    return None
+
+
+def _open_meteo_tasks(locations, date_ranges, max_window_days, existing=None):
+    """List the (location, start, end) windows to request, skipping station-days already in existing"""
+    if existing is not None and not existing.empty:
+        stored = existing.groupby('location', observed=True)['date'].agg(lambda dates: set(dates.astype(str)))
+        return [
+            (location, window_start, window_end)
+            for location in locations
+            for start_date, end_date in date_ranges
+            for window_start, window_end in missing_date_ranges(start_date, end_date,
+                                                                stored.get(location['name'], set()), max_window_days)
+        ]
+    return [
+        (location, window_start, window_end)
+        for location in locations
+        for start_date, end_date in date_ranges
+        for window_start, window_end in split_date_range(start_date, end_date, max_window_days)
     ]
-    
-    weather_data = []
-    
-    for location in locations:
-        print(f"  Processing {location['name']}...")
-        
-        for start_date, end_date in date_ranges:
+
+
+def iter_open_meteo_weather(locations=None, date_ranges=None, base_url=OPEN_METEO_ARCHIVE_URL,
+                            max_workers=8, requests_per_second=5.0, max_window_days=366,
+                            session=None, stats=None, cache=None, existing=None, max_in_flight=None,
+                            resolution='daily'):
+    """Yield one weather frame per (location, window) in request order.
+
+    At most max_in_flight windows (default 2 * max_workers) are requested ahead of the consumer,
+    so a slow consumer holds back the workers instead of letting results pile up in memory.
+    stats is filled in once the generator is exhausted or closed. resolution='hourly' yields
+    weather_hourly frames instead of weather_data ones.
+    """
+    locations = locations if locations is not None else OPEN_METEO_LOCATIONS
+    date_ranges = date_ranges if date_ranges is not None else OPEN_METEO_DATE_RANGES
+    stats = stats if stats is not None else {}
+    stats.update({'requests': 0, 'retries': 0, 'cache_hits': 0, 'records': 0})
+    max_in_flight = max_in_flight or 2 * max_workers
+
+    tasks = _open_meteo_tasks(locations, date_ranges, max_window_days, existing)
+    rate_limiter = TokenBucket(requests_per_second) if requests_per_second else None
+    own_session = session is None
+    session = session if session is not None else create_session(max_workers)
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            task_iter = iter(tasks)
             try:
-                url = "https://archive-api.open-meteo.com/v1/archive"
-                params = {
-                    'latitude': location['lat'],
-                    'longitude': location['lon'],
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'daily': 'temperature_2m_max,relative_humidity_2m,wind_speed_10m_max,wind_direction_10m_dominant,pressure_msl,sunshine_duration',
-                    'timezone': 'America/Los_Angeles'
-                }
-                
-                response = requests.get(url, params=params, timeout=30)
-                if response.status_code == 200:
-                    data = response.json()
-                    daily_data = data.get('daily', {})
-                    
-                    dates = daily_data.get('time', [])
-                    temps = daily_data.get('temperature_2m_max', [])
-                    humidity = daily_data.get('relative_humidity_2m', [])
-                    wind_speed = daily_data.get('wind_speed_10m_max', [])
-                    wind_dir = daily_data.get('wind_direction_10m_dominant', [])
-                    pressure = daily_data.get('pressure_msl', [])
-                    sunshine = daily_data.get('sunshine_duration', [])
-                    
-                    for i, date_str in enumerate(dates):
-                        if i < len(temps) and temps[i] is not None:
-                            temp_f = (temps[i] * 9/5) + 32
-                            hum = humidity[i] if i < len(humidity) and humidity[i] is not None else 50
-                            wind = wind_speed[i] * 2.237 if i < len(wind_speed) and wind_speed[i] is not None else 5
-                            pres = pressure[i] if i < len(pressure) and pressure[i] is not None else 1013
-                            sun = sunshine[i] if i < len(sunshine) and sunshine[i] is not None else 3600
-                            wind_d = wind_dir[i] if i < len(wind_dir) and wind_dir[i] is not None else 0
-                            
-                            risk_score = 0.0
-                            if temp_f > 85: risk_score += 0.3
-                            if temp_f > 95: risk_score += 0.2
-                            if hum < 30: risk_score += 0.25
-                            if hum < 15: risk_score += 0.15
-                            if wind > 15: risk_score += 0.1
-                            if wind > 25: risk_score += 0.15
-                            if sun > 10800: risk_score += 0.05
-                            
-                            weather_record = {
-                                'location': location['name'],
-                                'date': date_str,
-                                'temp_max': round(temp_f, 1),
-                                'humidity': int(hum),
-                                'wind_speed': round(wind, 1),
-                                'wind_deg': int(wind_d),
-                                'pressure': int(pres),
-                                'visibility': 15000,
-                                'uvi': max(0, min(10, (sun / 3600) * 0.8)),
-                                'fire_risk_score': round(min(risk_score, 1.0), 2)
-                            }
-                            weather_data.append(weather_record)
-                
-                time.sleep(0.2)
-                
-            except Exception as e:
-                print(f"    Error: {str(e)}")
-                continue
-    
-    return pd.DataFrame(weather_data)
+                while True:
+                    while len(pending) < max_in_flight:
+                        task = next(task_iter, None)
+                        if task is None:
+                            break
+                        location, window_start, window_end = task
+                        pending.append(executor.submit(_fetch_open_meteo_window, session, base_url, location,
+                                                       window_start, window_end, rate_limiter, stats, cache,
+                                                       resolution))
+                    if not pending:
+                        break
+                    frame = pending.popleft().result()
+                    if frame is not None:
+                        stats['records'] += len(frame)
+                        yield frame
+            finally:
+                # Windows not started yet when the consumer stops early or a window fails are dropped,
+                # so the executor only waits for the requests already in flight
+                for future in pending:
+                    future.cancel()
+    finally:
+        if own_session:
+            session.close()
+        elapsed = time.perf_counter() - start
+        stats.update({
+            'windows': len(tasks),
+            'wall_time_s': round(elapsed, 3),
+            'requests_per_sec': round(stats['requests'] / elapsed, 2) if elapsed > 0 else 0.0
+        })
 
-def collect_noaa_weather():
-    """Collect weather data from NOAA CDO API"""
-    if not NOAA_TOKEN:
-        print("NOAA token not available")
-        return pd.DataFrame()
-    
-    print("Attempting NOAA data collection...")
-    
-    stations = ["GHCND:USW00023272", "GHCND:USC00046646"]
-    weather_data = []
-    
+
+def collect_open_meteo_weather(locations=None, date_ranges=None, base_url=OPEN_METEO_ARCHIVE_URL,
+                               max_workers=8, requests_per_second=5.0, max_window_days=366,
+                               session=None, stats=None, cache=None, existing=None):
+    """Collect weather data from Open-Meteo API (free)
+
+    Requests for every (location, window) run on a thread pool that shares one pooled session
+    and a token-bucket rate limiter. Long date ranges are split into windows of at most
+    max_window_days. Pass a dict as stats to receive request counts, wall time and requests/sec.
+
+    Historical windows are served from cache (a ResponseCache) when present. If existing is a
+    DataFrame of already stored weather rows, only the station-days missing from it are requested
+    and only the new rows are returned.
+    """
+    print("Collecting weather data from Open-Meteo...")
+
+    stats = stats if stats is not None else {}
+    with runMetrics.span('collect_open_meteo') as span:
+        frames = list(iter_open_meteo_weather(locations, date_ranges, base_url, max_workers, requests_per_second,
+                                              max_window_days, session, stats, cache, existing,
+                                              max_in_flight=float('inf')))
+        span.update({key: stats[key] for key in ('windows', 'requests', 'retries', 'cache_hits', 'records')})
+    runMetrics.record_rows('collect_open_meteo', stats['records'])
+
+    print(f"  {stats['requests']} requests ({stats['retries']} retries, {stats['cache_hits']} cache hits) for {stats['windows']} windows "
+          f"in {stats['wall_time_s']}s ({stats['requests_per_sec']} req/s)")
+
+    return tableSchemas.concat(frames, 'weather_data')
+
+def _fetch_noaa_page(session, url, token, station, start_date, end_date, offset, page_limit, rate_limiter, stats):
+    """Fetch one page of GHCND results for a station window; returns (records, total count) or None"""
+    params = {
+        'datasetid': 'GHCND',
+        'stationid': station['ghcnd_id'],
+        'startdate': start_date,
+        'enddate': end_date,
+        'datatypeid': NOAA_DATATYPES,
+        'units': 'standard',
+        'limit': page_limit,
+        'offset': offset
+    }
     try:
-        for station_id in stations:
-            url = "https://www.ncei.noaa.gov/cdo-web/api/v2/data"
-            headers = {'token': NOAA_TOKEN}
-            params = {
-                'datasetid': 'GHCND',
-                'stationid': station_id,
-                'startdate': '2020-09-01',
-                'enddate': '2020-10-31',
-                'datatypeid': 'TMAX,TMIN,PRCP',
-                'limit': 1000
-            }
-            
-            response = requests.get(url, headers=headers, params=params, timeout=30)
-            if response.status_code == 200:
-                data = response.json()
-                print(f"NOAA data received for {station_id}")
-            
+        response = get_with_retries(session, url, params=params, headers={'token': token},
+                                    rate_limiter=rate_limiter, stats=stats)
+        if response.status_code == 200:
+            # CDO answers an empty result set with {}
+            payload = response.json() or {}
+            count = payload.get('metadata', {}).get('resultset', {}).get('count', 0)
+            return payload.get('results', []), count
+        print(f"    Error: NOAA {station['name']} {start_date}..{end_date} offset {offset} returned HTTP {response.status_code}")
     except Exception as e:
-        print(f"NOAA error: {str(e)}")
-    
-    return pd.DataFrame(weather_data)
+        print(f"    NOAA error: {str(e)}")
+    return None
+
+
+def _noaa_station_days(records, locations):
+    """Pivot GHCND records (one per station, day and datatype) into one row per station-day.
+
+    Returns location, date and one float column per NOAA_DATATYPES entry (NaN where a station
+    did not report that element). Records with a quality flag are dropped.
+    """
+    names = [location['name'] for location in locations]
+    frame = pd.DataFrame.from_records(records, columns=['station', 'date', 'datatype', 'attributes', 'value'])
+    station = pd.Index([location['ghcnd_id'] for location in locations]).get_indexer(frame['station'])
+    datatype = pd.Index(NOAA_DATATYPES).get_indexer(frame['datatype'])
+    # attributes is "measurement,quality,source,time"; a non-empty quality flag marks a failed check
+    quality = frame['attributes'].astype('str').str.split(',').str[1].fillna('')
+    value = pd.to_numeric(frame['value'], errors='coerce').to_numpy(np.float64)
+    keep = (station >= 0) & (datatype >= 0) & (quality == '').to_numpy() & ~np.isnan(value)
+
+    days = frame['date'].to_numpy(dtype='datetime64[s]')[keep].astype('datetime64[D]')
+    station, datatype, value = station[keep], datatype[keep], value[keep]
+    # Day numbers are offset from the earliest day so the packed key decodes for pre-1970 dates too
+    day_numbers = days.astype(np.int64)
+    first_day = day_numbers.min() if len(day_numbers) else 0
+    keys = station.astype(np.int64) * 2**32 + (day_numbers - first_day)
+    unique_keys, rows = np.unique(keys, return_inverse=True)
+    grid = np.full((len(unique_keys), len(NOAA_DATATYPES)), np.nan)
+    grid[rows, datatype] = value
+
+    station_codes = (unique_keys // 2**32).astype(np.int32)
+    daily = pd.DataFrame({
+        'location': pd.Categorical.from_codes(station_codes, categories=names),
+        'date': (unique_keys % 2**32 + first_day).astype('datetime64[D]').astype(DATE_DTYPE)
+    })
+    for i, datatype_id in enumerate(NOAA_DATATYPES):
+        daily[datatype_id.lower()] = grid[:, i]
+    return daily
+
+
+def _noaa_weather_rows(daily):
+    """weather_data rows for station-days with any observed element.
+
+    TMAX, TMIN and PRCP go into temp_max, temp_min and precipitation. GHCND has no humidity,
+    wind, pressure or sunshine, so those stay null, and so does fire_risk_score, which needs them.
+    """
+    daily = daily[daily[['tmax', 'tmin', 'prcp']].notna().any(axis=1)]
+    return tableSchemas.to_typed(pd.DataFrame({
+        'location': daily['location'].to_numpy(),
+        'date': daily['date'].to_numpy(),
+        'temp_max': np.round(daily['tmax'].to_numpy(np.float64), 1),
+        'temp_min': np.round(daily['tmin'].to_numpy(np.float64), 1),
+        'precipitation': np.round(daily['prcp'].to_numpy(np.float64), 2),
+        'source': pd.Categorical.from_codes(np.zeros(len(daily), dtype=np.int8), categories=['noaa'])
+    }).reindex(columns=WEATHER_COLUMNS), 'weather_data')
+
+
+def collect_noaa_weather(locations=None, date_ranges=None, base_url=NOAA_CDO_URL, token=None,
+                         max_workers=8, requests_per_second=NOAA_REQUESTS_PER_SECOND, page_limit=NOAA_PAGE_LIMIT,
+                         max_window_days=NOAA_MAX_WINDOW_DAYS, session=None, stats=None):
+    """Collect GHCND daily observations from the NOAA CDO API as weather_data rows
+
+    Only locations with a 'ghcnd_id' are requested. Every (station, window) first page is
+    requested up front; as each arrives its resultset count says how many more offset/limit
+    pages exist, and those are queued straight away. All pages share one thread pool, pooled
+    session and token bucket held to NOAA's per-token rate limit, so wall time follows the total
+    page count divided by the allowed rate instead of each station's pages in sequence.
+    Pass a dict as stats to receive request, page and record counts.
+    """
+    token = token if token is not None else NOAA_TOKEN
+    if not token:
+        print("NOAA token not available")
+        return tableSchemas.empty_frame('weather_data')
+
+    print("Collecting station observations from NOAA CDO...")
+    locations = [location for location in (locations if locations is not None else OPEN_METEO_LOCATIONS)
+                 if location.get('ghcnd_id')]
+    date_ranges = date_ranges if date_ranges is not None else OPEN_METEO_DATE_RANGES
+    stats = stats if stats is not None else {}
+    stats.update({'requests': 0, 'retries': 0, 'pages': 0, 'failed_pages': 0})
+
+    tasks = [(location, window_start, window_end)
+             for location in locations
+             for start_date, end_date in date_ranges
+             for window_start, window_end in split_date_range(start_date, end_date, max_window_days)]
+    rate_limiter = TokenBucket(requests_per_second) if requests_per_second else None
+    own_session = session is None
+    session = session if session is not None else create_session(max_workers)
+
+    records = []
+    start = time.perf_counter()
+    with runMetrics.span('collect_noaa') as span:
+        try:
+            pending = {}
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                def submit(task, offset):
+                    location, window_start, window_end = task
+                    future = executor.submit(_fetch_noaa_page, session, base_url, token, location, window_start,
+                                             window_end, offset, page_limit, rate_limiter, stats)
+                    pending[future] = (task, offset)
+
+                for task in tasks:
+                    submit(task, 1)
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task, offset = pending.pop(future)
+                        page = future.result()
+                        if page is None:
+                            stats['failed_pages'] += 1
+                            continue
+                        results, count = page
+                        stats['pages'] += 1
+                        records.extend(results)
+                        # CDO offsets are 1-based; the first page reveals how many follow
+                        if offset == 1:
+                            for next_offset in range(1 + page_limit, count + 1, page_limit):
+                                submit(task, next_offset)
+        finally:
+            if own_session:
+                session.close()
+        daily = _noaa_station_days(records, locations)
+        weather_df = _noaa_weather_rows(daily)
+        elapsed = time.perf_counter() - start
+        stats.update({
+            'windows': len(tasks),
+            'records': len(records),
+            'station_days': len(weather_df),
+            'wall_time_s': round(elapsed, 3),
+            'requests_per_sec': round(stats['requests'] / elapsed, 2) if elapsed > 0 else 0.0
+        })
+        span.update({key: stats[key] for key in ('windows', 'requests', 'retries', 'pages', 'records')})
+    runMetrics.record_rows('collect_noaa', len(weather_df))
+
+    print(f"  {stats['requests']} requests ({stats['retries']} retries) for {stats['pages']} pages of "
+          f"{len(locations)} stations in {stats['wall_time_s']}s ({stats['requests_per_sec']} req/s), "
+          f"{stats['station_days']} station-days")
+    return weather_df
+
+
+def merge_station_observations(weather_df, noaa_df):
+    """Merge NOAA station rows into Open-Meteo rows by (location, date).
+
+    Where both cover a station-day the Open-Meteo row is kept with the observed temp_max,
+    temp_min and precipitation (and its fire_risk_score recomputed where temp_max was observed);
+    station-days only NOAA covers are appended.
+    """
+    if noaa_df.empty:
+        return weather_df
+    keys = ['location', 'date']
+    observed = noaa_df[keys + ['temp_max', 'temp_min', 'precipitation']].astype({'location': str})
+    matched = (weather_df[keys].astype({'location': str}).reset_index(drop=True).reset_index(names='row')
+               .merge(observed, on=keys, how='inner'))
+    merged = tableSchemas.to_typed(weather_df.reset_index(drop=True).reindex(columns=WEATHER_COLUMNS),
+                                   'weather_data')
+    if len(matched):
+        rows = matched['row'].to_numpy()
+        merged.loc[rows, 'temp_min'] = matched['temp_min'].to_numpy(np.float32)
+        merged.loc[rows, 'precipitation'] = matched['precipitation'].to_numpy(np.float32)
+        has_temp = matched['temp_max'].notna().to_numpy()
+        rows = rows[has_temp]
+        temp_f = matched['temp_max'].to_numpy(np.float64)[has_temp]
+        merged.loc[rows, 'temp_max'] = temp_f.astype(np.float32)
+        merged.loc[rows, 'fire_risk_score'] = risk_scores(
+            temp_f, merged['humidity'].to_numpy(np.float64)[rows], merged['wind_speed'].to_numpy(np.float64)[rows],
+            merged['sunshine'].to_numpy(np.float64)[rows], version='open_meteo_v1').astype(np.float32)
+    only_noaa = ~noaa_df[keys].astype({'location': str}).reset_index(drop=True).merge(
+        weather_df[keys].astype({'location': str}).drop_duplicates(), on=keys, how='left', indicator=True
+    )['_merge'].eq('both').to_numpy()
+    return tableSchemas.concat([merged, noaa_df.reset_index(drop=True)[only_noaa]], 'weather_data')
+
 
 def collect_real_fire_data():
     """Collect real Napa County fire data"""
@@ -254,24 +689,155 @@ def collect_real_fire_data():
         }
     ]
     
-    return pd.DataFrame(fire_data)
+    return tableSchemas.to_typed(pd.DataFrame(fire_data), 'fire_history')
 
-def collect_all_real_data():
-    """Main function to collect all real data"""
-    weather_df = collect_open_meteo_weather()
-    
-    if len(weather_df) < 50:
-        noaa_df = collect_noaa_weather()
-        weather_df = pd.concat([weather_df, noaa_df], ignore_index=True)
+def _stored_observations(store_root, locations, columns=None):
+    """Stored weather_data rows collected from the daily archive (simulated rows do not count)"""
+    names = [location['name'] for location in locations]
+    with runMetrics.span('read_store', root=store_root):
+        stored = read_weather(store_root, locations=names,
+                              columns=None if columns is None else list(dict.fromkeys(columns + ['source'])))
+    stored = stored[stored['source'].astype(str) == OPEN_METEO_SOURCE].reset_index(drop=True)
+    return stored if columns is None else stored[columns]
+
+
+def collect_all_real_data(incremental=False, store_root=STORE_ROOT, cache=None, locations=None):
+    """Main function to collect all real data
+
+    locations defaults to every station in the registry (see stationRegistry). Archive
+    responses are cached on disk, so re-running a backfill costs no network calls for windows
+    already downloaded. With incremental=True, the station-days already collected into the
+    local Parquet store are reused, only the missing ones are fetched, and the new rows are
+    written to the store. Stored simulated rows are not counted as collected.
+    """
+    cache = cache if cache is not None else ResponseCache()
+
+    if incremental:
+        stored_df = _stored_observations(store_root, locations if locations is not None else OPEN_METEO_LOCATIONS)
+        new_df = collect_open_meteo_weather(locations=locations, cache=cache, existing=stored_df)
+        weather_df = tableSchemas.concat([stored_df, new_df], 'weather_data')
+        with runMetrics.span('write_store', root=store_root, rows=len(new_df)):
+            written = write_table(new_df, 'weather_data', store_root)
+        print(f"  Reused {len(stored_df)} stored records, fetched {len(new_df)} new records ({written} written to {store_root})")
+    else:
+        weather_df = collect_open_meteo_weather(locations=locations, cache=cache)
     
+    # Station observations where a token is configured; without one this is a no-op
+    noaa_df = collect_noaa_weather(locations=locations)
+    weather_df = merge_station_observations(weather_df, noaa_df)
+
     fire_df = collect_real_fire_data()
     
     return weather_df, fire_df
 
-if __name__ == "__main__":
+def iter_real_weather(locations=None, incremental=False, store_root=STORE_ROOT, cache=None, stats=None, **options):
+    """Yield Open-Meteo weather frames one (location, window) at a time, with NOAA observations merged in.
+
+    With incremental=True only the station-days not yet collected into the local store are
+    requested (stored simulated rows do not count); stats['stored'] counts the ones already there. NOAA observations (only fetched with a token)
+    are collected first and merged into the window of each frame, so the frames can be streamed
+    straight into the store. options are passed on to iter_open_meteo_weather.
+    """
+    locations = locations if locations is not None else OPEN_METEO_LOCATIONS
+    stats = stats if stats is not None else {}
+    existing = None
+    if incremental:
+        existing = _stored_observations(store_root, locations, columns=['location', 'date'])
+    stats['stored'] = 0 if existing is None else len(existing)
+
+    noaa_df = collect_noaa_weather(locations=locations)
+    noaa_by_location = {str(name): rows for name, rows in noaa_df.groupby('location', observed=True)}
+    print("Streaming weather data from Open-Meteo...")
+    for frame in iter_open_meteo_weather(locations, cache=cache if cache is not None else ResponseCache(),
+                                         existing=existing, stats=stats, **options):
+        observed = noaa_by_location.get(str(frame['location'].iloc[0])) if len(frame) else None
+        if observed is not None:
+            in_window = observed['date'].between(frame['date'].min(), frame['date'].max())
+            frame = merge_station_observations(frame, observed[in_window])
+        yield frame
+
+
+def _ghcnd_locations(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{'name': f"Station_{i:05d}", 'lat': round(float(lat), 4), 'lon': round(float(lon), 4),
+             'ghcnd_id': f"GHCND:USC{i:08d}"}
+            for i, (lat, lon) in enumerate(zip(rng.uniform(32.5, 42.0, count), rng.uniform(-124.4, -114.1, count)))]
+
+
+def check_noaa(station_counts=(4, 16, 64), latency=0.05):
+    """Check the NOAA collector against a local CDO stub: pivot, paging, recorded replay, merge and scaling"""
+    import tempfile
+    from devStubs import ReplayResponder, StubServer, _stub_ghcnd_records, noaa_cdo_responder
+    locations = [location for location in OPEN_METEO_LOCATIONS if location.get('ghcnd_id')]
+    date_ranges = OPEN_METEO_DATE_RANGES[:3]
+    options = dict(date_ranges=date_ranges, token='stub', requests_per_second=None)
+    ok = True
+
+    records = [record for location in locations for start_date, end_date in date_ranges
+               for record in _stub_ghcnd_records(location['ghcnd_id'], start_date, end_date, NOAA_DATATYPES)]
+    frame = pd.DataFrame(records)
+    frame = frame[frame['attributes'].str.split(',').str[1] == '']
+    expected = frame.pivot_table(index=['station', 'date'], columns='datatype', values='value', aggfunc='first')
+    daily = _noaa_station_days(records, locations)
+    pivot_ok = len(daily) == len(expected) and np.allclose(
+        np.sort(daily['tmax'].dropna().to_numpy()), np.sort(expected['TMAX'].dropna().to_numpy()))
+    print(f"  pivot: {len(records)} records -> {len(daily)} station-days, matches pivot_table: {pivot_ok}")
+    ok &= pivot_ok
+
+    with tempfile.TemporaryDirectory() as tmp:
+        recording = ReplayResponder(os.path.join(tmp, 'noaa.jsonl'), fallback=noaa_cdo_responder)
+        with StubServer(recording) as stub:
+            paged = collect_noaa_weather(locations, base_url=stub.url, page_limit=25, **options)
+        recording.save()
+        with StubServer(noaa_cdo_responder) as stub:
+            whole = collect_noaa_weather(locations, base_url=stub.url, **options)
+        replay = ReplayResponder(recording.path)
+        with StubServer(replay) as stub:
+            replayed = collect_noaa_weather(locations, base_url=stub.url, page_limit=25, **options)
+    paging_ok = paged.equals(whole)
+    replay_ok = replayed.equals(paged) and replay.misses == 0
+    print(f"  25-row pages == 1000-row pages: {paging_ok}; replayed recording == live: {replay_ok} "
+          f"({len(replay.responses)} recorded responses, {replay.misses} misses)")
+    ok &= paging_ok and replay_ok
+
+    from devStubs import open_meteo_responder
+    with StubServer(open_meteo_responder) as stub:
+        open_meteo = collect_open_meteo_weather(locations, date_ranges[:2], base_url=stub.url, requests_per_second=None)
+    merged = merge_station_observations(open_meteo, whole)
+    union = pd.concat([open_meteo[['location', 'date']], whole[['location', 'date']]]).astype({'location': str})
+    merge_ok = len(merged) == len(union.drop_duplicates()) and not merged.duplicated(['location', 'date']).any()
+    print(f"  merge: {len(open_meteo)} Open-Meteo + {len(whole)} NOAA rows -> {len(merged)} station-days: {merge_ok}")
+    ok &= merge_ok
+
+    print(f"  scaling with {latency * 1000:.0f} ms stub latency, 1000-row pages, one year per station:")
+    for count in station_counts:
+        stats = {}
+        with StubServer(noaa_cdo_responder, latency=latency) as stub:
+            collect_noaa_weather(_ghcnd_locations(count), [('2023-01-01', '2023-12-31')], base_url=stub.url,
+                                 token='stub', requests_per_second=None, max_workers=16, stats=stats)
+        print(f"    {count:>4} stations: {stats['pages']} pages in {stats['wall_time_s']:.2f}s "
+              f"(one page at a time: {stats['pages'] * latency:.2f}s), {stats['station_days']} station-days")
+    return ok
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Collect real weather and fire data")
+    parser.add_argument('--check-noaa', action='store_true', help="check the NOAA collector against a local stub")
+    args = parser.parse_args(argv)
+
+    if args.check_noaa:
+        print("Checking the NOAA collector against a local CDO stub...")
+        return 0 if check_noaa() else 1
+
     weather_data, fire_data = collect_all_real_data()
     print(f"Collected {len(weather_data)} weather records")
     print(f"Collected {len(fire_data)} fire records")
-    
+
     weather_data.to_csv('/data/real_weather_data.csv', index=False)
-    fire_data.to_csv('/data/real_fire_data.csv', index=False)
\ No newline at end of file
+    fire_data.to_csv('/data/real_fire_data.csv', index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
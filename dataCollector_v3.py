@@ -1,68 +1,112 @@
 import os
 import pandas as pd
-from google.cloud import bigquery
-from datetime import datetime
 import sys
-from collectRealData import collect_all_real_data
-from generateSimulatedData import generate_all_simulated_data
+from collectRealData import collect_real_fire_data, iter_real_weather
+from generateSimulatedData import generate_fire_data, iter_weather_data
+from ingestPipeline import BigQueryLoadSink, ManifestDelta, RollingKeyDeduper, StoreSink, run_pipeline, score_missing
+from localStore import STORE_ROOT, iter_table, read_fire_history, read_weather, write_table
+from stationRegistry import STATIONS_PATH, load_registry
+from uploadManifest import UPSERT_KEYS, load_manifest, merge_sql, plan_delta, save_manifest
+import argparse
+import pyarrow as pa
+import pyarrow.parquet as pq
 import glob
-import pandas_gbq
+import io
+from concurrent.futures import ThreadPoolExecutor
+import runMetrics
+import tableSchemas
 
-PROJECT_ID = os.environ["PROJECT_ID"]
-DATASET_ID = 'napa_wildfire_demo'
+# google-cloud-bigquery and pandas_gbq take ~1s to import, so they are only imported by the
+# stages that talk to BigQuery, and the client is built on first use
+PROJECT_ID = os.environ.get("PROJECT_ID", "")
+DATASET_ID = os.environ.get("DATASET_ID", 'napa_wildfire_demo')
 
-client = bigquery.Client(project=PROJECT_ID)
+_clients = {}
 
 
+def get_bq_client(project_id=None):
+    """Return the shared BigQuery client for a project, creating it on first use"""
+    project_id = project_id or PROJECT_ID
+    if not project_id:
+        raise ValueError("No project set: pass --project or export PROJECT_ID")
+    if project_id not in _clients:
+        from google.cloud import bigquery
+        _clients[project_id] = bigquery.Client(project=project_id)
+    return _clients[project_id]
 
-def load_fire_history(project_id: str, dataset_id: str, table_id: str = "fire_history"):
-    client = bigquery.Client(project=project_id)
+
+FIRE_HISTORY_KEY = ['fire_name', 'fire_year', 'alarm_date']
+
+
+def read_fire_snapshots(csv_files, include_store=True, max_workers=8):
+    """Read fire history snapshots in parallel and keep one row per MERGE key.
+
+    Files are applied in name (timestamp) order and the local store after them: collection
+    runs only write to the store now, so it holds the newest row for a fire and wins over
+    the older CSV snapshots.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(pd.read_csv, sorted(csv_files)))
+    if include_store:
+        frames.append(read_fire_history())
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return tableSchemas.empty_frame('fire_history')
+
+    fire_df = tableSchemas.concat([frame[tableSchemas.columns('fire_history')] for frame in frames], 'fire_history')
+    return fire_df.drop_duplicates(subset=FIRE_HISTORY_KEY, keep='last').reset_index(drop=True)
+
+
+def _parquet_payload(df, table_name='fire_history'):
+    """Serialise a frame as one zstd-compressed Parquet file in memory, with DATE columns as date32"""
+    buffer = io.BytesIO()
+    table = pa.Table.from_pandas(tableSchemas.for_bigquery(df, table_name),
+                                 schema=tableSchemas.arrow_schema(table_name, wide_floats=True), preserve_index=False)
+    pq.write_table(table, buffer, compression='zstd')
+    buffer.seek(0)
+    return buffer
+
+
+@runMetrics.traced('load_fire_history')
+def load_fire_history(project_id: str, dataset_id: str, table_id: str = "fire_history", client=None,
+                      csv_pattern: str = "./data/fire_history*.csv", include_store: bool = True):
+    from google.cloud import bigquery
+    client = client or get_bq_client(project_id)
 
     staging_table_id = f"{project_id}.{dataset_id}.{table_id}_staging"
     final_table_id = f"{project_id}.{dataset_id}.{table_id}"
 
-    # Step 1: Collect CSVs
-    csv_files = glob.glob("./data/fire_history*.csv")
-    if not csv_files:
-        print(" No CSV files found in ./data/")
+    # Step 1: Collect CSVs and dedupe locally on the MERGE key
+    csv_files = glob.glob(csv_pattern)
+    with runMetrics.span('read_fire_snapshots', files=len(csv_files)) as span:
+        fire_df = read_fire_snapshots(csv_files, include_store=include_store)
+        span['rows'] = len(fire_df)
+    if fire_df.empty:
+        print(" No fire history found in ./data/")
         return
 
-    print(f"Found {len(csv_files)} CSV files. Loading into staging table...")
+    print(f"Found {len(csv_files)} CSV files with {len(fire_df)} unique fires. Loading into staging table...")
 
-    # Step 2: Load into staging table
+    # Step 2: Load everything into the staging table with a single Parquet load job
     job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.CSV,
-        skip_leading_rows=1,
-        autodetect=True,
+        source_format=bigquery.SourceFormat.PARQUET,
+        schema=tableSchemas.bigquery_schema('fire_history'),
         write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,  # overwrite staging
     )
-
-    with open(csv_files[0], "rb") as f:  # load all files together
-        load_job = client.load_table_from_file(f, staging_table_id, job_config=job_config)
-    for csv_file in csv_files[1:]:
-        with open(csv_file, "rb") as f:
-            load_job = client.load_table_from_file(f, staging_table_id, job_config=job_config)
-
-    load_job.result()  # wait for completion
-    print(f" Loaded {len(csv_files)} CSV files into staging table {staging_table_id}")
+    payload = _parquet_payload(fire_df)
+    runMetrics.record_rows('load_fire_history', len(fire_df), payload.getbuffer().nbytes)
+    with runMetrics.span('bigquery_load', table=staging_table_id, rows=len(fire_df)):
+        load_job = client.load_table_from_file(payload, staging_table_id, job_config=job_config)
+        load_job.result()  # wait for completion
+    runMetrics.record_job(load_job, 'load_fire_history')
+    print(f" Loaded {len(fire_df)} rows into staging table {staging_table_id} (job {load_job.job_id})")
 
     # Step 3: Ensure final table exists
-    schema = [
-        bigquery.SchemaField("fire_name", "STRING"),
-        bigquery.SchemaField("fire_year", "INT64"),
-        bigquery.SchemaField("alarm_date", "DATE"),
-        bigquery.SchemaField("contained_date", "DATE"),
-        bigquery.SchemaField("acres", "FLOAT64"),
-        bigquery.SchemaField("cause", "STRING"),
-        bigquery.SchemaField("latitude", "FLOAT64"),
-        bigquery.SchemaField("longitude", "FLOAT64"),
-        bigquery.SchemaField("county", "STRING"),
-    ]
     try:
         client.get_table(final_table_id)
         print(f"Final table {final_table_id} already exists.")
     except Exception:
-        table = bigquery.Table(final_table_id, schema=schema)
+        table = bigquery.Table(final_table_id, schema=tableSchemas.bigquery_schema('fire_history'))
         client.create_table(table)
         print(f"Created final table {final_table_id}")
 
@@ -84,8 +128,10 @@ def load_fire_history(project_id: str, dataset_id: str, table_id: str = "fire_hi
     WHEN NOT MATCHED THEN
       INSERT ROW
     """
-    query_job = client.query(merge_query)
-    query_job.result()
+    with runMetrics.span('bigquery_merge', table=final_table_id):
+        query_job = client.query(merge_query)
+        query_job.result()
+    runMetrics.record_job(query_job, 'load_fire_history')
     print(f" Merged staging data into {final_table_id}")
 
     # Step 5: Drop staging table
@@ -96,35 +142,99 @@ def load_fire_history(project_id: str, dataset_id: str, table_id: str = "fire_hi
 
 
 
-def upload_to_bigquery(df, table_name):
-    """Upload DataFrame to BigQuery with proper schema handling"""
+def _checked_manifest(table_name, table_id, bq_client):
+    """Return (manifest, table_exists); the manifest is emptied if it no longer matches the table"""
+    manifest = load_manifest(table_id)
+    try:
+        table = bq_client.get_table(table_id)
+        table_exists = True
+    except Exception:
+        table, table_exists = None, False
+    # A table recreated or truncated outside this workflow invalidates the manifest
+    if len(manifest) and (not table_exists or table.num_rows != len(manifest)):
+        print(f"  Manifest for {table_name} does not match the table, re-uploading all rows")
+        manifest = manifest.iloc[0:0]
+    return manifest, table_exists
+
+
+def _upsert_to_bigquery(df, table_name, table_id, bq_client, dry_run=False):
+    """Upload only new or changed rows to a staging table and MERGE them into table_id"""
+    keys = UPSERT_KEYS[table_name]
+    manifest, table_exists = _checked_manifest(table_name, table_id, bq_client)
+
+    delta_df, report, updated_manifest = plan_delta(df, table_name, manifest)
+    print(f"  {table_name}: {report['insert']} to insert, {report['update']} to update, {report['skip']} unchanged")
+    if dry_run or delta_df.empty:
+        return report
+
+    from google.cloud import bigquery
+    staging_table_id = f"{table_id}_staging"
+    job_config = bigquery.LoadJobConfig(schema=tableSchemas.bigquery_schema(table_name),
+                                        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+    stage = f"upload_{table_name}"
+    runMetrics.record_rows(stage, len(delta_df), int(delta_df.memory_usage(deep=True).sum()))
+    if not table_exists:
+        with runMetrics.span('bigquery_load', table=table_id, rows=len(delta_df)):
+            job = bq_client.load_table_from_dataframe(delta_df, table_id, job_config=job_config).result()
+        runMetrics.record_job(job, stage)
+    else:
+        tableSchemas.add_missing_bigquery_fields(bq_client, bq_client.get_table(table_id), table_name)
+        with runMetrics.span('bigquery_load', table=staging_table_id, rows=len(delta_df)):
+            job = bq_client.load_table_from_dataframe(delta_df, staging_table_id, job_config=job_config).result()
+        runMetrics.record_job(job, stage)
+        with runMetrics.span('bigquery_merge', table=table_id):
+            job = bq_client.query(merge_sql(table_id, staging_table_id, list(delta_df.columns), keys)).result()
+        runMetrics.record_job(job, stage)
+        bq_client.delete_table(staging_table_id, not_found_ok=True)
+
+    save_manifest(updated_manifest, table_id)
+    return report
+
+
+def upload_to_bigquery(df, table_name, mode='replace', dry_run=False, bq_client=None, project_id=None,
+                       dataset_id=None):
+    """Upload DataFrame to BigQuery with proper schema handling
+
+    mode='replace' rewrites the whole table. mode='incremental' keeps a local manifest of
+    row hashes per key and uploads only new or changed rows, MERGEd in through a staging
+    table. With dry_run=True the incremental plan is reported without uploading anything.
+    """
     if df.empty:
         print(f"No data to upload to {table_name}")
         return False
     
-    df_copy = df.copy()
-    
-    if table_name == 'weather_data':
-        df_copy['date'] = pd.to_datetime(df_copy['date']).dt.date
-    elif table_name == 'fire_history':
-        df_copy['alarm_date'] = pd.to_datetime(df_copy['alarm_date']).dt.date
-        df_copy['contained_date'] = pd.to_datetime(df_copy['contained_date']).dt.date
+    # The load job converts datetime64 dates to DATE; float32 columns are widened decimally
+    df_copy = tableSchemas.for_bigquery(df, table_name)
     
-    table_id = f"{PROJECT_ID}.{DATASET_ID}.{table_name}"
+    project_id = project_id or PROJECT_ID
+    dataset_id = dataset_id or DATASET_ID
+    table_id = f"{project_id}.{dataset_id}.{table_name}"
     
     try:
-        print(f"Uploading {len(df_copy)} records to {table_name}...")
-        
-        pandas_gbq.to_gbq(
-            df_copy,
-            destination_table=f"{DATASET_ID}.{table_name}",
-            project_id=PROJECT_ID,
-            if_exists='replace',
-            table_schema=None,
-            progress_bar=False
-        )
+        bq_client = bq_client or get_bq_client(project_id)
+        if mode == 'incremental':
+            print(f"{'Planning' if dry_run else 'Uploading'} incremental changes for {table_name}...")
+            with runMetrics.span(f"upload_{table_name}", mode=mode, rows=len(df_copy)):
+                _upsert_to_bigquery(df_copy, table_name, table_id, bq_client, dry_run)
+            if dry_run:
+                return True
+        else:
+            print(f"Uploading {len(df_copy)} records to {table_name}...")
+
+            import pandas_gbq
+            with runMetrics.span(f"upload_{table_name}", mode=mode, rows=len(df_copy)):
+                pandas_gbq.to_gbq(
+                    df_copy,
+                    destination_table=f"{dataset_id}.{table_name}",
+                    project_id=project_id,
+                    if_exists='replace',
+                    table_schema=[{'name': field.name, 'type': field.field_type}
+                                  for field in tableSchemas.bigquery_schema(table_name)],
+                    progress_bar=False
+                )
+            runMetrics.record_rows(f"upload_{table_name}", len(df_copy), int(df_copy.memory_usage(deep=True).sum()))
         
-        table = client.get_table(table_id)
+        table = bq_client.get_table(table_id)
         print(f"Success: {table.num_rows} rows in {table_name}")
         return True
         
@@ -134,87 +244,244 @@ def upload_to_bigquery(df, table_name):
     
 
 
-def main():
-    """Main data collection workflow"""
-    print("Napa Valley Wildfire Data Collection")
-    print("=" * 40)
+def _stations(args):
+    """The registry stations selected by --stations-file and --region"""
+    registry = load_registry(args.stations_file)
+    registry = registry.select(args.region) if args.region else registry
+    print(f"  {len(registry)} stations from {args.stations_file}" + (f" in {args.region}" if args.region else ""))
+    return registry
 
-    if PROJECT_ID == '':
-        print("ERROR: Set PROJECT_ID")
-        return 1
 
+# Simulated weather records per run, drawn across the 2017-2024 span
+SIMULATED_WEATHER_RECORDS = 500
+
+
+def _ingest_weather(sources):
+    """Stream weather frames through key dedupe and scoring into the local store.
+
+    sources is a list of (name, iterable of frames) for run_pipeline, so memory stays bounded by
+    a few batches however many rows the sources yield.
+    """
+    with runMetrics.span('store_write') as span:
+        report = run_pipeline(sources, stages=[RollingKeyDeduper(), score_missing], sinks=[StoreSink('weather_data')])
+        span['rows'] = report['sinks'][0]['new_rows']
+    runMetrics.record_rows('ingest_weather', report['rows'])
+    print(f"  Streamed {report['rows']} weather records in {report['wall_time_s']}s, "
+          f"{report['sinks'][0]['new_rows']} new or changed rows stored in {STORE_ROOT} (peak RSS {report['peak_rss_mb']} MB)")
+    return report
+
+
+def _store_fires(fire_df):
+    with runMetrics.span('store_write', table='fire_history') as span:
+        span['rows'] = stored = write_table(fire_df, 'fire_history')
+    print(f"  Stored {stored} new fire rows in {STORE_ROOT}")
+
+
+def _without_keys(frame, keys):
+    """Rows of frame whose (location, date) is not in keys"""
+    columns = ['location', 'date']
+    found = frame[columns].astype({'location': str}).merge(
+        keys[columns].astype({'location': str}).drop_duplicates(), on=columns, how='left', indicator=True
+    )['_merge'].eq('both').to_numpy()
+    return frame[~found]
+
+
+def _simulate(registry=None, skip=None):
+    """Stream simulated weather into the store and store simulated fires; rows keyed in skip are left out"""
+    print(f"Generating {SIMULATED_WEATHER_RECORDS} simulated weather records...")
+    names = registry.names() if registry is not None else None
+    frames = iter_weather_data(locations=names, num_records=SIMULATED_WEATHER_RECORDS, random_steps=True)
+    if skip is not None and len(skip):
+        frames = (_without_keys(frame, skip) for frame in frames)
+    with runMetrics.span('simulate'):
+        _ingest_weather([('simulated', frames)])
+        _store_fires(generate_fire_data(25))
+
+
+def _collect(incremental=False, registry=None):
+    """Stream real weather into the store, topped up with simulated data when the APIs return too little"""
+    locations = registry.locations() if registry is not None else None
+    stats = {}
+    with runMetrics.span('collect'):
+        report = _ingest_weather([('real', iter_real_weather(locations, incremental=incremental, stats=stats))])
+        _store_fires(collect_real_fire_data())
+    if report['rows'] + stats['stored'] < 100:
+        print(" Insufficient real data, adding simulated data...")
+        # Fewer than 100 rows are stored for these stations; simulated rows never replace them
+        names = [location['name'] for location in locations] if locations is not None else None
+        _simulate(registry, skip=read_weather(locations=names, columns=['location', 'date']))
+
+
+def _stream_upload(table_name, mode='incremental', dry_run=False, bq_client=None):
+    """Stream a stored table to BigQuery in load-job chunks.
+
+    mode='replace' rewrites the table. mode='incremental' sends only the rows the upload manifest
+    does not hold unchanged, MERGEd in through a staging table. With dry_run=True the incremental
+    plan is reported without uploading anything.
+    """
+    table_id = f"{PROJECT_ID}.{DATASET_ID}.{table_name}"
     try:
-        print("Select mode:")
-        print("1. Use real APIs (OpenWeather + NOAA) - You need to enter API Keys - Account can be created for free")
-        print("2. Use simulated data + upload already created CSV files from real data")
-        choice = input("Enter 1 or 2: ").strip()
-
-        if choice == "1":
-            # Prompt for API keys
-            openweather_api_key = input("Enter your OPENWEATHER_API_KEY: ").strip()
-            noaa_token = input("Enter your NOAA_TOKEN: ").strip()
-
-            if not openweather_api_key or not noaa_token:
-                print(" Both API keys are required in mode 1. Exiting.")
-                return 1
-
-            os.environ["OPENWEATHER_API_KEY"] = openweather_api_key
-            os.environ["NOAA_TOKEN"] = noaa_token
-
-            print("1. Attempting real data collection...")
-            weather_df, fire_df = collect_all_real_data()
-
-            if len(weather_df) < 100:
-                print("2. Insufficient real data, generating simulated data...")
-                sim_weather, sim_fire = generate_all_simulated_data()
-                weather_df = pd.concat([weather_df, sim_weather], ignore_index=True)
-                fire_df = pd.concat([fire_df, sim_fire], ignore_index=True)
-
-        elif choice == "2":
-            print(" Running in simulated mode...")
-            weather_df, fire_df = generate_all_simulated_data()
-
-            # Upload existing fire history CSVs
-            try:
-                load_fire_history(PROJECT_ID, DATASET_ID)
-            except Exception as e:
-                print(f" Could not run fire history loader: {e}")
+        bq_client = bq_client or get_bq_client()
+        print(f"{'Planning' if dry_run else 'Uploading'} {mode} changes for {table_name} from {STORE_ROOT}...")
+        stages, sinks = [], []
+        if mode == 'incremental':
+            manifest, _ = _checked_manifest(table_name, table_id, bq_client)
+            delta = ManifestDelta(table_name, manifest)
+            stages.append(delta)
+        if not dry_run:
+            sinks.append(BigQueryLoadSink(bq_client, table_id, table_name, replace=mode == 'replace'))
+        with runMetrics.span(f"upload_{table_name}", mode=mode) as span:
+            report = run_pipeline([(table_name, iter_table(table_name))], stages, sinks)
+            span['rows'] = report['rows']
+        if not report['stages'][0]['rows']:
+            print(f"No data to upload to {table_name}")
+            return False
+        if mode == 'incremental':
+            print(f"  {table_name}: {delta.report['insert']} to insert, {delta.report['update']} to update, "
+                  f"{delta.report['skip']} unchanged")
+        if dry_run:
+            return True
+        runMetrics.record_rows(f"upload_{table_name}", report['rows'])
+        if mode == 'incremental':
+            save_manifest(delta.manifest(), table_id)
+
+        table = bq_client.get_table(table_id)
+        print(f"Success: {table.num_rows} rows in {table_name} (peak RSS {report['peak_rss_mb']} MB)")
+        return True
 
-        else:
-            print(" Invalid choice. Exiting.")
-            return 1
+    except Exception as e:
+        print(f"Upload failed for {table_name}: {str(e)}")
+        return False
 
-        weather_df = weather_df.drop_duplicates(subset=['location', 'date']).sort_values(['date', 'location'])
 
-        print(f"Final dataset: {len(weather_df)} weather records, {len(fire_df)} fire records")
+def _upload(table_names, mode, dry_run=False):
+    results = {table_name: _stream_upload(table_name, mode=mode, dry_run=dry_run) for table_name in table_names}
+    for table_name, success in results.items():
+        print(f"{table_name}: {'SUCCESS' if success else 'FAILED'}")
+    return 0 if all(results.values()) else 1
 
-        print("3. Uploading to BigQuery...")
-        weather_success = upload_to_bigquery(weather_df, 'weather_data')
-        fire_success = upload_to_bigquery(fire_df, 'fire_history')
 
-        print("4. Creating local backups...")
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        weather_df.to_csv(f'./data/weather_data_{timestamp}.csv', index=False)
-        fire_df.to_csv(f'./data/fire_history_{timestamp}.csv', index=False)
+def cmd_simulate(args):
+    """Generate simulated data into the local store (no cloud access)"""
+    _simulate(_stations(args))
+    return 0
 
-        print("=" * 40)
-        print(f"Weather data: {'SUCCESS' if weather_success else 'FAILED'}")
-        print(f"Fire data: {'SUCCESS' if fire_success else 'FAILED'}")
 
-        if weather_success and fire_success:
-            print("Data collection completed successfully")
-            print("\nNext steps:")
-            print("1. Test multimodal queries in BigQuery console")
-            print("2. Launch Jupyter notebook for analysis")
-            return 0
-        else:
-            print("Some uploads failed")
-            return 1
+def cmd_collect(args):
+    """Collect real weather and fire data into the local store (no cloud access)"""
+    if args.hourly:
+        from hourlyWeather import ingest_hourly
+        ingest_hourly(_stations(args).locations(), incremental=args.incremental, keep_years=args.keep_years)
+        _store_fires(collect_real_fire_data())
+        return 0
+    _collect(args.incremental, _stations(args))
+    return 0
+
+
+def cmd_load(args):
+    """Load the fire history CSV snapshots into BigQuery"""
+    load_fire_history(PROJECT_ID, DATASET_ID, csv_pattern=args.csv_pattern)
+    return 0
+
+
+def cmd_upload(args):
+    """Upload the local store's tables to BigQuery"""
+    return _upload(args.tables, args.mode, args.dry_run)
 
+
+def cmd_all(args):
+    """The full workflow: collect or simulate into the local store, then upload the store to BigQuery"""
+    if args.source == 'real':
+        print("1. Attempting real data collection...")
+        _collect(args.incremental, _stations(args))
+    else:
+        print(" Running in simulated mode...")
+        _simulate(_stations(args))
+        # Upload existing fire history CSVs
+        try:
+            load_fire_history(PROJECT_ID, DATASET_ID)
+        except Exception as e:
+            print(f" Could not run fire history loader: {e}")
+
+    print("2. Uploading the local store to BigQuery...")
+    status = _upload(['weather_data', 'fire_history'], args.mode)
+
+    print("=" * 40)
+    if status == 0:
+        print("Data collection completed successfully")
+        print("\nNext steps:")
+        print("1. Test multimodal queries in BigQuery console")
+        print("2. Launch Jupyter notebook for analysis")
+    else:
+        print("Some uploads failed")
+    return status
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--project', default=PROJECT_ID, help="GCP project (default: $PROJECT_ID)")
+    common.add_argument('--dataset', default=DATASET_ID, help="BigQuery dataset (default: $DATASET_ID or %(default)s)")
+    common.add_argument('--report', help="Path of the JSON run report (default: ./data/runs/run_<id>.json)")
+    common.add_argument('--metrics-file', help="Also write run metrics in Prometheus text format")
+    common.add_argument('--profile', choices=['cprofile', 'sample'], help="Profile the run")
+    common.add_argument('--stations-file', default=STATIONS_PATH, help="Station registry CSV (default: %(default)s)")
+    common.add_argument('--region', help="Only use registry stations in this region or county")
+
+    parser = argparse.ArgumentParser(description="Napa Valley Wildfire Data Collection")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('simulate', parents=[common], help=cmd_simulate.__doc__).set_defaults(func=cmd_simulate)
+
+    collect = commands.add_parser('collect', parents=[common], help=cmd_collect.__doc__)
+    collect.add_argument('--incremental', action='store_true', help="Fetch only station-days not collected yet")
+    collect.add_argument('--hourly', action='store_true',
+                         help="Collect hourly observations; daily rows and fire-weather rollups are derived from them")
+    collect.add_argument('--keep-years', type=int, help="With --hourly, keep only this many years of hourly rows")
+    collect.set_defaults(func=cmd_collect)
+
+    load = commands.add_parser('load', parents=[common], help=cmd_load.__doc__)
+    load.add_argument('--csv-pattern', default="./data/fire_history*.csv")
+    load.set_defaults(func=cmd_load, cloud=True)
+
+    upload = commands.add_parser('upload', parents=[common], help=cmd_upload.__doc__)
+    upload.add_argument('--tables', nargs='+', default=['weather_data', 'fire_history'],
+                        choices=['weather_data', 'fire_history'])
+    upload.add_argument('--mode', choices=['incremental', 'replace'], default='incremental')
+    upload.add_argument('--dry-run', action='store_true', help="Report the incremental plan without uploading")
+    upload.set_defaults(func=cmd_upload, cloud=True)
+
+    run_all = commands.add_parser('all', parents=[common], help=cmd_all.__doc__)
+    run_all.add_argument('--source', choices=['real', 'simulated'], default='simulated')
+    run_all.add_argument('--incremental', action='store_true')
+    run_all.add_argument('--mode', choices=['incremental', 'replace'], default='incremental')
+    run_all.set_defaults(func=cmd_all, cloud=True)
+    return parser
+
+
+def main(argv=None):
+    """Main data collection workflow"""
+    global PROJECT_ID, DATASET_ID
+    args = build_parser().parse_args(argv)
+    PROJECT_ID, DATASET_ID = args.project, args.dataset
+
+    print("Napa Valley Wildfire Data Collection")
+    print("=" * 40)
+    if getattr(args, 'cloud', False) and not PROJECT_ID:
+        print("ERROR: Set PROJECT_ID or pass --project")
+        return 2
+
+    try:
+        with runMetrics.profiled(args.profile):
+            with runMetrics.span(args.command):
+                status = args.func(args)
     except Exception as e:
         print(f"Error: {str(e)}")
-        return 1
+        status = 1
+    print(f"Run report: {runMetrics.metrics.write_report(args.report)}")
+    if args.metrics_file:
+        print(f"Metrics: {runMetrics.metrics.write_prometheus(args.metrics_file)}")
+    return status
 
 
 if __name__ == "__main__":
-    exit(main())
+    sys.exit(main())
@@ -133,6 +133,11 @@ echo "Setting bucket permissions..."
 gsutil iam ch serviceAccount:$SERVICE_ACCOUNT_EMAIL:objectAdmin gs://$BUCKET_NAME/ 2>/dev/null
 check_success
 
+# Upload the local images and alerts (only new or changed files on re-runs)
+echo "Syncing local images and alerts to gs://$BUCKET_NAME..."
+python3 "$(dirname "$0")/objectSync.py" --bucket "$BUCKET_NAME" --project "$PROJECT_ID"
+check_success
+
 # Create BigQuery dataset - US MULTI-REGION
 echo "Creating BigQuery dataset..."
 if dataset_exists "$PROJECT_ID:$DATASET_ID"; then
@@ -209,23 +214,7 @@ echo "Creating weather data table..."
 if table_exists "$PROJECT_ID:$DATASET_ID.weather_data"; then
     echo "  Table weather_data already exists - recreating..."
 fi
-bq query --use_legacy_sql=false --replace=true "
-CREATE OR REPLACE TABLE \`$PROJECT_ID.$DATASET_ID.weather_data\` (
-  location STRING OPTIONS(description='Weather station location name'),
-  date DATE OPTIONS(description='Date of weather observation'),
-  temp_max FLOAT64 OPTIONS(description='Maximum temperature in Fahrenheit'),
-  humidity INT64 OPTIONS(description='Relative humidity percentage'),
-  wind_speed FLOAT64 OPTIONS(description='Wind speed in mph'),
-  wind_deg INT64 OPTIONS(description='Wind direction in degrees'),
-  pressure INT64 OPTIONS(description='Atmospheric pressure in hPa'),
-  visibility INT64 OPTIONS(description='Visibility in meters'),
-  uvi FLOAT64 OPTIONS(description='UV index'),
-  fire_risk_score FLOAT64 OPTIONS(description='Calculated fire risk score 0-1')
-)
-OPTIONS(
-  description='Weather data for Napa Valley fire risk analysis',
-  labels=[('environment', 'demo'), ('project', 'wildfire')]
-);" 2>/dev/null
+bq query --use_legacy_sql=false --replace=true "$(python3 "$(dirname "$0")/tableSchemas.py" --ddl weather_data "$PROJECT_ID.$DATASET_ID")" 2>/dev/null
 check_success
 
 # Create fire history table
@@ -233,22 +222,7 @@ echo "Creating fire history table..."
 if table_exists "$PROJECT_ID:$DATASET_ID.fire_history"; then
     echo "  Table fire_history already exists - recreating..."
 fi
-bq query --use_legacy_sql=false --replace=true "
-CREATE OR REPLACE TABLE \`$PROJECT_ID.$DATASET_ID.fire_history\` (
-  fire_name STRING OPTIONS(description='Name of the fire incident'),
-  fire_year INT64 OPTIONS(description='Year the fire occurred'),
-  alarm_date DATE OPTIONS(description='Date fire was first reported'),
-  contained_date DATE OPTIONS(description='Date fire was contained'),
-  acres FLOAT64 OPTIONS(description='Total acres burned'),
-  cause STRING OPTIONS(description='Cause of fire ignition'),
-  latitude FLOAT64 OPTIONS(description='Latitude of fire origin'),
-  longitude FLOAT64 OPTIONS(description='Longitude of fire origin'),
-  county STRING OPTIONS(description='County where fire occurred')
-)
-OPTIONS(
-  description='Historical fire incidents in Napa County',
-  labels=[('environment', 'demo'), ('project', 'wildfire')]
-);" 2>/dev/null
+bq query --use_legacy_sql=false --replace=true "$(python3 "$(dirname "$0")/tableSchemas.py" --ddl fire_history "$PROJECT_ID.$DATASET_ID")" 2>/dev/null
 check_success
 
 # Create external table for satellite images - IMPROVED ERROR HANDLING
@@ -319,25 +293,9 @@ echo "Creating fire risk analysis view..."
 if table_exists "$PROJECT_ID:$DATASET_ID.fire_risk_analysis"; then
     echo "  View fire_risk_analysis already exists - recreating..."
 fi
-bq query --use_legacy_sql=false --replace=true "
-CREATE OR REPLACE VIEW \`$PROJECT_ID.$DATASET_ID.fire_risk_analysis\` AS
-SELECT 
-  location,
-  date,
-  temp_max,
-  humidity,
-  wind_speed,
-  CASE 
-    WHEN temp_max > 95 AND humidity < 15 AND wind_speed > 25 THEN 'EXTREME'
-    WHEN temp_max > 85 AND humidity < 25 AND wind_speed > 15 THEN 'HIGH'
-    WHEN temp_max > 75 AND humidity < 35 AND wind_speed > 10 THEN 'MODERATE'
-    ELSE 'LOW'
-  END as risk_category,
-  fire_risk_score,
-  -- Haines Index calculation (simplified)
-  ROUND((temp_max - 32) * 0.556 + (100 - humidity) * 0.1, 2) as haines_index
-FROM \`$PROJECT_ID.$DATASET_ID.weather_data\`
-ORDER BY date DESC, fire_risk_score DESC;" 2>/dev/null
+# The view SQL is generated from the shared scoring rules in fireRiskScoring.py
+FIRE_RISK_VIEW_SQL=$(python3 "$(dirname "$0")/fireRiskScoring.py" --view-sql "$PROJECT_ID.$DATASET_ID")
+bq query --use_legacy_sql=false --replace=true "$FIRE_RISK_VIEW_SQL" 2>/dev/null
 check_success
 
 # Generate service account key
@@ -398,8 +356,8 @@ echo "- weather_alerts (external table)"
 echo "- fire_risk_analysis (view)"
 echo ""
 echo "Next steps:"
-echo "1. Run upload_multimodal_files.py to upload alert files: /data/weather_messages/ and satellite images: /data/sentinel_images"
-echo "2. Upload data into tables Run: python3 dataCollector_v3.py"  
+echo "1. Alert files and satellite images were synced to gs://$BUCKET_NAME; after adding new ones run: python3 objectSync.py --bucket $BUCKET_NAME --project $PROJECT_ID"
+echo "2. Upload data into tables Run: python3 dataCollector_v3.py all --source real"  
 echo "3. Test external tables:"
 echo "   SELECT COUNT(*) FROM \`$PROJECT_ID.$DATASET_ID.weather_alerts\`;"
 echo ""
@@ -0,0 +1,477 @@
+import io
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+
+
+def _stub_daily_payload(lat, lon, start_date, end_date):
+    """Build a deterministic Open-Meteo style daily payload for a location and date window"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    days = (end - start).days + 1
+    daily = {
+        'time': [], 'temperature_2m_max': [], 'relative_humidity_2m': [], 'wind_speed_10m_max': [],
+        'wind_direction_10m_dominant': [], 'pressure_msl': [], 'sunshine_duration': []
+    }
+    seed = (lat * 1000 + lon * 100) % 17
+    for i in range(days):
+        day = start + timedelta(days=i)
+        season = math.sin((day.timetuple().tm_yday - 100) / 365 * 2 * math.pi)
+        wobble = math.sin(day.toordinal() * 0.7 + seed)
+        daily['time'].append(day.strftime('%Y-%m-%d'))
+        daily['temperature_2m_max'].append(round(22 + 10 * season + 4 * wobble, 1))
+        daily['relative_humidity_2m'].append(round(55 - 25 * season - 10 * wobble))
+        daily['wind_speed_10m_max'].append(round(4 + 3 * abs(wobble), 1))
+        daily['wind_direction_10m_dominant'].append(int((day.toordinal() * 37) % 360))
+        daily['pressure_msl'].append(round(1013 + 6 * wobble, 1))
+        daily['sunshine_duration'].append(round(36000 + 8000 * season))
+    return {'latitude': lat, 'longitude': lon, 'daily': daily}
+
+
+def _stub_hourly_payload(lat, lon, start_date, end_date):
+    """Build a deterministic Open-Meteo style hourly payload with a diurnal cycle.
+
+    Some dry-season days get a red-flag afternoon: humidity in the low teens with strong gusts.
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    hourly = {
+        'time': [], 'temperature_2m': [], 'relative_humidity_2m': [], 'wind_speed_10m': [], 'wind_gusts_10m': [],
+        'wind_direction_10m': [], 'pressure_msl': [], 'sunshine_duration': []
+    }
+    seed = (lat * 1000 + lon * 100) % 17
+    for i in range((end - start).days + 1):
+        day = start + timedelta(days=i)
+        season = math.sin((day.timetuple().tm_yday - 100) / 365 * 2 * math.pi)
+        wobble = math.sin(day.toordinal() * 0.7 + seed)
+        red_flag = season > 0.3 and math.sin(day.toordinal() * 0.37 + seed) > 0.8
+        for hour in range(24):
+            diurnal = math.sin((hour - 9) / 24 * 2 * math.pi)
+            windy = red_flag and 12 <= hour <= 19
+            hourly['time'].append(f"{day.strftime('%Y-%m-%d')}T{hour:02d}:00")
+            hourly['temperature_2m'].append(round(17 + 9 * season + 4 * wobble + 7 * diurnal, 1))
+            hourly['relative_humidity_2m'].append(round(12 - abs(wobble) * 3) if windy
+                                                  else round(min(100, max(5, 58 - 22 * season - 18 * diurnal - 8 * wobble))))
+            wind = 12.0 if windy else 2.5 + 1.5 * abs(wobble) + max(0.0, diurnal)
+            hourly['wind_speed_10m'].append(round(wind, 1))
+            hourly['wind_gusts_10m'].append(round(wind * 1.45, 1))
+            hourly['wind_direction_10m'].append(int((day.toordinal() * 37 + hour * 5) % 360))
+            hourly['pressure_msl'].append(round(1013 + 6 * wobble - diurnal, 1))
+            hourly['sunshine_duration'].append(round(3600 * max(0.0, diurnal) * (0.7 + 0.3 * season)))
+    return {'latitude': lat, 'longitude': lon, 'hourly': hourly}
+
+
+def _stub_ghcnd_records(station_id, start_date, end_date, datatypes):
+    """Deterministic GHCND daily records in CDO's layout: one record per station, day and datatype.
+
+    Values are in 'standard' units (whole degrees F, inches). Some days have no PRCP and a few
+    records carry a quality flag, as real station data does.
+    """
+    seed = zlib.crc32(station_id.encode()) % 1000
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    records = []
+    for i in range((end - start).days + 1):
+        day = start + timedelta(days=i)
+        season = math.sin((day.timetuple().tm_yday - 100) / 365 * 2 * math.pi)
+        wobble = math.sin(day.toordinal() * 0.7 + seed)
+        rain = max(0.0, math.sin(day.toordinal() * 1.3 + seed) - 0.6)
+        values = {'TMAX': round(72 + 18 * season + 7 * wobble), 'TMIN': round(48 + 12 * season + 5 * wobble),
+                  'PRCP': round(rain * 2, 2)}
+        for datatype in datatypes:
+            if datatype not in values or datatype == 'PRCP' and (day.toordinal() + seed) % 5 == 0:
+                continue
+            flag = 'I' if (day.toordinal() + seed + len(datatype)) % 97 == 0 else ''
+            records.append({'date': day.strftime('%Y-%m-%dT00:00:00'), 'datatype': datatype, 'station': station_id,
+                            'attributes': f",{flag},7,", 'value': values[datatype]})
+    return records
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        # Repeated parameters (NOAA's datatypeid=TMAX&datatypeid=PRCP) are joined with commas
+        query = {key: ','.join(values) for key, values in parse_qs(urlparse(self.path).query).items()}
+        with server.lock:
+            server.request_count += 1
+            request_number = server.request_count
+            server.requests.append(query)
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_every and request_number % server.fail_every == 0:
+            self._send(server.fail_status, {'error': True, 'reason': 'stub failure'}, {'Retry-After': '0'})
+            return
+        self._send(200, server.responder(query))
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """Local HTTP stub for the weather APIs, served from a background thread.
+
+    responder maps the parsed query dict to a JSON payload. Every fail_every-th request
+    is answered with fail_status so retry handling can be exercised.
+    """
+
+    def __init__(self, responder=None, latency=0.0, fail_every=0, fail_status=429, port=0):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.responder = responder or open_meteo_responder
+        self.httpd.latency = latency
+        self.httpd.fail_every = fail_every
+        self.httpd.fail_status = fail_status
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self.httpd.requests = []
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/archive"
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeBucket:
+    """Filesystem-backed stand-in for a Cloud Storage bucket with resumable uploads.
+
+    Objects are files under root; each has a JSON sidecar holding its metadata and generation.
+    Upload sessions persist as partial files, so an interrupted upload can be resumed from the
+    offset the bucket reports. Every fail_every-th chunk stores half its bytes and then raises
+    ConnectionError, like a dropped connection mid-transfer. latency adds a round trip per chunk.
+    """
+
+    def __init__(self, root, name='fake-bucket', fail_every=0, latency=0.0):
+        self.root = root
+        self.name = name
+        self.fail_every = fail_every
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.chunks = 0
+        self.bytes_received = 0
+        self.copies = 0
+        for directory in ('objects', 'meta', 'uploads'):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    def _path(self, kind, name):
+        return os.path.join(self.root, kind, name)
+
+    def uri(self, name):
+        return f"gs://{self.name}/{name}"
+
+    def start_upload(self, name, size, metadata=None, content_type=None):
+        session = f"upload-{time.time_ns()}-{threading.get_ident()}"
+        with open(self._path('uploads', session + '.json'), 'w') as f:
+            json.dump({'name': name, 'size': size, 'metadata': metadata or {}, 'content_type': content_type}, f)
+        open(self._path('uploads', session), 'wb').close()
+        return session
+
+    def upload_offset(self, session, size):
+        if not os.path.exists(self._path('uploads', session + '.json')):
+            raise KeyError(f"Unknown upload session {session}")
+        return os.path.getsize(self._path('uploads', session))
+
+    def upload_chunk(self, session, data, offset, size):
+        """Append data at offset; returns the next offset. The last chunk completes the object."""
+        with self.lock:
+            self.chunks += 1
+            failing = self.fail_every and self.chunks % self.fail_every == 0
+        time.sleep(self.latency)
+        if self.upload_offset(session, size) != offset:
+            raise ValueError(f"Chunk at {offset} does not continue session {session}")
+        with open(self._path('uploads', session), 'ab') as f:
+            f.write(data[:len(data) // 2] if failing else data)
+        with self.lock:
+            self.bytes_received += len(data) // 2 if failing else len(data)
+        if failing:
+            raise ConnectionError("fake bucket dropped the connection")
+        offset += len(data)
+        if offset >= size:
+            with open(self._path('uploads', session + '.json')) as f:
+                info = json.load(f)
+            self._commit(info['name'], info['metadata'], info['content_type'], self._path('uploads', session))
+            os.remove(self._path('uploads', session + '.json'))
+        return offset
+
+    def _commit(self, name, metadata, content_type, source):
+        target = self._path('objects', name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+        previous = self.object_metadata(name)
+        meta_path = self._path('meta', name + '.json')
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path, 'w') as f:
+            json.dump({'size': os.path.getsize(target), 'metadata': metadata, 'content_type': content_type,
+                       'generation': (previous['generation'] + 1) if previous else 1}, f)
+
+    def copy(self, source, name, metadata=None):
+        """Server-side copy: no bytes are uploaded"""
+        info = self.object_metadata(source)
+        staged = self._path('uploads', f"copy-{time.time_ns()}")
+        shutil.copyfile(self._path('objects', source), staged)
+        self._commit(name, metadata or info['metadata'], info['content_type'], staged)
+        with self.lock:
+            self.copies += 1
+
+    def delete(self, name):
+        for path in (self._path('objects', name), self._path('meta', name + '.json')):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def object_metadata(self, name):
+        path = self._path('meta', name + '.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def read(self, name):
+        with open(self._path('objects', name), 'rb') as f:
+            return f.read()
+
+    def list_objects(self):
+        objects = self._path('objects', '')
+        return sorted(os.path.relpath(os.path.join(directory, name), objects)
+                      for directory, _, names in os.walk(objects) for name in names)
+
+
+class FakeJob:
+    """Completed job returned by FakeBigQueryClient"""
+
+    def __init__(self, job_id, job_type, destination=None, query=None, output_rows=0, total_bytes_processed=0):
+        self.job_id = job_id
+        self.job_type = job_type
+        self.destination = destination
+        self.query = query
+        self.output_rows = output_rows
+        self.total_bytes_processed = total_bytes_processed
+        self.state = 'DONE'
+
+    def result(self):
+        return self
+
+
+class FakeTable:
+    def __init__(self, table_id, df, schema=None):
+        self.table_id = table_id
+        self.df = df
+        self.schema = schema
+        self.modified = datetime.now()
+
+    @property
+    def num_rows(self):
+        return len(self.df)
+
+    @property
+    def num_bytes(self):
+        return int(self.df.memory_usage(deep=True).sum())
+
+
+class FakeBigQueryClient:
+    """In-process stand-in for bigquery.Client that keeps tables as DataFrames.
+
+    Supports the calls the loaders make: file/DataFrame load jobs (Parquet or CSV,
+    truncate or append), get/create/delete table, and MERGE upserts of the
+    `MERGE T USING S ON T.k = S.k ...` form. Every job is recorded in self.jobs.
+    """
+
+    def __init__(self, project='fake-project'):
+        self.project = project
+        self.tables = {}
+        self.jobs = []
+
+    def _job(self, job_type, **info):
+        job = FakeJob(f"fake_{job_type}_{len(self.jobs) + 1}", job_type, **info)
+        self.jobs.append(job)
+        return job
+
+    def _store(self, destination, df, job_config):
+        table_id = str(destination)
+        disposition = str(getattr(job_config, 'write_disposition', None) or 'WRITE_APPEND')
+        if table_id in self.tables and disposition.endswith('WRITE_APPEND'):
+            df = pd.concat([self.tables[table_id].df, df], ignore_index=True)
+        elif table_id in self.tables and disposition.endswith('WRITE_EMPTY') and self.tables[table_id].num_rows:
+            raise ValueError(f"Table {table_id} is not empty")
+        self.tables[table_id] = FakeTable(table_id, df, getattr(job_config, 'schema', None))
+        return table_id
+
+    def load_table_from_file(self, file_obj, destination, job_config=None, **kwargs):
+        payload = file_obj.read()
+        source_format = str(getattr(job_config, 'source_format', None) or 'CSV')
+        if source_format.endswith('PARQUET'):
+            df = pd.read_parquet(io.BytesIO(payload))
+        else:
+            df = pd.read_csv(io.BytesIO(payload))
+        table_id = self._store(destination, df, job_config)
+        return self._job('load', destination=table_id, output_rows=len(df), total_bytes_processed=len(payload))
+
+    def load_table_from_dataframe(self, dataframe, destination, job_config=None, **kwargs):
+        table_id = self._store(destination, dataframe.copy(), job_config)
+        return self._job('load', destination=table_id, output_rows=len(dataframe))
+
+    def get_table(self, table_id):
+        table_id = str(getattr(table_id, 'table_id', table_id))
+        if table_id not in self.tables:
+            raise KeyError(f"Not found: Table {table_id}")
+        return self.tables[table_id]
+
+    def create_table(self, table, exists_ok=False):
+        table_id = self._table_ref(table)
+        if table_id in self.tables and not exists_ok:
+            raise ValueError(f"Already Exists: Table {table_id}")
+        columns = [field.name for field in getattr(table, 'schema', None) or []]
+        self.tables.setdefault(table_id, FakeTable(table_id, pd.DataFrame(columns=columns), getattr(table, 'schema', None)))
+        return self.tables[table_id]
+
+    def delete_table(self, table_id, not_found_ok=False):
+        table_id = str(getattr(table_id, 'table_id', table_id))
+        if table_id not in self.tables and not not_found_ok:
+            raise KeyError(f"Not found: Table {table_id}")
+        self.tables.pop(table_id, None)
+
+    def query(self, query, job_config=None, **kwargs):
+        match = re.search(r"MERGE\s+`([^`]+)`\s+T\s+USING\s+`([^`]+)`\s+S\s+ON\s+(.+?)\s+WHEN", query, re.S)
+        if not match:
+            return self._job('query', query=query)
+        target_id, source_id, condition = match.groups()
+        keys = re.findall(r"T\.(\w+)\s*=\s*S\.\1", condition)
+        source = self.get_table(source_id).df
+        target = self.tables[target_id].df if target_id in self.tables else source.iloc[0:0]
+        merged = source if target.empty else pd.concat([target, source], ignore_index=True)
+        merged = merged.drop_duplicates(subset=keys, keep='last').reset_index(drop=True)
+        self.tables[target_id] = FakeTable(target_id, merged)
+        return self._job('query', query=query, output_rows=len(source),
+                         total_bytes_processed=int(source.memory_usage(deep=True).sum()))
+
+    @staticmethod
+    def _table_ref(table):
+        if isinstance(table, str):
+            return table
+        return f"{table.project}.{table.dataset_id}.{table.table_id}"
+
+
+def open_meteo_responder(query):
+    """Answer an Open-Meteo archive query with synthetic daily or hourly data"""
+    if 'hourly' in query:
+        return _stub_hourly_payload(float(query['latitude']), float(query['longitude']),
+                                    query['start_date'], query['end_date'])
+    return _stub_daily_payload(float(query['latitude']), float(query['longitude']),
+                               query['start_date'], query['end_date'])
+
+
+def noaa_cdo_responder(query):
+    """Answer a NOAA CDO /data query with one page of synthetic GHCND records.
+
+    Pages follow CDO's 1-based offset/limit paging and resultset metadata; an empty result is {}.
+    """
+    records = _stub_ghcnd_records(query['stationid'], query['startdate'][:10], query['enddate'][:10],
+                                  query.get('datatypeid', 'TMAX,TMIN,PRCP').split(','))
+    offset, limit = int(query.get('offset', 1)), int(query.get('limit', 25))
+    page = records[offset - 1:offset - 1 + limit]
+    if not page:
+        return {}
+    return {'metadata': {'resultset': {'offset': offset, 'count': len(records), 'limit': limit}}, 'results': page}
+
+
+class ReplayResponder:
+    """Serve recorded API responses, keyed by query, from a JSON-lines file.
+
+    Queries missing from the recording go to fallback and are recorded (call save() to keep
+    them); without a fallback they are answered with {} and counted in misses. Credential
+    parameters are left out of the key, so recordings hold no tokens.
+    """
+
+    IGNORED_PARAMETERS = ('token', 'apikey', 'appid')
+
+    def __init__(self, path, fallback=None):
+        self.path = path
+        self.fallback = fallback
+        self.responses = {}
+        self.misses = 0
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.responses[self._key(entry['query'])] = entry['response']
+
+    def _key(self, query):
+        return json.dumps({key: value for key, value in query.items() if key not in self.IGNORED_PARAMETERS},
+                          sort_keys=True)
+
+    def __call__(self, query):
+        key = self._key(query)
+        with self.lock:
+            if key in self.responses:
+                return self.responses[key]
+        if self.fallback is None:
+            with self.lock:
+                self.misses += 1
+            return {}
+        response = self.fallback(query)
+        with self.lock:
+            self.responses[key] = response
+        return response
+
+    def save(self):
+        with self.lock:
+            lines = [json.dumps({'query': json.loads(key), 'response': response})
+                     for key, response in sorted(self.responses.items())]
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+if __name__ == "__main__":
+    from collectRealData import collect_open_meteo_weather
+
+    with StubServer(latency=0.05, fail_every=10) as stub:
+        stats = {}
+        weather_df = collect_open_meteo_weather(base_url=stub.url, requests_per_second=50, stats=stats)
+        print(f"Collected {len(weather_df)} weather records from {stub.url}")
+        print(stats)
@@ -0,0 +1,219 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# Versioned rule tables. Each rule adds `weight` to the score when `column op threshold` holds;
+# rules are applied in order so results match the original per-row if-chains exactly.
+RULE_TABLES = {
+    'open_meteo_v1': {
+        'base': 0.0,
+        'rules': [
+            ('temp_max', '>', 85, 0.3),
+            ('temp_max', '>', 95, 0.2),
+            ('humidity', '<', 30, 0.25),
+            ('humidity', '<', 15, 0.15),
+            ('wind_speed', '>', 15, 0.1),
+            ('wind_speed', '>', 25, 0.15),
+            ('sunshine', '>', 10800, 0.05)
+        ]
+    },
+    'simulated_v1': {
+        'base': 0.0,  # the generator supplies its seasonal risk_base per row
+        'rules': [
+            ('temp_max', '>', 85, 0.2),
+            ('temp_max', '>', 95, 0.3),
+            ('humidity', '<', 30, 0.2),
+            ('humidity', '<', 15, 0.2),
+            ('wind_speed', '>', 15, 0.15),
+            ('wind_speed', '>', 25, 0.15)
+        ]
+    }
+}
+DEFAULT_RULES_VERSION = 'open_meteo_v1'
+
+# risk_category thresholds of the fire_risk_analysis view, most severe first
+RISK_CATEGORIES = ['LOW', 'MODERATE', 'HIGH', 'EXTREME']
+CATEGORY_RULES = [
+    ('EXTREME', 95, 15, 25),
+    ('HIGH', 85, 25, 15),
+    ('MODERATE', 75, 35, 10)
+]
+
+_OPS = {'>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal}
+
+
+def risk_scores(temp_max, humidity, wind_speed, sunshine=None, base=None, noise=None,
+                version=DEFAULT_RULES_VERSION):
+    """Score arrays of observations with a rule table, returning fire_risk_score in [0, 1]"""
+    table = RULE_TABLES[version]
+    columns = {'temp_max': temp_max, 'humidity': humidity, 'wind_speed': wind_speed, 'sunshine': sunshine}
+    n = len(temp_max)
+
+    score = np.full(n, table['base'], dtype=np.float64)
+    if base is not None:
+        score += base
+    for column, op, threshold, weight in table['rules']:
+        values = columns[column]
+        if values is None:
+            continue
+        score += weight * _OPS[op](values, threshold)
+    if noise is not None:
+        score += noise
+    np.clip(score, 0.0, 1.0, out=score)
+    return np.round(score, 2, out=score)
+
+
+def risk_category_codes(temp_max, humidity, wind_speed):
+    """Return int8 indexes into RISK_CATEGORIES using the view's CASE thresholds"""
+    codes = np.zeros(len(temp_max), dtype=np.int8)
+    for name, temp, hum, wind in reversed(CATEGORY_RULES):
+        hit = (temp_max > temp) & (humidity < hum) & (wind_speed > wind)
+        codes[hit] = RISK_CATEGORIES.index(name)
+    return codes
+
+
+def haines_index(temp_max, humidity):
+    """Simplified Haines-style index used by the fire_risk_analysis view"""
+    return np.round((np.asarray(temp_max) - 32) * 0.556 + (100 - np.asarray(humidity)) * 0.1, 2)
+
+
+def score_arrays(temp_max, humidity, wind_speed, sunshine=None, base=None, noise=None,
+                 version=DEFAULT_RULES_VERSION):
+    """Score whole arrays at once and return fire_risk_score, risk_category and haines_index"""
+    temp_max = np.asarray(temp_max, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    wind_speed = np.asarray(wind_speed, dtype=np.float64)
+    if sunshine is not None:
+        sunshine = np.asarray(sunshine, dtype=np.float64)
+    return {
+        'fire_risk_score': risk_scores(temp_max, humidity, wind_speed, sunshine, base, noise, version),
+        'risk_category': pd.Categorical.from_codes(risk_category_codes(temp_max, humidity, wind_speed),
+                                                   categories=RISK_CATEGORIES, ordered=True),
+        'haines_index': haines_index(temp_max, humidity)
+    }
+
+
+def score_frame(df, version=DEFAULT_RULES_VERSION, chunk_rows=10_000_000, columns=None):
+    """Return a DataFrame with fire_risk_score, risk_category and haines_index for every row of df.
+
+    Rows are scored in chunks of chunk_rows so temporaries stay bounded on very large frames.
+    A sunshine column is used when present. Pass columns to keep only some of the outputs.
+    """
+    columns = columns or ['fire_risk_score', 'risk_category', 'haines_index']
+    parts = []
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        scored = score_arrays(
+            chunk['temp_max'].to_numpy(), chunk['humidity'].to_numpy(), chunk['wind_speed'].to_numpy(),
+            chunk['sunshine'].to_numpy() if 'sunshine' in chunk else None, version=version
+        )
+        parts.append(pd.DataFrame({name: scored[name] for name in columns}, index=chunk.index))
+    return pd.concat(parts) if len(parts) > 1 else parts[0]
+
+
+def fire_risk_view_sql(table_ref):
+    """CREATE VIEW statement for fire_risk_analysis built from the same category and index rules"""
+    cases = "\n".join(
+        f"    WHEN temp_max > {temp} AND humidity < {hum} AND wind_speed > {wind} THEN '{name}'"
+        for name, temp, hum, wind in CATEGORY_RULES
+    )
+    return f"""CREATE OR REPLACE VIEW `{table_ref}.fire_risk_analysis` AS
+SELECT
+  location,
+  date,
+  temp_max,
+  humidity,
+  wind_speed,
+  CASE
+{cases}
+    ELSE 'LOW'
+  END as risk_category,
+  fire_risk_score,
+  -- Haines Index calculation (simplified)
+  ROUND((temp_max - 32) * 0.556 + (100 - humidity) * 0.1, 2) as haines_index
+FROM `{table_ref}.weather_data`
+ORDER BY date DESC, fire_risk_score DESC;"""
+
+
+def _legacy_open_meteo_score(temp_f, hum, wind, sun):
+    risk_score = 0.0
+    if temp_f > 85: risk_score += 0.3
+    if temp_f > 95: risk_score += 0.2
+    if hum < 30: risk_score += 0.25
+    if hum < 15: risk_score += 0.15
+    if wind > 15: risk_score += 0.1
+    if wind > 25: risk_score += 0.15
+    if sun > 10800: risk_score += 0.05
+    return round(min(risk_score, 1.0), 2)
+
+
+def _legacy_simulated_score(risk_base, temp_max, humidity, wind_speed, noise):
+    risk = risk_base
+    if temp_max > 85: risk += 0.2
+    if temp_max > 95: risk += 0.3
+    if humidity < 30: risk += 0.2
+    if humidity < 15: risk += 0.2
+    if wind_speed > 15: risk += 0.15
+    if wind_speed > 25: risk += 0.15
+    return round(max(0, min(1, min(1.0, risk + noise))), 2)
+
+
+def _legacy_category(temp_max, humidity, wind_speed):
+    if temp_max > 95 and humidity < 15 and wind_speed > 25: return 'EXTREME'
+    if temp_max > 85 and humidity < 25 and wind_speed > 15: return 'HIGH'
+    if temp_max > 75 and humidity < 35 and wind_speed > 10: return 'MODERATE'
+    return 'LOW'
+
+
+def verify_parity(num_rows=200_000, seed=0):
+    """Check the vectorized kernel against the original per-row rules on random observations"""
+    rng = np.random.default_rng(seed)
+    temp = np.round(rng.uniform(30, 115, num_rows), 1)
+    hum = rng.integers(5, 96, num_rows).astype(np.float64)
+    wind = np.round(rng.uniform(0, 60, num_rows), 1)
+    sun = rng.uniform(0, 50000, num_rows)
+    base = rng.choice([0.1, 0.2, 0.5, 0.8], num_rows)
+    noise = rng.uniform(-0.1, 0.1, num_rows)
+
+    open_meteo = score_arrays(temp, hum, wind, sun, version='open_meteo_v1')
+    simulated = risk_scores(temp, hum, wind, base=base, noise=noise, version='simulated_v1')
+
+    mismatches = {
+        'open_meteo_v1': sum(_legacy_open_meteo_score(*row) != score
+                             for row, score in zip(zip(temp, hum, wind, sun), open_meteo['fire_risk_score'])),
+        'simulated_v1': sum(_legacy_simulated_score(*row) != score
+                            for row, score in zip(zip(base, temp, hum, wind, noise), simulated)),
+        'risk_category': sum(_legacy_category(*row) != category
+                             for row, category in zip(zip(temp, hum, wind), open_meteo['risk_category']))
+    }
+    for name, count in mismatches.items():
+        print(f"  {name}: {count} mismatches in {num_rows:,} rows")
+    return all(count == 0 for count in mismatches.values())
+
+
+def benchmark_scoring(num_rows=100_000_000, chunk_rows=10_000_000, seed=0):
+    """Time re-scoring num_rows observations chunk by chunk"""
+    rng = np.random.default_rng(seed)
+    temp = rng.uniform(30, 115, chunk_rows)
+    hum = rng.uniform(5, 95, chunk_rows)
+    wind = rng.uniform(0, 60, chunk_rows)
+    start = time.perf_counter()
+    scored = 0
+    while scored < num_rows:
+        n = min(chunk_rows, num_rows - scored)
+        score_arrays(temp[:n], hum[:n], wind[:n])
+        scored += n
+    elapsed = time.perf_counter() - start
+    print(f"  Scored {scored:,} rows in {elapsed:.2f}s ({scored / elapsed:,.0f} rows/sec)")
+    return elapsed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--view-sql":
+        print(fire_risk_view_sql(sys.argv[2]))
+    elif "--benchmark" in sys.argv:
+        benchmark_scoring()
+    else:
+        print("Checking fire risk kernel parity with per-row rules...")
+        sys.exit(0 if verify_parity() else 1)
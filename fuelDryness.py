@@ -0,0 +1,394 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+import tableSchemas
+from localStore import STORE_ROOT, read_weather, write_table
+
+STATE_PATH = './data/features/fuel_dryness_state.npz'
+
+# A day counts as wet (resetting days and heat since the fuels were last wet) when a station
+# measured at least WET_PRECIP_INCHES of rain; Open-Meteo and simulated rows carry no
+# precipitation, so for them a day at or above WET_HUMIDITY stands in for a wetting rain
+WET_HUMIDITY = 80
+WET_PRECIP_INCHES = 0.1
+HEAT_BASE_F = 80.0
+WIND_EVENT_MPH = 25.0
+WINDOWS = (7, 30)
+STATE_DAYS = max(WINDOWS)
+
+FEATURE_COLUMNS = tableSchemas.columns('fuel_dryness')[2:]
+
+# Cells per (stations x days) grid in the batch path; larger histories are split by station
+_GRID_CELLS = 4_000_000
+_NO_DAY = np.iinfo(np.int32).min // 2
+
+
+def _inputs(weather):
+    """One row per (location, date) with the day number and the daily inputs of every feature.
+
+    Heat is kept in integer tenths of a degree-day so window sums are exact whichever path
+    computes them.
+    """
+    weather = weather.drop_duplicates(['location', 'date'], keep='last')
+    days = pd.to_datetime(weather['date']).to_numpy().astype('datetime64[D]').astype(np.int64)
+    humidity = weather['humidity'].to_numpy(np.float32, na_value=np.nan)
+    heat = np.round(np.nan_to_num(np.maximum(weather['temp_max'].to_numpy(np.float64, na_value=np.nan) - HEAT_BASE_F, 0))
+                    * 10).astype(np.int64)
+    wind = weather['wind_speed'].to_numpy(np.float64, na_value=np.nan) >= WIND_EVENT_MPH
+    wet = humidity >= WET_HUMIDITY
+    if 'precipitation' in weather:
+        wet |= weather['precipitation'].to_numpy(np.float64, na_value=np.nan) >= WET_PRECIP_INCHES
+    return weather, days, humidity, heat, wind, wet
+
+
+def _features_frame(locations, days, days_since_wet, humidity_min, heat_accum, heat_since_wet, wind_events):
+    columns = {'location': locations, 'date': days.astype('datetime64[D]'),
+               'days_since_wet': days_since_wet}
+    for window in WINDOWS:
+        columns[f"humidity_min_{window}d"] = humidity_min[window]
+    for window in WINDOWS:
+        columns[f"heat_accum_{window}d"] = heat_accum[window] / 10
+    columns['heat_since_wet'] = heat_since_wet / 10
+    for window in WINDOWS:
+        columns[f"wind_events_{window}d"] = wind_events[window]
+    return tableSchemas.to_typed(pd.DataFrame(columns), 'fuel_dryness')
+
+
+class DrynessState:
+    """Per-station inputs of the last STATE_DAYS days plus the running wet-day and heat totals.
+
+    Window inputs live in rings indexed by day number modulo STATE_DAYS, so appending a day
+    overwrites one slot per station and every feature is recomputed from at most STATE_DAYS
+    values: constant work per station and day however long the history is. About 400 bytes
+    per station.
+    """
+
+    def __init__(self, stations=()):
+        self.stations = []
+        self.positions = {}
+        self.ring_day = np.empty((0, STATE_DAYS), dtype=np.int32)
+        self.ring_humidity = np.empty((0, STATE_DAYS), dtype=np.float32)
+        self.ring_heat = np.empty((0, STATE_DAYS), dtype=np.int32)
+        self.ring_wind = np.empty((0, STATE_DAYS), dtype=bool)
+        self.last_day = np.empty(0, dtype=np.int32)
+        self.last_wet_day = np.empty(0, dtype=np.int32)
+        self.heat_since_wet = np.empty(0, dtype=np.int64)
+        self._add_stations(list(stations))
+
+    def __len__(self):
+        return len(self.stations)
+
+    def _add_stations(self, names):
+        if not names:
+            return
+        n = len(names)
+        self.positions.update((name, len(self.stations) + i) for i, name in enumerate(names))
+        self.stations.extend(names)
+        self.ring_day = np.vstack([self.ring_day, np.full((n, STATE_DAYS), _NO_DAY, dtype=np.int32)])
+        self.ring_humidity = np.vstack([self.ring_humidity, np.full((n, STATE_DAYS), np.inf, dtype=np.float32)])
+        self.ring_heat = np.vstack([self.ring_heat, np.zeros((n, STATE_DAYS), dtype=np.int32)])
+        self.ring_wind = np.vstack([self.ring_wind, np.zeros((n, STATE_DAYS), dtype=bool)])
+        self.last_day = np.concatenate([self.last_day, np.full(n, _NO_DAY, dtype=np.int32)])
+        self.last_wet_day = np.concatenate([self.last_wet_day, np.full(n, _NO_DAY, dtype=np.int32)])
+        self.heat_since_wet = np.concatenate([self.heat_since_wet, np.zeros(n, dtype=np.int64)])
+
+    def station_positions(self, locations):
+        """Positions of locations in the state arrays, adding stations seen for the first time"""
+        codes, names = pd.factorize(locations)
+        names = [str(name) for name in names]
+        self._add_stations([name for name in names if name not in self.positions])
+        return np.array([self.positions[name] for name in names], dtype=np.int64)[codes]
+
+    def resume_date(self):
+        """First date any known station still needs, or None for an empty state"""
+        known = self.last_day[self.last_day != _NO_DAY]
+        return None if not len(known) else pd.Timestamp(np.datetime64(int(known.min()) + 1, 'D'))
+
+    def update(self, weather):
+        """Append new days and return their features.
+
+        Rows on or before their station's last processed day were already counted and are
+        skipped. Rows are applied one day at a time across all stations.
+        """
+        weather, days, humidity, heat, wind, wet = _inputs(weather)
+        stations = self.station_positions(weather['location'])
+        fresh = np.flatnonzero(days > self.last_day[stations])
+        fresh = fresh[np.argsort(days[fresh], kind='stable')]
+        if not len(fresh):
+            return tableSchemas.empty_frame('fuel_dryness')
+        stations, days, humidity, heat, wind, wet = (stations[fresh], days[fresh], humidity[fresh], heat[fresh],
+                                                     wind[fresh], wet[fresh])
+
+        n = len(fresh)
+        days_since_wet = np.empty(n, dtype=np.float32)
+        heat_since_wet = np.empty(n, dtype=np.int64)
+        humidity_min = {window: np.empty(n, dtype=np.float32) for window in WINDOWS}
+        heat_accum = {window: np.empty(n, dtype=np.int64) for window in WINDOWS}
+        wind_events = {window: np.empty(n, dtype=np.int64) for window in WINDOWS}
+
+        unique_days, starts = np.unique(days, return_index=True)
+        for day, start, end in zip(unique_days, starts, np.append(starts[1:], n)):
+            s = stations[start:end]
+            slot = day % STATE_DAYS
+            day_wet = wet[start:end]
+            self.ring_day[s, slot] = day
+            self.ring_humidity[s, slot] = np.where(np.isnan(humidity[start:end]), np.inf, humidity[start:end])
+            self.ring_heat[s, slot] = heat[start:end]
+            self.ring_wind[s, slot] = wind[start:end]
+            self.heat_since_wet[s] = np.where(day_wet, 0, self.heat_since_wet[s] + heat[start:end])
+            self.last_wet_day[s] = np.where(day_wet, day, self.last_wet_day[s])
+            self.last_day[s] = day
+
+            last_wet = self.last_wet_day[s]
+            days_since_wet[start:end] = np.where(last_wet != _NO_DAY, day - last_wet, np.nan)
+            heat_since_wet[start:end] = self.heat_since_wet[s]
+            ring_day = self.ring_day[s]
+            for window in WINDOWS:
+                valid = ring_day > day - window
+                lowest = np.where(valid, self.ring_humidity[s], np.inf).min(axis=1)
+                humidity_min[window][start:end] = np.where(np.isinf(lowest), np.nan, lowest)
+                heat_accum[window][start:end] = np.where(valid, self.ring_heat[s], 0).sum(axis=1)
+                wind_events[window][start:end] = (valid & self.ring_wind[s]).sum(axis=1)
+
+        locations = np.asarray(self.stations, dtype=object)[stations]
+        return _features_frame(locations, days, days_since_wet, humidity_min, heat_accum, heat_since_wet, wind_events)
+
+    def save(self, path=STATE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Write then rename so an interrupted save never leaves a truncated state behind
+        with open(f"{path}.tmp", 'wb') as f:
+            np.savez(f, stations=np.array(self.stations, dtype=str), ring_day=self.ring_day,
+                     ring_humidity=self.ring_humidity, ring_heat=self.ring_heat, ring_wind=self.ring_wind,
+                     last_day=self.last_day, last_wet_day=self.last_wet_day, heat_since_wet=self.heat_since_wet)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        state = cls()
+        with np.load(path) as saved:
+            state.stations = saved['stations'].tolist()
+            state.positions = {name: i for i, name in enumerate(state.stations)}
+            for name in ('ring_day', 'ring_humidity', 'ring_heat', 'ring_wind', 'last_day', 'last_wet_day',
+                         'heat_since_wet'):
+                setattr(state, name, saved[name])
+        return state
+
+
+def _rolling_sum(cumulative, window):
+    shifted = np.zeros_like(cumulative)
+    shifted[:, window:] = cumulative[:, :-window]
+    return cumulative - shifted
+
+
+def compute_features(weather, state=None):
+    """Features for every weather row from the full history, vectorized over (stations x days) grids.
+
+    Returns (features, state): the state after each station's last day, ready for
+    DrynessState.update to append later days.
+    """
+    state = state if state is not None else DrynessState()
+    weather, days, humidity, heat, wind, wet_days = _inputs(weather)
+    if weather.empty:
+        return tableSchemas.empty_frame('fuel_dryness'), state
+    stations = state.station_positions(weather['location'])
+    first = days.min()
+    span = int(days.max() - first + 1)
+    columns = (days - first).astype(np.int64)
+    t = np.arange(span)
+
+    n = len(weather)
+    days_since_wet = np.empty(n, dtype=np.float32)
+    heat_since_wet = np.empty(n, dtype=np.int64)
+    humidity_min = {window: np.empty(n, dtype=np.float32) for window in WINDOWS}
+    heat_accum = {window: np.empty(n, dtype=np.int64) for window in WINDOWS}
+    wind_events = {window: np.empty(n, dtype=np.int64) for window in WINDOWS}
+
+    unique_stations, rows_by_station = np.unique(stations, return_inverse=True)
+    chunk = max(1, _GRID_CELLS // span)
+    for begin in range(0, len(unique_stations), chunk):
+        rows = np.flatnonzero((rows_by_station >= begin) & (rows_by_station < begin + chunk))
+        grid_rows = rows_by_station[rows] - begin
+        grid_cols = columns[rows]
+        size = (min(chunk, len(unique_stations) - begin), span)
+
+        present = np.zeros(size, dtype=bool)
+        present[grid_rows, grid_cols] = True
+        hum = np.full(size, np.inf, dtype=np.float32)
+        hum[grid_rows, grid_cols] = np.where(np.isnan(humidity[rows]), np.inf, humidity[rows])
+        wet = np.zeros(size, dtype=bool)
+        wet[grid_rows, grid_cols] = wet_days[rows]
+        heat_grid = np.zeros(size, dtype=np.int64)
+        heat_grid[grid_rows, grid_cols] = heat[rows]
+        wind_grid = np.zeros(size, dtype=np.int64)
+        wind_grid[grid_rows, grid_cols] = wind[rows]
+
+        last_wet = np.maximum.accumulate(np.where(wet, t, -1), axis=1)
+        heat_total = np.cumsum(heat_grid, axis=1)
+        since_wet = heat_total - np.where(last_wet >= 0, np.take_along_axis(heat_total, np.maximum(last_wet, 0), axis=1), 0)
+        wind_total = np.cumsum(wind_grid, axis=1)
+
+        at = (grid_rows, grid_cols)
+        days_since_wet[rows] = np.where(last_wet[at] >= 0, grid_cols - last_wet[at], np.nan)
+        heat_since_wet[rows] = since_wet[at]
+        for window in WINDOWS:
+            padded = np.pad(hum, ((0, 0), (window - 1, 0)), constant_values=np.inf)
+            lowest = sliding_window_view(padded, window, axis=1).min(axis=2)[at]
+            humidity_min[window][rows] = np.where(np.isinf(lowest), np.nan, lowest)
+            heat_accum[window][rows] = _rolling_sum(heat_total, window)[at]
+            wind_events[window][rows] = _rolling_sum(wind_total, window)[at]
+
+        # Carry each station's last STATE_DAYS days and running totals into the state
+        positions = unique_stations[begin:begin + size[0]]
+        tail = t[-STATE_DAYS:]
+        tail_days = first + tail
+        state.ring_day[positions[:, None], tail_days % STATE_DAYS] = np.where(present[:, tail], tail_days, _NO_DAY)
+        state.ring_humidity[positions[:, None], tail_days % STATE_DAYS] = np.where(present[:, tail], hum[:, tail], np.inf)
+        state.ring_heat[positions[:, None], tail_days % STATE_DAYS] = heat_grid[:, tail]
+        state.ring_wind[positions[:, None], tail_days % STATE_DAYS] = wind_grid[:, tail].astype(bool)
+        state.last_day[positions] = first + span - 1 - np.argmax(present[:, ::-1], axis=1)
+        state.last_wet_day[positions] = np.where(last_wet[:, -1] >= 0, first + last_wet[:, -1], _NO_DAY)
+        state.heat_since_wet[positions] = since_wet[:, -1]
+
+    locations = np.asarray(state.stations, dtype=object)[stations]
+    return _features_frame(locations, days, days_since_wet, humidity_min, heat_accum, heat_since_wet,
+                           wind_events), state
+
+
+def update_features(root=STORE_ROOT, state_path=STATE_PATH, rebuild=False):
+    """Bring the stored fuel_dryness table up to date with the stored weather.
+
+    With a saved state only weather after the earliest station's last processed day is read;
+    otherwise (or with rebuild) the whole history is computed and a fresh state saved.
+    Stations that first appear in an incremental run start their windows from that run's rows.
+    """
+    start = time.perf_counter()
+    state = None if rebuild or not os.path.exists(state_path) else DrynessState.load(state_path)
+    if state is None:
+        weather = read_weather(root)
+        features, state = compute_features(weather)
+        mode = 'rebuild'
+    else:
+        weather = read_weather(root, start_date=state.resume_date())
+        features = state.update(weather) if not weather.empty else tableSchemas.empty_frame('fuel_dryness')
+        mode = 'incremental'
+    written = write_table(features, 'fuel_dryness', root)
+    state.save(state_path)
+    print(f"  {mode}: {len(weather):,} weather rows read, {len(features):,} feature rows computed, "
+          f"{written:,} stored for {len(state):,} stations in {time.perf_counter() - start:.3f}s")
+    return features
+
+
+def _features_row_by_row(weather):
+    """Reference implementation: every feature straight from each row's own history"""
+    weather, days, humidity, heat, wind, wet = _inputs(weather)
+    locations = weather['location'].astype(str).to_numpy()
+    records = []
+    for location in pd.unique(locations):
+        mask = locations == location
+        order = np.argsort(days[mask])
+        station_days, station_humidity = days[mask][order], humidity[mask][order]
+        station_heat, station_wind, station_wet = heat[mask][order], wind[mask][order], wet[mask][order]
+        for i, day in enumerate(station_days):
+            last_wet = np.flatnonzero(station_wet[:i + 1])
+            record = {'location': location, 'date': day,
+                      'days_since_wet': day - station_days[last_wet[-1]] if len(last_wet) else np.nan}
+            record['heat_since_wet'] = station_heat[(last_wet[-1] + 1 if len(last_wet) else 0):i + 1].sum() / 10
+            for window in WINDOWS:
+                inside = (station_days[:i + 1] > day - window)
+                record[f"humidity_min_{window}d"] = np.nanmin(station_humidity[:i + 1][inside]) \
+                    if np.isfinite(station_humidity[:i + 1][inside]).any() else np.nan
+                record[f"heat_accum_{window}d"] = station_heat[:i + 1][inside].sum() / 10
+                record[f"wind_events_{window}d"] = station_wind[:i + 1][inside].sum()
+            records.append(record)
+    df = pd.DataFrame(records)
+    df['date'] = df['date'].to_numpy().astype('datetime64[D]')
+    return tableSchemas.to_typed(df, 'fuel_dryness')
+
+
+def _sample_weather(stations, seed=0, start_date='2017-01-01', end_date='2024-12-31', keep=0.8):
+    """Simulated weather with random station-days dropped, so windows span gaps.
+
+    A station-observed precipitation is added to some rows so both wet-day signals are exercised.
+    """
+    from generateSimulatedData import generate_weather_data_vectorized
+    weather = generate_weather_data_vectorized(start_date, end_date, locations=stations, seed=seed)
+    rng = np.random.default_rng(seed)
+    weather = weather[rng.random(len(weather)) < keep].reset_index(drop=True)
+    observed = rng.random(len(weather)) < 0.3
+    weather['precipitation'] = np.where(observed, np.round(rng.exponential(0.08, len(weather)), 2), np.nan)
+    return tableSchemas.to_typed(weather, 'weather_data')
+
+
+def _sorted(features):
+    return features.assign(location=features['location'].astype(str)).sort_values(['location', 'date'],
+                                                                                 ignore_index=True)
+
+
+def verify_features(stations=8, append_days=45, seed=0):
+    """Check the batch grid path and day-by-day state updates against the row-by-row reference"""
+    weather = _sample_weather(stations, seed, '2023-01-01', '2024-12-31')
+    reference = _sorted(_features_row_by_row(weather))
+    batch, _ = compute_features(weather)
+    batch = _sorted(batch)
+
+    cutoff = weather['date'].max() - pd.Timedelta(days=append_days)
+    head, state = compute_features(weather[weather['date'] <= cutoff])
+    with tempfile.TemporaryDirectory() as directory:
+        state = DrynessState.load(state.save(os.path.join(directory, 'state.npz')))
+    appended = [head] + [state.update(day_rows) for _, day_rows in weather[weather['date'] > cutoff].groupby('date')]
+    incremental = _sorted(tableSchemas.concat(appended, 'fuel_dryness'))
+
+    ok = True
+    for label, result in (('batch', batch), ('incremental', incremental)):
+        mismatched = [column for column in reference.columns
+                      if not result[column].reset_index(drop=True).equals(reference[column].reset_index(drop=True))]
+        print(f"  {label}: {len(result):,} rows, mismatched columns: {mismatched or 'none'}")
+        ok &= not mismatched and len(result) == len(reference)
+    return ok
+
+
+def benchmark_features(stations=500, seed=0):
+    """Full-history batch computation vs appending one day to a saved state"""
+    weather = _sample_weather(stations, seed, keep=1.0)
+    last_day = weather['date'].max()
+    start = time.perf_counter()
+    _, state = compute_features(weather[weather['date'] < last_day])
+    batch_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    appended = state.update(weather[weather['date'] == last_day])
+    append_seconds = time.perf_counter() - start
+    print(f"Batch: {len(weather):,} rows for {stations} stations in {batch_seconds:.3f}s "
+          f"({len(weather) / batch_seconds:,.0f} rows/sec)")
+    print(f"Append one day: {len(appended)} rows in {append_seconds * 1000:.2f} ms "
+          f"({append_seconds / max(len(appended), 1) * 1e6:.1f} us per station)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling fuel-dryness features per station")
+    parser.add_argument('--rebuild', action='store_true', help="recompute the whole history and reset the state")
+    parser.add_argument('--store-root', default=STORE_ROOT)
+    parser.add_argument('--state', default=STATE_PATH)
+    parser.add_argument('--verify', action='store_true', help="check batch and incremental against a reference")
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        print("Checking fuel-dryness features against the row-by-row reference...")
+        return 0 if verify_features() else 1
+    if args.benchmark:
+        benchmark_features()
+        return 0
+    print("Updating fuel-dryness features...")
+    update_features(args.store_root, args.state, args.rebuild)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
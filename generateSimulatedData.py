@@ -1,28 +1,43 @@
 import pandas as pd
 import random
 import numpy as np
+import sys
+import time
 from datetime import datetime, timedelta
+from fireRiskScoring import risk_scores
+import runMetrics
+import tableSchemas
+from tableSchemas import DATE_DTYPE
+from stationRegistry import load_registry
 
-def generate_weather_data(num_records=500):
-    """Generate realistic weather data for Napa Valley"""
+LOCATIONS = load_registry().names()
+
+SEASONAL_PATTERNS = {
+    'spring': {'temp_base': 70, 'temp_var': 15, 'humidity_base': 65, 'humidity_var': 20, 'wind_base': 8, 'risk_base': 0.2},
+    'summer': {'temp_base': 85, 'temp_var': 10, 'humidity_base': 35, 'humidity_var': 15, 'wind_base': 12, 'risk_base': 0.5},
+    'fall_high_risk': {'temp_base': 95, 'temp_var': 8, 'humidity_base': 15, 'humidity_var': 10, 'wind_base': 25, 'risk_base': 0.8},
+    'winter': {'temp_base': 60, 'temp_var': 12, 'humidity_base': 75, 'humidity_var': 15, 'wind_base': 6, 'risk_base': 0.1}
+}
+
+EXTREME_FIRE_DAYS = [
+    '2017-10-08', '2017-10-09', '2017-10-10',
+    '2020-09-27', '2020-09-28', '2020-09-29',
+    '2023-09-10', '2023-09-11',
+    '2024-08-25', '2024-08-26'
+]
+
+DATE_STEPS = [1, 2, 3, 5, 7]
+
+WEATHER_COLUMNS = tableSchemas.columns('weather_data')
+
+def generate_weather_data_loop(num_records=500):
+    """Generate weather data one record at a time (reference implementation)"""
     print(f"Generating {num_records} simulated weather records...")
     
-    locations = ["Napa_Airport", "St_Helena", "Calistoga", "Yountville", "American_Canyon"]
+    locations = LOCATIONS
     weather_data = []
-    
-    seasonal_patterns = {
-        'spring': {'temp_base': 70, 'temp_var': 15, 'humidity_base': 65, 'humidity_var': 20, 'wind_base': 8, 'risk_base': 0.2},
-        'summer': {'temp_base': 85, 'temp_var': 10, 'humidity_base': 35, 'humidity_var': 15, 'wind_base': 12, 'risk_base': 0.5},
-        'fall_high_risk': {'temp_base': 95, 'temp_var': 8, 'humidity_base': 15, 'humidity_var': 10, 'wind_base': 25, 'risk_base': 0.8},
-        'winter': {'temp_base': 60, 'temp_var': 12, 'humidity_base': 75, 'humidity_var': 15, 'wind_base': 6, 'risk_base': 0.1}
-    }
-    
-    extreme_fire_days = [
-        '2017-10-08', '2017-10-09', '2017-10-10',
-        '2020-09-27', '2020-09-28', '2020-09-29',
-        '2023-09-10', '2023-09-11',
-        '2024-08-25', '2024-08-26'
-    ]
+    seasonal_patterns = SEASONAL_PATTERNS
+    extreme_fire_days = EXTREME_FIRE_DAYS
     
     start_date = datetime(2017, 1, 1)
     end_date = datetime(2024, 12, 31)
@@ -84,15 +99,152 @@ def generate_weather_data(num_records=500):
                 'pressure': int(max(980, min(1040, pressure))),
                 'visibility': int(visibility),
                 'uvi': round(max(0, min(10, uvi)), 1),
-                'fire_risk_score': round(max(0, min(1, fire_risk_score)), 2)
+                'fire_risk_score': round(max(0, min(1, fire_risk_score)), 2),
+                'source': 'simulated'
             }
             weather_data.append(weather_record)
             record_count += 1
         
-        current_date += timedelta(days=random.choice([1, 2, 3, 5, 7]))
+        current_date += timedelta(days=random.choice(DATE_STEPS))
     
     return pd.DataFrame(weather_data)
 
+_PATTERN_NAMES = ['spring', 'summer', 'fall_high_risk', 'winter']
+_PATTERN_TABLE = np.array([
+    [SEASONAL_PATTERNS[name][key] for key in ('temp_base', 'temp_var', 'humidity_base', 'humidity_var', 'wind_base', 'risk_base')]
+    for name in _PATTERN_NAMES
+])
+_FALL_HIGH_RISK = _PATTERN_NAMES.index('fall_high_risk')
+# Pattern index for months 1-12; fall months start as summer and are promoted per day
+_MONTH_PATTERN = np.array([3, 3, 0, 0, 0, 1, 1, 1, 1, 1, 1, 3])
+_EXTREME_DATES = np.array(EXTREME_FIRE_DAYS, dtype='datetime64[D]')
+
+
+def station_names(locations=None):
+    """Resolve a station list or station count into location names"""
+    if locations is None:
+        return list(LOCATIONS)
+    if isinstance(locations, int):
+        return [LOCATIONS[i] if i < len(LOCATIONS) else f"Station_{i:05d}" for i in range(locations)]
+    return list(locations)
+
+
+def simulation_dates(start_date, end_date, rng=None, random_steps=False):
+    """Return the simulated dates as datetime64[D], optionally skipping days like the original loop"""
+    start = np.datetime64(start_date, 'D')
+    span = int((np.datetime64(end_date, 'D') - start).astype(np.int64)) + 1
+    if span <= 0:
+        return np.array([], dtype='datetime64[D]')
+    if not random_steps:
+        return start + np.arange(span)
+    rng = rng if rng is not None else np.random.default_rng()
+    steps = rng.choice(DATE_STEPS, size=span)
+    offsets = np.concatenate(([0], np.cumsum(steps[:-1])))
+    return start + offsets[offsets < span]
+
+
+def _weather_chunk(rng, dates, locations):
+    """Generate every (date, location) record for a block of dates in one vectorized pass"""
+    n_days, n_locations = len(dates), len(locations)
+    n = n_days * n_locations
+
+    months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    pattern = _MONTH_PATTERN[months - 1]
+    is_fall = (months >= 9) & (months <= 11)
+    pattern = np.where(is_fall & (rng.random(n_days) < 0.3), _FALL_HIGH_RISK, pattern)
+    is_extreme_day = np.isin(dates, _EXTREME_DATES)
+    pattern[is_extreme_day] = _FALL_HIGH_RISK
+
+    day_idx = np.repeat(np.arange(n_days), n_locations)
+    params = _PATTERN_TABLE[pattern][day_idx]
+    extreme = is_extreme_day[day_idx]
+
+    temp_max = rng.normal(params[:, 0], params[:, 1])
+    humidity = np.clip(rng.normal(params[:, 2], params[:, 3]), 5, 95)
+    wind_speed = np.maximum(0, rng.normal(params[:, 4], 5))
+
+    fire_risk_score = risk_scores(temp_max, humidity, wind_speed, base=params[:, 5],
+                                  noise=rng.uniform(-0.1, 0.1, n), version='simulated_v1')
+
+    k = int(extreme.sum())
+    if k:
+        temp_max[extreme] = rng.normal(100, 5, k)
+        humidity[extreme] = rng.integers(5, 21, k)
+        wind_speed[extreme] = rng.normal(35, 8, k)
+        fire_risk_score[extreme] = rng.uniform(0.85, 1.0, k)
+
+    pressure = rng.normal(1015, 8, n)
+    visibility = np.where(
+        humidity > 20,
+        rng.choice([10000, 12000, 15000, 20000], n),
+        rng.choice([5000, 8000, 10000], n)
+    )
+    wind_deg = rng.integers(0, 360, n)
+    uvi = (temp_max - 40) / 8 + rng.uniform(-1, 1, n)
+
+    # Written straight into the compact weather_data types (tableSchemas)
+    return pd.DataFrame({
+        'location': pd.Categorical.from_codes(np.tile(np.arange(n_locations, dtype=np.int32), n_days),
+                                              categories=locations),
+        'date': dates.astype(DATE_DTYPE)[day_idx],
+        'temp_max': np.round(np.clip(temp_max, 30, 115), 1).astype(np.float32),
+        'humidity': np.clip(humidity, 5, 95).astype(np.int8),
+        'wind_speed': np.round(np.clip(wind_speed, 0, 60), 1).astype(np.float32),
+        'wind_deg': wind_deg.astype(np.int16),
+        'pressure': np.clip(pressure, 980, 1040).astype(np.int16),
+        'visibility': visibility.astype(np.int32),
+        'uvi': np.round(np.clip(uvi, 0, 10), 1).astype(np.float32),
+        'fire_risk_score': np.round(np.clip(fire_risk_score, 0, 1), 2).astype(np.float32),
+        'source': pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=['simulated'])
+    })
+
+
+def iter_weather_data(start_date='2017-01-01', end_date='2024-12-31', locations=None, seed=None,
+                      num_records=None, random_steps=False, chunk_rows=1_000_000):
+    """Yield simulated weather DataFrames of about chunk_rows records for any date span and station count.
+
+    Records are ordered by date, then location, like generate_weather_data_loop. With random_steps
+    the dates advance by the same random 1-7 day steps as the loop; otherwise every day is generated.
+    The same seed always yields the same records.
+    """
+    rng = np.random.default_rng(seed)
+    locations = station_names(locations)
+    dates = simulation_dates(start_date, end_date, rng, random_steps)
+    if not locations or not len(dates):
+        return
+
+    if num_records is not None:
+        dates = dates[:-(-num_records // len(locations))]
+    chunk_days = max(1, chunk_rows // len(locations))
+
+    remaining = num_records
+    for i in range(0, len(dates), chunk_days):
+        chunk = _weather_chunk(rng, dates[i:i + chunk_days], locations)
+        if remaining is not None:
+            chunk = chunk.iloc[:remaining]
+            remaining -= len(chunk)
+        yield chunk
+        if remaining == 0:
+            break
+
+
+def generate_weather_data_vectorized(start_date='2017-01-01', end_date='2024-12-31', locations=None, seed=None,
+                                     num_records=None, random_steps=False, chunk_rows=1_000_000):
+    """Generate simulated weather data with the NumPy engine as a single DataFrame"""
+    chunks = list(iter_weather_data(start_date, end_date, locations, seed, num_records, random_steps, chunk_rows))
+    return tableSchemas.concat(chunks, 'weather_data')
+
+
+def generate_weather_data(num_records=500, seed=None, locations=None):
+    """Generate realistic weather data for the registry's stations (Napa Valley by default)"""
+    print(f"Generating {num_records} simulated weather records...")
+    with runMetrics.span('generate_weather', requested=num_records) as span:
+        weather_df = generate_weather_data_vectorized(locations=locations, num_records=num_records, seed=seed,
+                                                      random_steps=True)
+        span['rows'] = len(weather_df)
+    runMetrics.record_rows('generate_weather', len(weather_df), int(weather_df.memory_usage(deep=True).sum()))
+    return weather_df
+
 def generate_fire_data(num_records=25):
     """Generate additional fire data to supplement real data"""
     print(f"Generating {num_records} simulated fire records...")
@@ -136,15 +288,43 @@ def generate_fire_data(num_records=25):
         }
         fire_data.append(fire_record)
     
-    return pd.DataFrame(fire_data)
+    runMetrics.record_rows('generate_fire', len(fire_data))
+    return tableSchemas.to_typed(pd.DataFrame(fire_data), 'fire_history')
+
+def benchmark_weather_generation(sizes=(10_000, 100_000, 1_000_000, 10_000_000), seed=0):
+    """Compare rows/sec of the record loop against the vectorized engine"""
+    print("Benchmarking simulated weather generation...")
+    results = []
 
-def generate_all_simulated_data():
+    # The loop can only produce as many records as its 2017-2024 date walk allows
+    start = time.perf_counter()
+    rows = len(generate_weather_data_loop(max(sizes)))
+    elapsed = time.perf_counter() - start
+    results.append({'engine': 'loop', 'rows': rows, 'seconds': elapsed, 'rows_per_sec': rows / elapsed})
+
+    days = len(simulation_dates('2017-01-01', '2024-12-31'))
+    for size in sizes:
+        stations = -(-size // days)
+        start = time.perf_counter()
+        rows = sum(len(chunk) for chunk in iter_weather_data(locations=stations, seed=seed, num_records=size))
+        elapsed = time.perf_counter() - start
+        results.append({'engine': 'vectorized', 'rows': rows, 'seconds': elapsed, 'rows_per_sec': rows / elapsed})
+
+    for result in results:
+        print(f"  {result['engine']:<10} {result['rows']:>11,} rows  {result['seconds']:8.3f}s  {result['rows_per_sec']:>13,.0f} rows/sec")
+    return pd.DataFrame(results)
+
+def generate_all_simulated_data(locations=None):
     """Generate all simulated data"""
-    weather_df = generate_weather_data(500)
+    weather_df = generate_weather_data(500, locations=locations)
     fire_df = generate_fire_data(25)
     return weather_df, fire_df
 
 if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        benchmark_weather_generation()
+        sys.exit(0)
+
     weather_data, fire_data = generate_all_simulated_data()
     print(f"Generated {len(weather_data)} weather records")
     print(f"Generated {len(fire_data)} fire records")
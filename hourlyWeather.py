@@ -0,0 +1,276 @@
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import runMetrics
+import tableSchemas
+from collectRealData import HOURLY_WINDOW_DAYS, OPEN_METEO_ARCHIVE_URL, iter_open_meteo_weather
+from fireRiskScoring import risk_scores
+from ingestPipeline import StoreSink
+from localStore import STORE_ROOT, prune_partitions, read_table
+
+# NWS red-flag criteria for the Bay Area: humidity at or below 15% together with sustained
+# wind of 25 mph or gusts of 35 mph
+RED_FLAG_HUMIDITY = 15
+RED_FLAG_WIND_MPH = 25.0
+RED_FLAG_GUST_MPH = 35.0
+HUMIDITY_THRESHOLDS = (15, 25)
+
+# Rows buffered per table before each store write
+FLUSH_ROWS = 200_000
+HOURLY_TABLES = ('weather_hourly', 'fire_weather_daily', 'weather_data')
+
+# Sort key layout: station code | day + _DAY_OFFSET | hour (5 bits)
+_DAY_OFFSET = 1 << 31
+_NO_HOUR = 99
+
+
+def _empty_rollups():
+    return tableSchemas.empty_frame('weather_data'), tableSchemas.empty_frame('fire_weather_daily')
+
+
+def rollup_hours(hourly):
+    """Daily weather_data rows and fire_weather_daily rollups from weather_hourly rows, in one pass.
+
+    Rows are ordered by (location, date, hour) (a no-op for collector output), repeated hours are
+    dropped, and every daily value is a reduceat over each station-day's contiguous run of hours.
+    weather_data follows the Open-Meteo daily definitions: maximum temperature and wind, mean
+    humidity and pressure, summed sunshine and the wind-weighted dominant direction, plus the
+    minimum temperature; precipitation is not requested hourly and stays null.
+    """
+    if hourly.empty:
+        return _empty_rollups()
+    locations = hourly['location']
+    if not isinstance(locations.dtype, pd.CategoricalDtype):
+        locations = locations.astype('category')
+    codes = locations.cat.codes.to_numpy().astype(np.int64)
+    days = hourly['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    hours = hourly['hour'].to_numpy().astype(np.int64)
+    keys = (codes << 37) | ((days + _DAY_OFFSET) << 5) | hours
+    order = np.argsort(keys, kind='stable') if np.any(keys[1:] < keys[:-1]) else np.arange(len(keys))
+    keys = keys[order]
+    # Keep the last copy of a repeated hour
+    last = np.r_[keys[1:] != keys[:-1], True]
+    order, keys = order[last], keys[last]
+
+    def column(name):
+        return hourly[name].to_numpy(np.float64)[order]
+
+    temperature, humidity, wind, gust = column('temperature'), column('humidity'), column('wind_speed'), column('wind_gust')
+    direction, pressure, sunshine = np.radians(column('wind_deg')), column('pressure'), column('sunshine')
+    hours = hours[order]
+
+    day_keys = keys >> 5
+    starts = np.flatnonzero(np.r_[True, day_keys[1:] != day_keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+
+    def total(values):
+        return np.add.reduceat(values, starts)
+
+    temp_max = np.maximum.reduceat(temperature, starts)
+    hum = np.round(total(humidity) / counts)
+    wind_max = np.maximum.reduceat(wind, starts)
+    sun = total(sunshine)
+    dominant = np.degrees(np.arctan2(total(wind * np.sin(direction)), total(wind * np.cos(direction)))) % 360
+
+    # Red-flag hours, and for each hour the length of the red-flag run ending there; a run
+    # never carries over from the previous day
+    red_flag = (humidity <= RED_FLAG_HUMIDITY) & ((wind >= RED_FLAG_WIND_MPH) | (gust >= RED_FLAG_GUST_MPH))
+    index = np.arange(len(keys))
+    breaks = np.where(red_flag, -1, index)
+    breaks[starts] = np.maximum(breaks[starts], starts - 1)
+    run = np.where(red_flag, index - np.maximum.accumulate(breaks), 0)
+    first_hour = np.minimum.reduceat(np.where(red_flag, hours, _NO_HOUR), starts)
+
+    day_codes = (keys[starts] >> 37).astype(np.int32)
+    day_dates = ((day_keys[starts] & 0xFFFFFFFF) - _DAY_OFFSET).astype('datetime64[D]').astype(tableSchemas.DATE_DTYPE)
+    day_locations = pd.Categorical.from_codes(day_codes, dtype=locations.dtype)
+
+    daily = pd.DataFrame({
+        'location': day_locations,
+        'date': day_dates,
+        'temp_max': np.round(temp_max, 1).astype(np.float32),
+        'humidity': hum.astype(np.int8),
+        'wind_speed': np.round(wind_max, 1).astype(np.float32),
+        'wind_deg': np.round(dominant).astype(np.int16) % 360,
+        'pressure': np.round(total(pressure) / counts).astype(np.int16),
+        'visibility': np.full(len(starts), 15000, dtype=np.int32),
+        'uvi': np.clip((sun / 3600) * 0.8, 0, 10).astype(np.float32),
+        'fire_risk_score': risk_scores(temp_max, hum, wind_max, sun, version='open_meteo_v1').astype(np.float32),
+        'temp_min': np.round(np.minimum.reduceat(temperature, starts), 1).astype(np.float32),
+        'sunshine': np.round(sun).astype(np.int32),
+        'source': pd.Categorical.from_codes(np.zeros(len(starts), dtype=np.int8), categories=['open_meteo_hourly'])
+    }).reindex(columns=tableSchemas.columns('weather_data'))
+    daily = tableSchemas.to_typed(daily, 'weather_data')
+
+    rollups = pd.DataFrame({
+        'location': day_locations,
+        'date': day_dates,
+        'hours_observed': counts.astype(np.int8),
+        'min_humidity': np.minimum.reduceat(humidity, starts).astype(np.int8),
+        'max_gust': np.round(np.maximum.reduceat(gust, starts), 1).astype(np.float32),
+        **{f"hours_rh_below_{threshold}": total(humidity < threshold).astype(np.int8)
+           for threshold in HUMIDITY_THRESHOLDS},
+        'red_flag_hours': total(red_flag).astype(np.int8),
+        'longest_red_flag_run': np.maximum.reduceat(run, starts).astype(np.int8),
+        'first_red_flag_hour': np.where(first_hour == _NO_HOUR, -1, first_hour).astype(np.int8)
+    }, columns=tableSchemas.columns('fire_weather_daily'))
+    return daily, rollups
+
+
+def ingest_hourly(locations=None, date_ranges=None, root=STORE_ROOT, incremental=False, keep_years=None,
+                  flush_rows=FLUSH_ROWS, base_url=OPEN_METEO_ARCHIVE_URL, max_workers=8, requests_per_second=5.0,
+                  cache=None, stats=None):
+    """Stream hourly Open-Meteo windows into the store, rolling each window up as it arrives.
+
+    Windows cover whole local days, so a window's daily rows are final as soon as it lands. The
+    hourly rows, their fire_weather_daily rollups and the weather_data rows derived from them go
+    to one StoreSink per table, so memory holds the windows in flight plus flush_rows per table
+    however long the history is. With incremental=True only station-days missing from
+    fire_weather_daily are requested. keep_years prunes weather_hourly year partitions older
+    than that many years after the run; the daily tables are kept in full.
+    """
+    stats = stats if stats is not None else {}
+    existing = read_table('fire_weather_daily', root, columns=['location', 'date']) if incremental else None
+    sinks = {table_name: StoreSink(table_name, root, flush_rows) for table_name in HOURLY_TABLES}
+    rows = dict.fromkeys(HOURLY_TABLES, 0)
+
+    start = time.perf_counter()
+    with runMetrics.span('ingest_hourly') as span:
+        for hourly in iter_open_meteo_weather(locations, date_ranges, base_url, max_workers, requests_per_second,
+                                              HOURLY_WINDOW_DAYS, stats=stats, cache=cache, existing=existing,
+                                              resolution='hourly'):
+            daily, rollups = rollup_hours(hourly)
+            for table_name, frame in zip(HOURLY_TABLES, (hourly, rollups, daily)):
+                sinks[table_name].write(frame)
+                rows[table_name] += len(frame)
+        written = {table_name: sink.close()['new_rows'] for table_name, sink in sinks.items()}
+        pruned = prune_partitions('weather_hourly', root, keep_years) if keep_years else 0
+        span.update({'hours': rows['weather_hourly'], 'days': rows['weather_data'], 'pruned_partitions': pruned})
+    runMetrics.record_rows('ingest_hourly', rows['weather_hourly'])
+
+    elapsed = time.perf_counter() - start
+    print(f"  {rows['weather_hourly']:,} hours -> {rows['weather_data']:,} station-days "
+          f"({stats.get('requests', 0)} requests) in {elapsed:.2f}s; new rows stored: {written}"
+          + (f"; pruned {pruned} old hourly partitions" if pruned else ""))
+    return {'rows': rows, 'written': written, 'pruned_partitions': pruned, 'wall_time_s': round(elapsed, 3)}
+
+
+def _rollups_per_day(hourly):
+    """Reference implementation: a groupby with a Python loop over each day's hours"""
+    rows = []
+    for (location, date), day in hourly.groupby(['location', 'date'], observed=True, sort=True):
+        day = day.drop_duplicates('hour', keep='last').sort_values('hour')
+        humidity, gust = day['humidity'].to_numpy(), day['wind_gust'].to_numpy(np.float64)
+        flags = (humidity <= RED_FLAG_HUMIDITY) & ((day['wind_speed'].to_numpy(np.float64) >= RED_FLAG_WIND_MPH)
+                                                   | (gust >= RED_FLAG_GUST_MPH))
+        longest = current = 0
+        for flag in flags:
+            current = current + 1 if flag else 0
+            longest = max(longest, current)
+        rows.append({'location': location, 'date': date, 'hours_observed': len(day), 'min_humidity': humidity.min(),
+                     'max_gust': round(gust.max(), 1),
+                     **{f"hours_rh_below_{threshold}": int((humidity < threshold).sum())
+                        for threshold in HUMIDITY_THRESHOLDS},
+                     'red_flag_hours': int(flags.sum()), 'longest_red_flag_run': longest,
+                     'first_red_flag_hour': int(day['hour'].to_numpy()[flags][0]) if flags.any() else -1,
+                     'temp_max': day['temperature'].max(), 'humidity': round(humidity.mean())})
+    return pd.DataFrame(rows)
+
+
+def _collect_hourly(stub_url, locations, date_ranges):
+    frames = iter_open_meteo_weather(locations, date_ranges, stub_url, requests_per_second=None,
+                                     max_window_days=HOURLY_WINDOW_DAYS, resolution='hourly')
+    return tableSchemas.concat(list(frames), 'weather_hourly')
+
+
+def verify_rollups(date_ranges=(('2020-08-20', '2020-10-15'),)):
+    """Check rollups against a per-day reference, and the streamed store against a single batch pass"""
+    from devStubs import StubServer
+    from collectRealData import OPEN_METEO_LOCATIONS
+    locations = OPEN_METEO_LOCATIONS[:3]
+    with StubServer() as stub:
+        hourly = _collect_hourly(stub.url, locations, date_ranges)
+        # Shuffled, with repeated hours, so ordering and duplicates are exercised
+        shuffled = tableSchemas.concat([hourly, hourly.iloc[:100]]).sample(frac=1, random_state=0)
+        daily, rollups = rollup_hours(shuffled)
+        expected = _rollups_per_day(hourly)
+
+        mismatched = [name for name in expected.columns if name not in ('location', 'date')
+                      and not np.allclose((rollups if name in rollups else daily)[name].to_numpy(np.float64),
+                                          expected[name].to_numpy(np.float64), atol=0.051)]
+        print(f"  {len(hourly):,} hours -> {len(rollups)} station-days "
+              f"({int((rollups['red_flag_hours'] > 0).sum())} with red-flag hours), "
+              f"mismatched vs per-day reference: {mismatched or 'none'}")
+
+        with tempfile.TemporaryDirectory() as root:
+            ingest_hourly(locations, list(date_ranges), root, flush_rows=2_000, base_url=stub.url,
+                          requests_per_second=None)
+            stored = {table_name: read_table(table_name, root) for table_name in HOURLY_TABLES}
+            requests_before = stub.request_count
+            ingest_hourly(locations, list(date_ranges), root, incremental=True, base_url=stub.url,
+                          requests_per_second=None)
+            rerun_requests = stub.request_count - requests_before
+
+    keys = ['location', 'date']
+    streamed_ok = all(
+        len(stored[table_name]) == len(frame) and stored[table_name].astype({'location': str}).sort_values(
+            keys + (['hour'] if table_name == 'weather_hourly' else []), ignore_index=True).equals(
+            frame.astype({'location': str}).sort_values(keys + (['hour'] if table_name == 'weather_hourly' else []),
+                                                        ignore_index=True))
+        for table_name, frame in zip(HOURLY_TABLES, (hourly, rollups, daily)))
+    print(f"  streamed store == single batch pass: {streamed_ok}; incremental re-run made {rerun_requests} requests")
+    return not mismatched and streamed_ok and rerun_requests == 0
+
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(path) for name in names)
+
+
+def benchmark_hourly(num_stations=20, start_date='2023-01-01', end_date='2023-12-31'):
+    """Stream a year of hourly data per station from the local stub into a scratch store"""
+    from devStubs import StubServer
+    from stationRegistry import StationRegistry
+    locations = StationRegistry.synthetic(num_stations).locations()
+    with StubServer() as stub, tempfile.TemporaryDirectory() as root:
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        report = ingest_hourly(locations, [(start_date, end_date)], root, base_url=stub.url,
+                               requests_per_second=None, max_workers=4)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        hours = report['rows']['weather_hourly']
+        hourly_bytes = _directory_bytes(os.path.join(root, 'weather_hourly'))
+        daily_bytes = _directory_bytes(os.path.join(root, 'weather_data'))
+    print(f"{num_stations} stations, {hours:,} hours in {report['wall_time_s']:.2f}s "
+          f"({hours / report['wall_time_s']:,.0f} hours/s including the stub); peak RSS {rss_after:.0f} MB "
+          f"(+{rss_after - rss_before:.0f} MB); on disk {hourly_bytes / hours:.1f} bytes per hour, "
+          f"{daily_bytes / report['rows']['weather_data']:.1f} bytes per weather_data row")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hourly weather ingestion with daily fire-weather rollups")
+    parser.add_argument('--store-root', default=STORE_ROOT)
+    parser.add_argument('--incremental', action='store_true', help="fetch only station-days not rolled up yet")
+    parser.add_argument('--keep-years', type=int, help="keep only this many years of hourly partitions")
+    parser.add_argument('--verify', action='store_true', help="check rollups against a per-day reference")
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        print("Checking hourly rollups against the per-day reference...")
+        return 0 if verify_rollups() else 1
+    if args.benchmark:
+        benchmark_hourly()
+        return 0
+    print("Collecting hourly weather from Open-Meteo...")
+    ingest_hourly(root=args.store_root, incremental=args.incremental, keep_years=args.keep_years)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+import tableSchemas
+from localStore import STORE_ROOT, read_fire_history, read_weather
+from stationRegistry import match_fires
+
+OUTPUT_PATH = './data/features/ignition_windows.parquet'
+WINDOW_DAYS = 14
+NEAREST_STATIONS = 3
+# Same cut-off the notebook uses for high-risk weather
+HIGH_RISK_SCORE = 0.6
+STATIONS_PER_READ = 500
+
+# column -> aggregates taken over each window
+WINDOW_AGGREGATES = {
+    'temp_max': ('mean', 'max'),
+    'humidity': ('mean', 'min'),
+    'wind_speed': ('mean', 'max'),
+    'fire_risk_score': ('mean', 'max')
+}
+FIRE_COLUMNS = ['fire_name', 'fire_year', 'alarm_date']
+
+# Days are shifted into 32 unsigned bits below the station code in the sort key
+_DAY_OFFSET = 1 << 31
+
+
+def _days(values):
+    return pd.to_datetime(values).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def _station_codes(locations, names):
+    """Position of each location in names (-1 if absent), mapping categories rather than every row"""
+    names = pd.Index(names)
+    if isinstance(locations.dtype, pd.CategoricalDtype):
+        lookup = names.get_indexer(locations.cat.categories.astype(str))
+        codes = locations.cat.codes.to_numpy()
+        return np.where(codes >= 0, lookup[codes], -1)
+    return names.get_indexer(locations.astype(str))
+
+
+def _sort_keys(station_codes, days):
+    return (station_codes.astype(np.int64) << 32) | (days + _DAY_OFFSET)
+
+
+def window_features(pairs, weather, window_days=WINDOW_DAYS):
+    """Aggregate each (fire, station) pair's weather over the window_days before its alarm_date.
+
+    Weather is sorted once by (station, day); every window is then a contiguous slice found with
+    two binary searches, and sums/counts come from prefix sums, so the cost is one sort plus
+    O(log n) per pair instead of a filter per fire. Days before the alarm day are counted; the
+    alarm day itself is not.
+    """
+    names = pd.unique(pairs['location'].astype(str))
+    station = _station_codes(weather['location'], names)
+    keep = station >= 0
+    keys = _sort_keys(station[keep], _days(weather['date'])[keep])
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    # Drop repeated station-days so a duplicated row is not counted twice
+    first = np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.array([], dtype=bool)
+    keys, order = keys[first], order[first]
+
+    pair_station = _station_codes(pairs['location'], names)
+    alarm = _days(pairs['alarm_date'])
+    lo = np.searchsorted(keys, _sort_keys(pair_station, alarm - window_days))
+    hi = np.searchsorted(keys, _sort_keys(pair_station, alarm))
+    empty = hi == lo
+    # reduceat also reduces the gap between one window's end and the next window's start;
+    # visiting windows in start order keeps those gaps to a single pass over the rows
+    by_start = np.argsort(lo, kind='stable')
+    bounds = np.column_stack([lo[by_start], hi[by_start]]).ravel()
+
+    out = pairs.reset_index(drop=True).copy()
+    out['window_start'] = (alarm - window_days).astype('datetime64[D]')
+    out['days_observed'] = (hi - lo).astype(np.int16)
+    for column, aggregates in WINDOW_AGGREGATES.items():
+        values = weather[column].to_numpy(np.float64, na_value=np.nan)[keep][order]
+        observed = ~np.isnan(values)
+        totals = np.concatenate([[0.0], np.cumsum(np.where(observed, values, 0.0))])
+        counts = np.concatenate([[0], np.cumsum(observed)])
+        n = counts[hi] - counts[lo]
+        # A trailing NaN keeps reduceat's indices in range when a window ends at the last row
+        padded = np.append(values, np.nan)
+        for aggregate in aggregates:
+            if aggregate == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = (totals[hi] - totals[lo]) / n
+            else:
+                reduce = np.fmax if aggregate == 'max' else np.fmin
+                result = np.empty(len(lo))
+                result[by_start] = reduce.reduceat(padded, bounds)[::2] if len(bounds) else []
+            out[f"{column}_{aggregate}"] = np.where(empty | (n == 0), np.nan, result).astype(np.float32)
+
+    # Compare in the column's own dtype, as pandas and SQL do (a float32 0.6 is not > 0.6)
+    scores = weather['fire_risk_score'].to_numpy(na_value=np.nan)[keep][order]
+    risky = np.concatenate([[0], np.cumsum(scores > HIGH_RISK_SCORE)])
+    out['high_risk_days'] = (risky[hi] - risky[lo]).astype(np.int16)
+    return out
+
+
+def build_window_table(fires, weather=None, root=STORE_ROOT, window_days=WINDOW_DAYS, k=NEAREST_STATIONS,
+                       registry=None, stations_per_read=STATIONS_PER_READ):
+    """Pre-ignition weather windows for every fire at its k nearest stations.
+
+    Without an in-memory weather frame the store is read stations_per_read stations at a time,
+    pruned to those stations and to the date span of the fires, so memory follows the chunk
+    rather than the size of the weather history.
+    """
+    fires = tableSchemas.to_typed(fires, 'fire_history').dropna(subset=['alarm_date'])
+    pairs = match_fires(fires, registry, k, columns=FIRE_COLUMNS)
+    if pairs.empty:
+        return pairs
+    if weather is not None:
+        table = window_features(pairs, weather, window_days)
+    else:
+        start = pairs['alarm_date'].min() - pd.Timedelta(days=window_days)
+        end = pairs['alarm_date'].max()
+        stations = pd.unique(pairs['location'])
+        columns = ['location', 'date'] + list(WINDOW_AGGREGATES)
+        parts = []
+        for i in range(0, len(stations), stations_per_read):
+            names = list(stations[i:i + stations_per_read])
+            chunk_weather = read_weather(root, locations=names, start_date=start, end_date=end, columns=columns)
+            if chunk_weather.empty:
+                chunk_weather = tableSchemas.empty_frame('weather_data')
+            parts.append(window_features(pairs[pairs['location'].isin(names)], chunk_weather, window_days))
+        table = pd.concat(parts, ignore_index=True)
+    return table.sort_values(['alarm_date', 'fire_name', 'rank'], ignore_index=True)
+
+
+def _latest_snapshot(table_name, data_dir='./data'):
+    snapshots = sorted(glob.glob(os.path.join(data_dir, f"{table_name}_*.csv")))
+    return pd.read_csv(snapshots[-1]) if snapshots else pd.DataFrame()
+
+
+def _window_features_per_fire(pairs, weather, window_days=WINDOW_DAYS):
+    """Reference implementation: filter the weather separately for every (fire, station) pair"""
+    weather = weather.assign(location=weather['location'].astype(str), date=pd.to_datetime(weather['date']))
+    weather = weather.drop_duplicates(['location', 'date'])
+    rows = []
+    for pair in pairs.itertuples(index=False):
+        alarm = pd.Timestamp(pair.alarm_date)
+        window = weather[(weather['location'] == pair.location) & (weather['date'] >= alarm - pd.Timedelta(days=window_days))
+                         & (weather['date'] < alarm)]
+        row = {'days_observed': len(window), 'high_risk_days': int((window['fire_risk_score'] > HIGH_RISK_SCORE).sum())}
+        for column, aggregates in WINDOW_AGGREGATES.items():
+            for aggregate in aggregates:
+                row[f"{column}_{aggregate}"] = getattr(window[column].astype(np.float64), aggregate)()
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _sample(num_stations, num_fires, seed=0, start_date='2017-01-01', end_date='2024-12-31'):
+    from generateSimulatedData import generate_weather_data_vectorized
+    from stationRegistry import CALIFORNIA_BOUNDS, StationRegistry
+    rng = np.random.default_rng(seed)
+    registry = StationRegistry.synthetic(num_stations, seed=seed)
+    weather = generate_weather_data_vectorized(start_date, end_date, locations=num_stations, seed=seed)
+    min_lat, max_lat, min_lon, max_lon = CALIFORNIA_BOUNDS
+    alarm = pd.to_datetime(start_date) + pd.to_timedelta(
+        rng.integers(0, (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days, num_fires), unit='D')
+    fires = pd.DataFrame({'fire_name': [f"Fire {i}" for i in range(num_fires)], 'fire_year': alarm.year,
+                          'alarm_date': alarm, 'contained_date': alarm + pd.Timedelta(days=7), 'acres': 100.0,
+                          'cause': 'Lightning', 'latitude': rng.uniform(min_lat, max_lat, num_fires),
+                          'longitude': rng.uniform(min_lon, max_lon, num_fires), 'county': 'Napa'})
+    return registry, weather, fires
+
+
+def verify_windows(num_stations=40, num_fires=300, seed=0):
+    """Check the sorted range join against per-fire filtering"""
+    registry, weather, fires = _sample(num_stations, num_fires, seed, '2022-01-01', '2024-12-31')
+    # Gaps and duplicates, so windows are ragged and duplicated days must not be double counted
+    weather = weather[np.random.default_rng(seed).random(len(weather)) < 0.7]
+    weather = tableSchemas.concat([weather, weather.iloc[:500]])
+    table = build_window_table(fires, weather, window_days=21, registry=registry)
+    expected = _window_features_per_fire(table, weather, 21)
+    mismatched = [column for column in expected.columns
+                  if not np.allclose(table[column].to_numpy(np.float64), expected[column].to_numpy(np.float64),
+                                     rtol=1e-5, equal_nan=True)]
+    print(f"  {len(table):,} fire-station windows, mismatched columns: {mismatched or 'none'}")
+    return not mismatched
+
+
+def benchmark_windows(num_stations=2000, num_fires=20_000, seed=0):
+    """Range join over a synthetic California history vs per-fire filtering on a sample"""
+    registry, weather, fires = _sample(num_stations, num_fires, seed)
+    start = time.perf_counter()
+    table = build_window_table(fires, weather, registry=registry)
+    elapsed = time.perf_counter() - start
+    sample = table.iloc[:100]
+    start = time.perf_counter()
+    _window_features_per_fire(sample, weather)
+    per_pair = (time.perf_counter() - start) / len(sample)
+    print(f"{num_fires:,} fires x {NEAREST_STATIONS} stations against {len(weather):,} weather rows: {elapsed:.2f}s "
+          f"({elapsed / len(table) * 1e6:.1f} us per window); per-fire filtering ~{per_pair * len(table):,.0f}s "
+          f"({per_pair * 1000:.1f} ms per window)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Weather before each fire's alarm date at its nearest stations")
+    parser.add_argument('--window-days', type=int, default=WINDOW_DAYS)
+    parser.add_argument('--stations', type=int, default=NEAREST_STATIONS, help="nearest stations per fire")
+    parser.add_argument('--store-root', default=STORE_ROOT)
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--verify', action='store_true', help="check the range join against per-fire filtering")
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        print("Checking pre-ignition windows against per-fire filtering...")
+        return 0 if verify_windows() else 1
+    if args.benchmark:
+        benchmark_windows()
+        return 0
+
+    fires = read_fire_history(args.store_root)
+    fires = fires if not fires.empty else _latest_snapshot('fire_history')
+    # Fall back to the newest CSV snapshot when the store holds no weather yet
+    weather = None if os.path.isdir(os.path.join(args.store_root, 'weather_data')) else _latest_snapshot('weather_data')
+    start = time.perf_counter()
+    table = build_window_table(fires, weather, args.store_root, args.window_days, args.stations)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    table.to_parquet(args.output, index=False)
+    covered = table.groupby(['fire_name', 'fire_year'])['days_observed'].max()
+    print(f"{len(covered)} fires, {len(table)} fire-station windows of {args.window_days} days "
+          f"({(covered > 0).sum()} fires with weather) in {time.perf_counter() - start:.3f}s -> {args.output}")
+    with pd.option_context('display.width', 200, 'display.max_columns', 12):
+        print(table[table['rank'] == 1].head(10))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+IMAGES_DIR = './data/sentinel_images'
+FEATURE_CACHE_PATH = './data/cache/image_features.parquet'
+THUMBNAIL_DIR = './data/cache/thumbnails'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff')
+
+# Bump when the feature definitions change so cached rows are recomputed
+FEATURE_VERSION = 1
+ANALYSIS_SIZE = 256
+THUMBNAIL_SIZE = 128
+HUE_BINS = 12
+BRIGHTNESS_BINS = 8
+
+# vegetation_state thresholds on the pixel-class fractions; anything in between is 'ambiguous'
+GREEN_FRACTION_MIN = 0.35
+DRY_FRACTION_MIN = 0.35
+BURN_FRACTION_MIN = 0.20
+SCAR_FRACTION_MIN = 0.15
+STATE_MARGIN = 0.15
+
+
+def content_hash(path, block_size=1 << 20):
+    """blake2b digest of a file's bytes, the cache key for its features"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_downsampled(path, size=ANALYSIS_SIZE):
+    """Decode an image straight to roughly size x size pixels.
+
+    For JPEGs, draft() lets the decoder scale by 1/2-1/8 during the inverse DCT, so a 3800px
+    capture is never materialised at full resolution.
+    """
+    with Image.open(path) as image:
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        image.thumbnail((size, size), Image.Resampling.BILINEAR)
+        return image.copy()
+
+
+def rgb_features(rgb):
+    """Vegetation and dryness features of an RGB uint8 array (H, W, 3)"""
+    pixels = rgb.reshape(-1, 3).astype(np.float32) / 255.0
+    r, g, b = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+    total = r + g + b + 1e-6
+    brightness = total / 3
+    high, low = pixels.max(axis=1), pixels.min(axis=1)
+    saturation = np.where(high > 0, (high - low) / (high + 1e-6), 0)
+
+    # Hue in [0, 1) from the usual RGB -> HSV sector formula
+    chroma = high - low + 1e-6
+    hue = np.where(high == r, ((g - b) / chroma) % 6, np.where(high == g, (b - r) / chroma + 2, (r - g) / chroma + 4)) / 6
+
+    excess_green = (2 * g - r - b) / total
+    green = (excess_green > 0.05) & (g > r) & (brightness > 0.08)
+    dry = (r >= g) & (g > b) & (saturation > 0.15) & (brightness > 0.25) & (hue < 0.17) & ~green
+    burned = (brightness < 0.18) | ((saturation < 0.12) & (brightness < 0.35))
+    flame = (r > 0.7) & (r > 1.5 * g) & (r > 2 * b)
+    # Burn scars show up magenta in the false-colour (SWIR) composites
+    scar = (r > g * 1.1) & (b > g * 1.1) & (saturation > 0.15)
+
+    features = {
+        'mean_r': r.mean(), 'mean_g': g.mean(), 'mean_b': b.mean(),
+        'mean_brightness': brightness.mean(),
+        'mean_saturation': saturation.mean(),
+        'excess_green': excess_green.mean(),
+        'vari': np.mean((g - r) / (g + r - b + 1e-6).clip(1e-3)),
+        'green_fraction': green.mean(),
+        'dry_fraction': dry.mean(),
+        'burn_fraction': burned.mean(),
+        'flame_fraction': flame.mean(),
+        'scar_fraction': scar.mean()
+    }
+    features = {name: np.float32(value) for name, value in features.items()}
+    features['hue_hist'] = np.histogram(hue, bins=HUE_BINS, range=(0, 1))[0].astype(np.float32) / len(hue)
+    features['brightness_hist'] = np.histogram(brightness, bins=BRIGHTNESS_BINS, range=(0, 1))[0].astype(np.float32) / len(hue)
+    return features
+
+
+def vegetation_state(green_fraction, dry_fraction, burn_fraction, flame_fraction, scar_fraction):
+    """Classify feature arrays as green/dry/burned, or ambiguous when no class clearly dominates"""
+    green_fraction, dry_fraction = np.asarray(green_fraction), np.asarray(dry_fraction)
+    state = np.full(len(green_fraction), 'ambiguous', dtype=object)
+    state[(green_fraction >= GREEN_FRACTION_MIN) & (green_fraction - dry_fraction >= STATE_MARGIN)] = 'green'
+    state[(dry_fraction >= DRY_FRACTION_MIN) & (dry_fraction - green_fraction >= STATE_MARGIN)] = 'dry'
+    state[(np.asarray(burn_fraction) >= BURN_FRACTION_MIN) | (np.asarray(flame_fraction) >= 0.05)
+          | (np.asarray(scar_fraction) >= SCAR_FRACTION_MIN)] = 'burned'
+    return state
+
+
+def extract_features(path, thumbnail_dir=THUMBNAIL_DIR, digest=None):
+    """Decode one image, compute its features and write its thumbnail (runs in a worker process)"""
+    start = time.perf_counter()
+    digest = digest or content_hash(path)
+    with Image.open(path) as image:
+        width, height, image_format = image.width, image.height, image.format
+    small = load_downsampled(path)
+    features = rgb_features(np.asarray(small))
+
+    thumbnail_path = None
+    if thumbnail_dir:
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        thumbnail_path = os.path.join(thumbnail_dir, f"{digest}.jpg")
+        thumbnail = small.copy()
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        thumbnail.save(thumbnail_path, 'JPEG', quality=85)
+
+    features.update({
+        'content_hash': digest, 'feature_version': FEATURE_VERSION, 'filename': os.path.basename(path),
+        'format': image_format, 'width': width, 'height': height, 'thumbnail_path': thumbnail_path,
+        'extract_ms': np.float32((time.perf_counter() - start) * 1000)
+    })
+    return features
+
+
+def _extract_task(args):
+    return extract_features(*args)
+
+
+def load_feature_cache(path=FEATURE_CACHE_PATH):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    cache = pd.read_parquet(path)
+    return cache[cache['feature_version'] == FEATURE_VERSION]
+
+
+def image_features(directory=IMAGES_DIR, cache_path=FEATURE_CACHE_PATH, thumbnail_dir=THUMBNAIL_DIR,
+                   max_workers=None, stats=None):
+    """Features for every image in a folder, extracting only content not already in the cache.
+
+    Files are hashed in this process; cache misses are decoded across a process pool. Renamed
+    or copied images hit the cache because the key is their content, not their path. Returns one
+    row per file, with vegetation_state and needs_model (ambiguous images worth a model call).
+    """
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    hashes = [content_hash(path) for path in paths]
+    cache = load_feature_cache(cache_path)
+    cached = set(cache['content_hash']) if len(cache) else set()
+
+    pending, seen = [], set()
+    for path, digest in zip(paths, hashes):
+        if digest not in cached and digest not in seen:
+            pending.append((path, thumbnail_dir, digest))
+            seen.add(digest)
+
+    extracted = []
+    if pending:
+        if max_workers == 1 or len(pending) == 1:
+            extracted = [_extract_task(task) for task in pending]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                extracted = list(pool.map(_extract_task, pending, chunksize=max(1, len(pending) // 32)))
+        cache = pd.concat([cache, pd.DataFrame(extracted)], ignore_index=True)
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        cache.to_parquet(cache_path, index=False)
+
+    if stats is not None:
+        stats.update({'images': len(paths), 'extracted': len(extracted), 'cache_hits': len(paths) - len(pending)})
+
+    if not paths:
+        return pd.DataFrame()
+    by_hash = cache.drop_duplicates('content_hash', keep='last').set_index('content_hash')
+    features = by_hash.loc[hashes].reset_index()
+    features['filename'] = [os.path.basename(path) for path in paths]
+    features['vegetation_state'] = pd.Categorical(
+        vegetation_state(features['green_fraction'], features['dry_fraction'],
+                         features['burn_fraction'], features['flame_fraction'], features['scar_fraction']),
+        categories=['green', 'dry', 'burned', 'ambiguous'])
+    features['needs_model'] = features['vegetation_state'] == 'ambiguous'
+    return features
+
+
+def join_to_weather(weather, features, uri_column='image_uri'):
+    """Attach image features to weather rows by the image each row was matched to.
+
+    weather is typically temporalJoin.fuse() output, whose image_uri ends in the file name.
+    """
+    columns = ['filename', 'vegetation_state', 'needs_model', 'green_fraction', 'dry_fraction',
+               'burn_fraction', 'excess_green', 'content_hash']
+    filenames = weather[uri_column].astype(str).str.rsplit('/', n=1).str[-1]
+    joined = weather.assign(image_filename=filenames).merge(
+        features[columns].rename(columns={'filename': 'image_filename', 'content_hash': 'image_hash'}),
+        on='image_filename', how='left')
+    return joined.drop(columns='image_filename')
+
+
+def benchmark_features(num_images=48, size=(2400, 1450), directory='./data/cache/image_benchmark'):
+    """Time feature extraction on synthetic captures: full decode vs draft decode, serial vs pool, cached"""
+    import shutil
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    rng = np.random.default_rng(0)
+    for i in range(num_images):
+        base = rng.integers(40, 200, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        Image.fromarray(base).resize(size, Image.Resampling.BILINEAR).save(
+            os.path.join(directory, f"capture_{i:04d}.jpg"), quality=90)
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+    start = time.perf_counter()
+    for path in paths:
+        with Image.open(path) as image:
+            rgb_features(np.asarray(image.convert('RGB').resize((ANALYSIS_SIZE, ANALYSIS_SIZE))))
+    full = time.perf_counter() - start
+    print(f"  Full-resolution decode: {num_images} images in {full:.2f}s")
+
+    cache_path = os.path.join(directory, 'features.parquet')
+    thumbnails = os.path.join(directory, 'thumbnails')
+    for workers in (1, None):
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        start = time.perf_counter()
+        image_features(directory, cache_path, thumbnails, max_workers=workers)
+        label = 'serial' if workers == 1 else f"pool of {os.cpu_count()}"
+        print(f"  Draft decode + features ({label}): {num_images} images in {time.perf_counter() - start:.2f}s")
+
+    stats = {}
+    start = time.perf_counter()
+    image_features(directory, cache_path, thumbnails, stats=stats)
+    print(f"  Cached re-run: {time.perf_counter() - start:.3f}s ({stats['cache_hits']} cache hits)")
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        benchmark_features()
+    else:
+        stats = {}
+        features = image_features(stats=stats)
+        print(f"Image features: {stats['images']} images, {stats['extracted']} extracted, {stats['cache_hits']} cached")
+        with pd.option_context('display.width', 200, 'display.max_columns', 20):
+            print(features[['filename', 'vegetation_state', 'green_fraction', 'dry_fraction', 'burn_fraction',
+                            'scar_fraction', 'excess_green']])
@@ -0,0 +1,430 @@
+import argparse
+import queue
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from fireRiskScoring import score_frame
+from generateSimulatedData import iter_weather_data
+from localStore import STORE_ROOT, write_table
+import tableSchemas
+import runMetrics
+from uploadManifest import UPSERT_KEYS, diff_rows, merge_sql, update_manifest
+
+DEFAULT_BATCH_ROWS = 50_000
+# Days of keys RollingKeyDeduper remembers on either side of the batch it is deduplicating
+DEDUPE_WINDOW_DAYS = 31
+
+
+class StageMetrics:
+    """Rows, batches and time spent in one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def report(self, upstream_seconds=0.0):
+        own = max(self.seconds - upstream_seconds, 0.0)
+        return {
+            'stage': self.name,
+            'rows': self.rows,
+            'batches': self.batches,
+            'seconds': round(own, 3),
+            'rows_per_sec': round(self.rows / own, 1) if own > 0 else None
+        }
+
+
+def _metered(batches, metrics):
+    """Pass batches through while timing how long each one takes to produce"""
+    iterator = iter(batches)
+    while True:
+        start = time.perf_counter()
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            metrics.seconds += time.perf_counter() - start
+            return
+        metrics.seconds += time.perf_counter() - start
+        metrics.rows += len(batch)
+        metrics.batches += 1
+        yield batch
+
+
+def rebatch(frames, batch_rows=DEFAULT_BATCH_ROWS):
+    """Regroup frames of any size into batches of exactly batch_rows (the last may be shorter)"""
+    pending, pending_rows = [], 0
+    for frame in frames:
+        while len(frame):
+            take = frame.iloc[:batch_rows - pending_rows]
+            frame = frame.iloc[len(take):]
+            pending.append(take)
+            pending_rows += len(take)
+            if pending_rows == batch_rows:
+                yield tableSchemas.concat(pending)
+                pending, pending_rows = [], 0
+    if pending:
+        yield tableSchemas.concat(pending)
+
+
+class RollingKeyDeduper:
+    """Drop rows that repeat the row last seen for their (location, date) key.
+
+    The last row for a key wins, as it does in the store: within a batch only the last row of
+    each key is kept, and a row whose key was seen with different values passes through so the
+    store's upsert replaces the earlier one. Only exact repeats, which would change nothing, are
+    dropped. Seen keys are kept as a sorted uint64 hash array (with each key's row hash and date
+    alongside), so each batch costs a binary search and a linear merge rather than a re-sort of
+    everything seen. Keys dated more than window_days outside the current batch's dates are
+    forgotten, so the key set holds about window_days of keys wherever the stream is in time; a
+    repeat of a forgotten key is skipped by the store's row-hash check instead.
+    window_days=None remembers every key.
+    """
+
+    def __init__(self, key_columns=('location', 'date'), window_days=DEDUPE_WINDOW_DAYS):
+        self.key_columns = list(key_columns)
+        self.window_days = window_days
+        self.seen_hashes = np.array([], dtype=np.uint64)
+        self.seen_rows = np.array([], dtype=np.uint64)
+        self.seen_dates = np.array([], dtype='datetime64[D]')
+        self.dropped = 0
+
+    def _positions(self, hashes):
+        """Index of each hash in the seen keys, or -1"""
+        positions = np.searchsorted(self.seen_hashes, hashes)
+        found = np.full(len(hashes), -1)
+        inside = positions < len(self.seen_hashes)
+        match = np.zeros(len(hashes), dtype=bool)
+        match[inside] = self.seen_hashes[positions[inside]] == hashes[inside]
+        found[match] = positions[match]
+        return found
+
+    def _forget(self, dates):
+        """Drop seen keys dated more than window_days before or after this batch's dates"""
+        window = np.timedelta64(self.window_days, 'D')
+        recent = (self.seen_dates >= dates.min() - window) & (self.seen_dates <= dates.max() + window)
+        self.seen_hashes, self.seen_rows = self.seen_hashes[recent], self.seen_rows[recent]
+        self.seen_dates = self.seen_dates[recent]
+
+    def __call__(self, batches):
+        for batch in batches:
+            dates = pd.to_datetime(batch['date']).to_numpy().astype('datetime64[D]')
+            # Keys include the date, so keys outside the batch's dates cannot match any of its rows
+            if self.window_days is not None and len(dates) and len(self.seen_dates):
+                self._forget(dates)
+            # Hash typed keys directly: categorical and string locations hash alike, dates as day numbers
+            keys = batch[self.key_columns].assign(date=dates.view(np.int64)) if 'date' in self.key_columns \
+                else batch[self.key_columns]
+            hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy(np.uint64)
+            rows = pd.util.hash_pandas_object(batch.assign(date=dates.view(np.int64)), index=False).to_numpy(np.uint64)
+            positions = self._positions(hashes)
+            seen = positions >= 0
+            repeat = np.zeros(len(hashes), dtype=bool)
+            repeat[seen] = self.seen_rows[positions[seen]] == rows[seen]
+            keep = ~pd.Series(hashes).duplicated(keep='last').to_numpy() & ~repeat
+
+            changed = keep & seen
+            self.seen_rows[positions[changed]] = rows[changed]
+            added = keep & ~seen
+            order = np.argsort(hashes[added], kind='stable')
+            new_hashes = hashes[added][order]
+            at = np.searchsorted(self.seen_hashes, new_hashes)
+            self.seen_hashes = np.insert(self.seen_hashes, at, new_hashes)
+            self.seen_rows = np.insert(self.seen_rows, at, rows[added][order])
+            self.seen_dates = np.insert(self.seen_dates, at, dates[added][order])
+
+            self.dropped += int((~keep).sum())
+            if keep.all():
+                yield batch
+            elif keep.any():
+                yield batch[keep]
+
+
+def score_missing(batches, version='open_meteo_v1'):
+    """Fill fire_risk_score for rows that arrive without one but carry the inputs it is scored from.
+
+    NOAA-only station-days have no humidity or wind, so their score stays null.
+    """
+    inputs = ['temp_max', 'humidity', 'wind_speed']
+    for batch in batches:
+        if all(column in batch for column in inputs):
+            missing = batch['fire_risk_score'].isna() if 'fire_risk_score' in batch else pd.Series(True, batch.index)
+            missing &= batch[inputs].notna().all(axis=1)
+            if missing.any():
+                batch = batch.copy()
+                batch.loc[missing, 'fire_risk_score'] = score_frame(batch.loc[missing], version,
+                                                                    columns=['fire_risk_score'])['fire_risk_score']
+        yield batch
+
+
+class ManifestDelta:
+    """Pass on only the rows that are new or changed since the uploads recorded in a manifest.
+
+    Rows are hashed in their BigQuery form, as upload_to_bigquery does. New hashes are collected
+    per batch and folded into the manifest once, by manifest(), after the upload succeeds.
+    """
+
+    def __init__(self, table_name, manifest):
+        self.table_name = table_name
+        self.previous = manifest
+        self.key_hashes = []
+        self.row_hashes = []
+        self.report = {'insert': 0, 'update': 0, 'skip': 0}
+
+    def __call__(self, batches):
+        for batch in batches:
+            send, report, key_hash, row_hash = diff_rows(tableSchemas.for_bigquery(batch, self.table_name),
+                                                         self.table_name, self.previous)
+            self.key_hashes.append(key_hash)
+            self.row_hashes.append(row_hash)
+            for name, count in report.items():
+                self.report[name] += count
+            if send.any():
+                yield batch[send]
+
+    def manifest(self):
+        if not self.key_hashes:
+            return self.previous
+        return update_manifest(self.previous, np.concatenate(self.key_hashes), np.concatenate(self.row_hashes))
+
+
+class StoreSink:
+    """Append batches to the local partitioned store.
+
+    Batches are buffered up to flush_rows before each write, so a wide run (many stations per
+    batch) produces a few larger files per partition instead of one tiny file per batch.
+    """
+
+    name = 'store'
+
+    def __init__(self, table_name='weather_data', root=STORE_ROOT, flush_rows=500_000):
+        self.table_name = table_name
+        self.root = root
+        self.flush_rows = flush_rows
+        self.pending = []
+        self.pending_rows = 0
+        self.written = 0
+        self.writes = 0
+
+    def write(self, batch):
+        self.pending.append(batch)
+        self.pending_rows += len(batch)
+        if self.pending_rows >= self.flush_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        self.written += write_table(tableSchemas.concat(self.pending), self.table_name, self.root)
+        self.writes += 1
+        self.pending, self.pending_rows = [], 0
+
+    def close(self):
+        self._flush()
+        return {'sink': self.name, 'new_rows': self.written, 'writes': self.writes}
+
+
+class BigQueryLoadSink:
+    """Load batches into BigQuery in load-job chunks.
+
+    By default chunks go to a staging table that is MERGEd into the final table on close; when
+    the final table does not exist yet they are loaded into it directly. With replace=True the
+    first chunk truncates the final table and the rest are appended to it.
+    """
+
+    name = 'bigquery'
+
+    def __init__(self, bq_client, table_id, table_name='weather_data', chunk_rows=500_000, replace=False):
+        self.client = bq_client
+        self.table_id = table_id
+        self.table_name = table_name
+        self.staging_table_id = f"{table_id}_staging"
+        self.chunk_rows = chunk_rows
+        self.replace = replace
+        self.direct = None
+        self.pending = []
+        self.pending_rows = 0
+        self.loaded = 0
+        self.job_ids = []
+        self.columns = None
+
+    def write(self, batch):
+        self.pending.append(batch)
+        self.pending_rows += len(batch)
+        if self.pending_rows >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        from google.cloud import bigquery
+
+        if self.direct is None:
+            try:
+                table = self.client.get_table(self.table_id)
+                self.direct = self.replace
+            except Exception:
+                self.direct = True
+            else:
+                tableSchemas.add_missing_bigquery_fields(self.client, table, self.table_name)
+        chunk = tableSchemas.for_bigquery(tableSchemas.concat(self.pending), self.table_name)
+        disposition = bigquery.WriteDisposition.WRITE_TRUNCATE if not self.loaded else bigquery.WriteDisposition.WRITE_APPEND
+        job_config = bigquery.LoadJobConfig(schema=tableSchemas.bigquery_schema(self.table_name),
+                                            write_disposition=disposition)
+        destination = self.table_id if self.direct else self.staging_table_id
+        job = self.client.load_table_from_dataframe(chunk, destination, job_config=job_config)
+        job.result()
+        runMetrics.record_job(job, f"upload_{self.table_name}")
+        self.job_ids.append(job.job_id)
+        self.loaded += len(chunk)
+        self.columns = list(chunk.columns)
+        self.pending, self.pending_rows = [], 0
+
+    def close(self):
+        self._flush()
+        if self.loaded and not self.direct:
+            job = self.client.query(merge_sql(self.table_id, self.staging_table_id, self.columns,
+                                              UPSERT_KEYS[self.table_name]))
+            job.result()
+            runMetrics.record_job(job, f"upload_{self.table_name}")
+            self.client.delete_table(self.staging_table_id, not_found_ok=True)
+        return {'sink': self.name, 'loaded_rows': self.loaded, 'load_jobs': self.job_ids}
+
+
+def run_pipeline(sources, stages=(), sinks=(), batch_rows=DEFAULT_BATCH_ROWS, queue_size=4):
+    """Stream source frames through the stages into every sink with bounded memory.
+
+    sources is a list of (name, iterable of DataFrames). Frames are regrouped into batches of
+    batch_rows and pulled through the stages (generator functions over batches) on a producer
+    thread. The sinks run on the calling thread behind a queue of queue_size batches, so a slow
+    sink blocks the producer instead of letting batches accumulate. Returns a report with
+    per-stage throughput and the peak RSS sampled while this run was streaming.
+    """
+    source_metrics = [StageMetrics(f"source:{name}") for name, _ in sources]
+    batch_metrics = StageMetrics('rebatch')
+    stage_metrics = [StageMetrics(getattr(stage, '__name__', type(stage).__name__)) for stage in stages]
+    sink_metrics = [StageMetrics(f"sink:{sink.name}") for sink in sinks]
+
+    def chained():
+        for (_, frames), metrics in zip(sources, source_metrics):
+            yield from _metered(frames, metrics)
+
+    batches = _metered(rebatch(chained(), batch_rows), batch_metrics)
+    for stage, metrics in zip(stages, stage_metrics):
+        batches = _metered(stage(batches), metrics)
+
+    channel = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    failure = []
+    done = object()
+
+    def produce():
+        try:
+            for batch in batches:
+                if stop.is_set():
+                    break
+                channel.put(batch)
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            # Closing the chain lets sources cancel requests still in flight
+            batches.close()
+            channel.put(done)
+
+    with runMetrics.PeakMemory() as memory:
+        start = time.perf_counter()
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        rows = 0
+        finished = False
+        try:
+            while True:
+                batch = channel.get()
+                if batch is done:
+                    finished = True
+                    break
+                rows += len(batch)
+                for sink, metrics in zip(sinks, sink_metrics):
+                    sink_start = time.perf_counter()
+                    sink.write(batch)
+                    metrics.seconds += time.perf_counter() - sink_start
+                    metrics.rows += len(batch)
+                    metrics.batches += 1
+        finally:
+            # A failing sink stops the producer and drains the queue so it is not left blocked on put
+            if not finished:
+                stop.set()
+                while channel.get() is not done:
+                    pass
+            producer.join()
+        if failure:
+            raise failure[0]
+
+        sink_reports = []
+        for sink, metrics in zip(sinks, sink_metrics):
+            sink_start = time.perf_counter()
+            sink_reports.append(sink.close())
+            metrics.seconds += time.perf_counter() - sink_start
+        elapsed = time.perf_counter() - start
+
+    stages_report = [metrics.report() for metrics in source_metrics]
+    upstream = sum(metrics.seconds for metrics in source_metrics)
+    for metrics in [batch_metrics] + stage_metrics:
+        stages_report.append(metrics.report(upstream))
+        upstream = metrics.seconds
+    stages_report.extend(metrics.report() for metrics in sink_metrics)
+
+    return {
+        'rows': rows,
+        'wall_time_s': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else None,
+        'peak_rss_mb': round(memory.peak / 2**20, 1),
+        'rss_growth_mb': round((memory.peak - memory.baseline) / 2**20, 1),
+        'stages': stages_report,
+        'sinks': sink_reports
+    }
+
+
+def print_report(report):
+    print(f"Streamed {report['rows']:,} rows in {report['wall_time_s']}s "
+          f"({report['rows_per_sec']:,} rows/sec, peak RSS {report['peak_rss_mb']} MB, "
+          f"+{report['rss_growth_mb']} MB during the run)")
+    for stage in report['stages']:
+        rate = f"{stage['rows_per_sec']:,.0f} rows/sec" if stage['rows_per_sec'] else "-"
+        print(f"  {stage['stage']:<24} {stage['rows']:>12,} rows  {stage['seconds']:8.3f}s  {rate}")
+    for sink in report['sinks']:
+        print(f"  {sink}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream simulated and real weather data into the local store")
+    parser.add_argument('--stations', type=int, default=5, help="number of simulated stations")
+    parser.add_argument('--start-date', default='2017-01-01')
+    parser.add_argument('--end-date', default='2024-12-31')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS)
+    parser.add_argument('--real', action='store_true', help="also stream Open-Meteo observations after the simulated data")
+    parser.add_argument('--store-root', default=STORE_ROOT)
+    parser.add_argument('--dedupe-days', type=int, default=DEDUPE_WINDOW_DAYS,
+                        help="days of keys remembered around each batch for deduplication (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    # Observations stream last: the deduper and the store both keep the last row for a
+    # station-day, so they replace the simulated rows for the same days
+    sources = [('simulated', iter_weather_data(args.start_date, args.end_date, args.stations, args.seed,
+                                               chunk_rows=args.batch_rows))]
+    if args.real:
+        from collectRealData import iter_open_meteo_weather
+        sources.append(('open_meteo', iter_open_meteo_weather()))
+
+    report = run_pipeline(sources, stages=[RollingKeyDeduper(window_days=args.dedupe_days), score_missing],
+                          sinks=[StoreSink('weather_data', args.store_root)], batch_rows=args.batch_rows)
+    print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
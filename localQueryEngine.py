@@ -0,0 +1,442 @@
+import glob
+import mimetypes
+import os
+import re
+import sys
+import time
+import duckdb
+import pandas as pd
+
+from fireRiskScoring import fire_risk_view_sql
+from localStore import STORE_ROOT, TABLES
+import tableSchemas
+from queryCache import statement_target
+from weatherMessages import MESSAGE_INDEX_PATH
+
+DATASET_ID = 'napa_wildfire_demo'
+DATA_DIR = './data'
+BACKEND_ENV = 'INFERNOCAST_BACKEND'
+
+# Object tables from deploy_v1.sh: table -> (local folder under DATA_DIR, bucket prefix)
+OBJECT_TABLES = {
+    'weather_alerts': ('weather_messages', 'alerts'),
+    'satellite_images': ('sentinel_images', 'images')
+}
+
+# The notebook's BigQuery queries, used by --check to exercise the local backend
+DEMO_QUERIES = {
+    'high_risk_weather': """
+        SELECT location, date, temp_max, humidity, wind_speed, fire_risk_score
+        FROM `{dataset_ref}.weather_data`
+        WHERE fire_risk_score > 0.6
+        ORDER BY fire_risk_score DESC
+        LIMIT 10""",
+    'alert_object_metadata': """
+        SELECT uri, size, updated, content_type
+        FROM `{dataset_ref}.weather_alerts`
+        WHERE size > 100
+        ORDER BY size DESC
+        LIMIT 5""",
+    'alerts_with_content': """
+        CREATE OR REPLACE TABLE `{dataset_ref}.alerts_with_content` AS
+        SELECT
+          uri,
+          size,
+          updated,
+          STRUCT(
+            uri,
+            'gcs-connection' as authorizer,
+            CAST(updated AS STRING) as version,
+            JSON '{{}}' as details
+          ) as file_ref,
+          CASE
+            WHEN uri LIKE '%red_flag%' THEN 'RED_FLAG_WARNING'
+            WHEN uri LIKE '%fire_weather%' THEN 'FIRE_WEATHER_ALERT'
+            WHEN uri LIKE '%outlook%' THEN 'FIRE_WEATHER_OUTLOOK'
+            ELSE 'NORMAL_CONDITIONS'
+          END as alert_type_from_filename,
+          REGEXP_EXTRACT(uri, r'(\\d{{4}}-\\d{{2}}-\\d{{2}})') as alert_date
+        FROM `{dataset_ref}.weather_alerts`
+        WHERE size > 50""",
+    'objectref_fields': """
+        SELECT uri, alert_type_from_filename, alert_date,
+          file_ref.uri as referenced_file, file_ref.authorizer as connection_used
+        FROM `{dataset_ref}.alerts_with_content`
+        LIMIT 5""",
+    'multimodal_union': """
+        WITH perfect_match AS (
+          SELECT weather.location, weather.date, weather.temp_max, weather.humidity, weather.wind_speed,
+            weather.fire_risk_score AS numerical_risk, alerts.alert_type AS text_alert_type, alerts.alert_reference
+          FROM (
+              SELECT * FROM `{dataset_ref}.weather_data`
+              WHERE date = '2017-06-10' AND location = 'St_Helena'
+              LIMIT 1
+            ) AS weather
+          CROSS JOIN (
+              SELECT alert_type_from_filename AS alert_type, uri AS alert_reference
+              FROM `{dataset_ref}.alerts_with_content`
+              WHERE alert_type_from_filename = 'RED_FLAG_WARNING'
+              LIMIT 1
+            ) AS alerts
+        ),
+        other_high_risk_days AS (
+          SELECT location, date, temp_max, humidity, wind_speed, fire_risk_score AS numerical_risk,
+            'NO_ALERT' AS text_alert_type, CAST(NULL AS STRING) AS alert_reference
+          FROM `{dataset_ref}.weather_data`
+          WHERE date != '2020-09-26'
+          ORDER BY fire_risk_score DESC, date DESC
+          LIMIT 9
+        )
+        SELECT * FROM perfect_match
+        UNION ALL
+        SELECT * FROM other_high_risk_days""",
+    'fire_risk_analysis': """
+        SELECT risk_category, COUNT(*) AS days, ROUND(AVG(haines_index), 2) AS avg_haines
+        FROM `{dataset_ref}.fire_risk_analysis`
+        GROUP BY risk_category
+        ORDER BY days DESC""",
+    'dry_image_ref': """
+        SELECT uri, STRUCT(uri AS uri, 'gcs-connection' AS authorizer) AS file_ref
+        FROM `{dataset_ref}.satellite_images`
+        WHERE uri LIKE '%dry%'
+        LIMIT 1"""
+}
+
+_TYPE_ALIASES = {'FLOAT64': 'DOUBLE', 'NUMERIC': 'DECIMAL(38, 9)', 'BIGNUMERIC': 'DOUBLE', 'BYTES': 'BLOB'}
+
+
+def _split_top_level(text):
+    """Split on commas that are not inside parentheses or quotes"""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts]
+
+
+def _closing_paren(text, open_index):
+    depth, quote = 0, None
+    for i in range(open_index, len(text)):
+        char = text[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("Unbalanced parentheses in STRUCT(...)")
+
+
+def _rewrite_structs(sql):
+    """STRUCT(expr AS name, column, ...) -> struct_pack(name := expr, column := column, ...)"""
+    pattern = re.compile(r'\bSTRUCT\s*\(', re.IGNORECASE)
+    match = pattern.search(sql)
+    while match:
+        open_index = match.end() - 1
+        close_index = _closing_paren(sql, open_index)
+        fields = []
+        for position, item in enumerate(_split_top_level(_rewrite_structs(sql[open_index + 1:close_index]))):
+            aliased = re.match(r'(?s)(.*\S)\s+AS\s+(\w+)$', item, re.IGNORECASE)
+            if aliased:
+                fields.append(f"{aliased.group(2)} := {aliased.group(1)}")
+            elif re.fullmatch(r'[\w.]+', item):
+                fields.append(f"{item.split('.')[-1]} := {item}")
+            else:
+                fields.append(f"_field_{position + 1} := {item}")
+        replacement = f"struct_pack({', '.join(fields)})"
+        sql = sql[:match.start()] + replacement + sql[close_index + 1:]
+        match = pattern.search(sql, match.start() + len(replacement))
+    return sql
+
+
+def to_duckdb_sql(sql, parameters=None):
+    """Translate the BigQuery Standard SQL used in this project to DuckDB SQL.
+
+    Covers what the notebook, the deploy script's view and the collectors use: backtick
+    `project.dataset.table` references (resolved to the bare table name), r'' raw strings,
+    BigQuery type names, STRUCT(... AS ...) constructors and @named parameters. BigQuery's
+    REGEXP_EXTRACT returns the first capture group and DuckDB's the whole match, which agree for
+    the single-group patterns used here.
+    """
+    if re.search(r'\bML\.\w+\s*\(', sql, re.IGNORECASE):
+        raise ValueError("BigQuery ML functions are not available on the local backend")
+    sql = re.sub(r'`([^`]+)`', lambda m: m.group(1).split('.')[-1], sql)
+    sql = re.sub(r"(?<![\w'\"])[rR](?=['\"])", '', sql)
+    for bigquery_type, duckdb_type in _TYPE_ALIASES.items():
+        sql = re.sub(rf'\b{bigquery_type}\b', duckdb_type, sql)
+    sql = _rewrite_structs(sql)
+    if parameters:
+        sql = re.sub(r'(?<![\w@])@(\w+)', r'$\1', sql)
+    return sql
+
+
+def object_metadata(table_name, data_dir=DATA_DIR, bucket_name=None):
+    """Object-table style metadata (uri, generation, content_type, size, updated) for local files"""
+    folder, prefix = OBJECT_TABLES[table_name]
+    bucket_name = bucket_name or f"{os.environ.get('PROJECT_ID', 'local')}-napa-fire-data"
+    rows = []
+    directory = os.path.join(data_dir, folder)
+    if os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            rows.append({
+                'uri': f"gs://{bucket_name}/{prefix}/{entry.name}",
+                'generation': stat.st_mtime_ns // 1000,
+                'content_type': mimetypes.guess_type(entry.name)[0] or 'application/octet-stream',
+                'size': stat.st_size,
+                'updated': pd.Timestamp(stat.st_mtime_ns, unit='ns', tz='UTC'),
+                'local_path': entry.path
+            })
+    columns = ['uri', 'generation', 'content_type', 'size', 'updated', 'local_path']
+    return pd.DataFrame(rows, columns=columns).sort_values('uri', ignore_index=True)
+
+
+class LocalQueryJob:
+    """Finished local query with the parts of bigquery.QueryJob the project uses"""
+
+    def __init__(self, job_id, sql, df, elapsed_ms):
+        self.job_id = job_id
+        self.query = sql
+        self._df = df
+        self.elapsed_ms = elapsed_ms
+        self.total_bytes_processed = 0
+        self.total_rows = len(df)
+
+    def result(self, timeout=None):
+        return self
+
+    def to_dataframe(self, **kwargs):
+        return self._df.copy()
+
+    def __iter__(self):
+        return self._df.itertuples(index=False)
+
+
+class LocalClient:
+    """Drop-in stand-in for bigquery.Client that runs queries offline with DuckDB.
+
+    weather_data and fire_history are read straight from the local Parquet store (falling back
+    to the newest CSV snapshot), the weather_alerts and satellite_images object tables are
+    built from file metadata under data/, and fire_risk_analysis is created from the same view
+    SQL that deploy_v1.sh uses. The parsed NWS message table (weatherMessages.py) is exposed as
+    weather_messages once it has been indexed. Tables created by queries (e.g. alerts_with_content) live for
+    the lifetime of the client, or in database if a file path is given.
+    """
+
+    def __init__(self, project=None, dataset_id=DATASET_ID, data_dir=DATA_DIR, store_root=STORE_ROOT,
+                 bucket_name=None, database=':memory:'):
+        self.project = project or os.environ.get('PROJECT_ID', 'local')
+        self.dataset_id = dataset_id
+        self.data_dir = data_dir
+        self.store_root = store_root
+        self.bucket_name = bucket_name or f"{self.project}-napa-fire-data"
+        self.conn = duckdb.connect(database)
+        self.jobs = 0
+        # table -> time_ns of the last statement through this client that wrote it
+        self.written = {}
+        self.refresh()
+
+    def _register_store_table(self, table_name):
+        files = os.path.join(self.store_root, table_name, '**', '*.parquet')
+        if glob.glob(files, recursive=True):
+            source = f"read_parquet('{files}', hive_partitioning = true, union_by_name = true)"
+        else:
+            snapshots = sorted(glob.glob(os.path.join(self.data_dir, f"{table_name}_*.csv")))
+            if not snapshots:
+                return False
+            source = f"read_csv_auto('{snapshots[-1]}')"
+        # Files written before a column was added to the schema read it as NULL
+        present = {row[0] for row in self.conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+        columns = ", ".join(
+            name if name in present else f"CAST(NULL AS {_TYPE_ALIASES.get(bq_type, bq_type)}) AS {name}"
+            for name, bq_type, _, _ in tableSchemas.TABLE_FIELDS[table_name])
+        self.conn.execute(f"CREATE OR REPLACE VIEW {table_name} AS SELECT {columns} FROM {source}")
+        return True
+
+    def object_metadata(self, table_name):
+        return object_metadata(table_name, self.data_dir, self.bucket_name)
+
+    def refresh(self):
+        """(Re)register every table, object table and view from the files on disk"""
+        registered = [name for name in TABLES if self._register_store_table(name)]
+        for table_name in OBJECT_TABLES:
+            self.conn.register(table_name, self.object_metadata(table_name))
+            registered.append(table_name)
+        message_index = os.path.join(self.store_root, os.path.basename(MESSAGE_INDEX_PATH))
+        if os.path.exists(message_index):
+            self.conn.execute(f"CREATE OR REPLACE VIEW weather_messages AS SELECT * FROM read_parquet('{message_index}')")
+            registered.append('weather_messages')
+        if 'weather_data' in registered:
+            self.conn.execute(to_duckdb_sql(fire_risk_view_sql(f"{self.project}.{self.dataset_id}")))
+            registered.append('fire_risk_analysis')
+        self.tables = registered
+        self.refreshed_ns = time.time_ns()
+        return registered
+
+    def _source_files(self, table_name):
+        files = glob.glob(os.path.join(self.store_root, table_name, '**', '*.parquet'), recursive=True)
+        if files:
+            return files
+        return sorted(glob.glob(os.path.join(self.data_dir, f"{table_name}_*.csv")))[-1:]
+
+    def table_version(self, table_id):
+        """Something that changes whenever the table's contents may have, or None for an unknown table.
+
+        Store tables are versioned by their files' paths, sizes and mtimes; object tables and the
+        message index are frozen at refresh(); tables written by statements by the time they ran.
+        """
+        name = str(table_id).rsplit('.', 1)[-1]
+        if name in self.written:
+            return ['written', self.written[name]]
+        if name == 'fire_risk_analysis':
+            name = 'weather_data'
+        if name not in self.tables:
+            return None
+        if name in TABLES:
+            return sorted([path, stat.st_size, stat.st_mtime_ns]
+                          for path, stat in ((path, os.stat(path)) for path in self._source_files(name)))
+        return ['refreshed', self.refreshed_ns]
+
+    def query(self, sql, job_config=None, **kwargs):
+        """Run a BigQuery-dialect query locally and return a finished LocalQueryJob"""
+        parameters = {param.name: param.value
+                      for param in getattr(job_config, 'query_parameters', None) or []}
+        translated = to_duckdb_sql(sql, parameters)
+        start = time.perf_counter()
+        relation = self.conn.execute(translated, parameters or None)
+        # BigQuery returns no rows for DDL/DML; DuckDB returns a row count
+        is_statement = re.match(r'\s*(CREATE|DROP|ALTER|INSERT|UPDATE|DELETE|MERGE)\b', translated, re.IGNORECASE)
+        df = pd.DataFrame() if is_statement or not relation.description else relation.fetchdf()
+        if is_statement:
+            target = statement_target(sql)
+            if target:
+                self.written[target.rsplit('.', 1)[-1]] = time.time_ns()
+        self.jobs += 1
+        return LocalQueryJob(f"local_{self.jobs}", sql, df, (time.perf_counter() - start) * 1000)
+
+    def read_table(self, table_id):
+        """Read a whole table by BigQuery id (project.dataset.table, dataset.table or table)"""
+        return self.query(f"SELECT * FROM `{table_id}`").to_dataframe()
+
+    def close(self):
+        self.conn.close()
+
+
+class _LocalSeries(pd.Series):
+    @property
+    def _constructor(self):
+        return _LocalSeries
+
+    @property
+    def _constructor_expanddim(self):
+        return LocalFrame
+
+    def value_counts(self, *args, **kwargs):
+        return _LocalSeries(super().value_counts(*args, **kwargs))
+
+    def to_pandas(self):
+        return pd.Series(self)
+
+
+class LocalFrame(pd.DataFrame):
+    """pandas DataFrame with the to_pandas() calls the notebook makes on BigFrames results"""
+
+    @property
+    def _constructor(self):
+        return LocalFrame
+
+    @property
+    def _constructor_sliced(self):
+        return _LocalSeries
+
+    def describe(self, *args, **kwargs):
+        return LocalFrame(super().describe(*args, **kwargs))
+
+    def to_pandas(self):
+        return pd.DataFrame(self)
+
+
+class LocalFrames:
+    """The bigframes.pandas entry points the notebook uses, backed by a LocalClient"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def read_gbq(self, table_id):
+        return LocalFrame(self.client.read_table(table_id))
+
+    def read_pandas(self, df):
+        return LocalFrame(df)
+
+    def merge(self, left, right, **kwargs):
+        return LocalFrame(pd.merge(left, right, **kwargs))
+
+
+def get_backend(backend=None):
+    return (backend or os.environ.get(BACKEND_ENV, 'bigquery')).lower()
+
+
+def get_client(project_id=None, backend=None, cache=False, **kwargs):
+    """Return a BigQuery client, or a LocalClient when the backend (or INFERNOCAST_BACKEND) is 'local'.
+
+    With cache=True (or a queryCache.QueryResultCache) repeated reads are answered from a local
+    result cache that is invalidated when the tables they read change.
+    """
+    if get_backend(backend) == 'local':
+        client = LocalClient(project_id, **kwargs)
+    else:
+        from google.cloud import bigquery
+        client = bigquery.Client(project=project_id)
+    if cache is not False and cache is not None:
+        from queryCache import CachedClient
+        client = CachedClient(client, None if cache is True else cache)
+    return client
+
+
+def get_frames(client):
+    """Return bigframes.pandas for a BigQuery client, or a local equivalent for a LocalClient"""
+    from queryCache import CachedClient, CachedFrames
+    if isinstance(client, CachedClient):
+        return CachedFrames(get_frames(client.client), client)
+    if isinstance(client, LocalClient):
+        return LocalFrames(client)
+    import bigframes.pandas as bf
+    bf.options.bigquery.project = client.project
+    return bf
+
+
+def check_demo_queries(client=None):
+    """Run the notebook's queries on the local backend and print rows and latency for each"""
+    client = client or LocalClient()
+    dataset_ref = f"{client.project}.{client.dataset_id}"
+    print(f"Local tables: {', '.join(client.tables)}")
+    for name, sql in DEMO_QUERIES.items():
+        job = client.query(sql.format(dataset_ref=dataset_ref))
+        print(f"  {name:<24} {job.total_rows:>6} rows  {job.elapsed_ms:8.2f} ms")
+    return client
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] != "--check":
+        with pd.option_context('display.width', 200, 'display.max_columns', 20):
+            print(LocalClient().query(" ".join(sys.argv[1:])).to_dataframe())
+    else:
+        check_demo_queries()
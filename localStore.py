@@ -0,0 +1,301 @@
+import glob
+import os
+import sys
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+import tableSchemas
+from uploadManifest import UPSERT_KEYS
+
+STORE_ROOT = './data/store'
+
+# Compact on-disk types come from tableSchemas. Partition columns (location/year,
+# county/fire_year) live in the directory names and are dictionary-encoded on read.
+_PARTITIONING = {'weather_data': ['location', 'year'], 'fire_history': ['county', 'fire_year'],
+                 'fuel_dryness': ['location', 'year'], 'weather_hourly': ['location', 'year'],
+                 'fire_weather_daily': ['location', 'year']}
+
+TABLES = {
+    table_name: {
+        'columns': tableSchemas.columns(table_name),
+        'partitioning': partitioning,
+        'date_columns': tableSchemas.date_columns(table_name),
+        'schema': tableSchemas.arrow_schema(table_name, exclude=partitioning).append(pa.field('row_hash', pa.uint64()))
+    }
+    for table_name, partitioning in _PARTITIONING.items()
+}
+
+_PARTITION_TYPES = {'location': pa.string(), 'year': pa.int16(), 'county': pa.string(), 'fire_year': pa.int16()}
+
+
+def _partitioning(table_name):
+    fields = TABLES[table_name]['partitioning']
+    return ds.partitioning(pa.schema([(name, _PARTITION_TYPES[name]) for name in fields]), flavor='hive')
+
+
+def _dataset_schema(table_name):
+    """The stored file schema plus the partition columns"""
+    schema = TABLES[table_name]['schema']
+    for name in TABLES[table_name]['partitioning']:
+        schema = schema.append(pa.field(name, _PARTITION_TYPES[name]))
+    return schema
+
+
+def _table_path(table_name, root):
+    return os.path.join(root, table_name)
+
+
+def _prepare(df, table_name):
+    """Normalise a frame to the store's compact types and add the content hash of each row"""
+    spec = TABLES[table_name]
+    # Nullable fields a source does not produce at all are stored as null
+    missing = [name for name in tableSchemas.columns(table_name) if name not in df]
+    df = tableSchemas.to_typed(df.assign(**dict.fromkeys(missing, np.nan)), table_name)
+    # A fixed unit keeps row hashes independent of the source frame's datetime resolution
+    for column in spec['date_columns']:
+        df[column] = pd.to_datetime(df[column]).dt.normalize().astype('datetime64[us]')
+    if 'year' in spec['partitioning']:
+        df['year'] = df['date'].dt.year.astype(np.int16)
+    else:
+        df['fire_year'] = df['fire_year'].astype(np.int16)
+    # Categorical partition keys become plain strings for the directory names and filters
+    for column in spec['partitioning']:
+        if _PARTITION_TYPES[column] == pa.string():
+            df[column] = df[column].astype(str)
+
+    value_columns = [field.name for field in spec['schema'] if field.name != 'row_hash'] + spec['partitioning']
+    for field in spec['schema']:
+        if pa.types.is_string(field.type) or pa.types.is_dictionary(field.type):
+            df[field.name] = df[field.name].astype(str)
+    df = df[value_columns]
+    df['row_hash'] = pd.util.hash_pandas_object(df, index=False).to_numpy(np.uint64)
+    return df.drop_duplicates('row_hash')
+
+
+def open_dataset(table_name, root=STORE_ROOT):
+    """Open a stored table as a memory-mapped, hive-partitioned Arrow dataset"""
+    path = _table_path(table_name, root)
+    if not os.path.isdir(path):
+        return None
+    # An explicit schema reads files written with older compact types (e.g. int8 dictionaries) as the current ones
+    return ds.dataset(path, format='parquet', partitioning=_partitioning(table_name), schema=_dataset_schema(table_name),
+                      filesystem=fs.LocalFileSystem(use_mmap=True))
+
+
+def read_files(table_name, paths, root=STORE_ROOT, columns=None):
+    """Arrow table of some of a stored table's files (e.g. ones a watcher saw appear), typed like open_dataset"""
+    return ds.dataset(paths, format='parquet', partitioning=_partitioning(table_name),
+                      partition_base_dir=_table_path(table_name, root),
+                      schema=_dataset_schema(table_name)).to_table(columns=columns)
+
+
+def _partition_filter(table_name, df):
+    """Expression selecting the partitions that rows of a prepared frame fall into"""
+    expression = None
+    for column in TABLES[table_name]['partitioning']:
+        condition = pc.field(column).isin(pa.array(df[column].unique()))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _key_hashes(df, keys):
+    """Hash of each row's natural key, whether it came from a prepared frame or from the store"""
+    normalized = {}
+    for column in keys:
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype('datetime64[us]')
+        elif pd.api.types.is_integer_dtype(values):
+            values = values.astype(np.int64)
+        else:
+            values = values.astype(str)
+        normalized[column] = values
+    return pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False).to_numpy(np.uint64)
+
+
+def _drop_keys(dataset, table_name, rows):
+    """Rewrite the partitions holding the keys of rows without them, so newer values replace the old"""
+    spec = TABLES[table_name]
+    keys = UPSERT_KEYS[table_name]
+    replaced = _key_hashes(rows, keys)
+    by_directory = {}
+    for fragment in dataset.get_fragments(filter=_partition_filter(table_name, rows)):
+        by_directory.setdefault(os.path.dirname(fragment.path), []).append(fragment)
+    for directory, fragments in by_directory.items():
+        table = pa.concat_tables([fragment.to_table(schema=dataset.schema) for fragment in fragments])
+        keep = ~np.isin(_key_hashes(table.select(keys).to_pandas(date_as_object=False), keys), replaced)
+        if keep.all():
+            continue
+        kept = table.filter(pa.array(keep)).select(spec['schema'].names)
+        if kept.num_rows:
+            pq.write_table(kept, os.path.join(directory, f"part-{uuid.uuid4().hex[:12]}-0.parquet"), compression='zstd')
+        for fragment in fragments:
+            os.remove(fragment.path)
+
+
+def write_table(df, table_name, root=STORE_ROOT):
+    """Upsert rows into a stored table, keeping one row per natural key (UPSERT_KEYS).
+
+    Rows whose content hash is already stored are skipped, so rewriting the same data is a
+    no-op. A key that is stored with different values is replaced: the later write wins, and
+    only the partitions holding replaced keys are rewritten. Only the key and row_hash columns
+    of the touched partitions are read to find them. Returns the number of rows written.
+    """
+    if df is None or df.empty:
+        return 0
+    spec = TABLES[table_name]
+    keys = UPSERT_KEYS[table_name]
+    prepared = _prepare(df, table_name).drop_duplicates(keys, keep='last')
+
+    dataset = open_dataset(table_name, root)
+    if dataset is not None:
+        stored = dataset.to_table(columns=keys + ['row_hash'], filter=_partition_filter(table_name, prepared))
+        if stored.num_rows:
+            stored = stored.to_pandas(date_as_object=False)
+            prepared = prepared[~prepared['row_hash'].isin(stored['row_hash'])]
+            replaced = np.isin(_key_hashes(prepared, keys), _key_hashes(stored, keys))
+            if replaced.any():
+                _drop_keys(dataset, table_name, prepared[replaced])
+    if prepared.empty:
+        return 0
+    # Contiguous partitions let the writer emit each file in one pass; date-major input
+    # (every station for each day) is otherwise scattered across all open files.
+    prepared = prepared.sort_values(spec['partitioning'] + spec['date_columns'][:1], kind='stable')
+
+    table = pa.Table.from_pandas(prepared, schema=_dataset_schema(table_name), preserve_index=False)
+    ds.write_dataset(
+        table, _table_path(table_name, root), format='parquet', partitioning=_partitioning(table_name),
+        basename_template=f"part-{uuid.uuid4().hex[:12]}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd')
+    )
+    return len(prepared)
+
+
+def _filter_expression(table_name, locations=None, start_date=None, end_date=None):
+    date_column = TABLES[table_name]['date_columns'][0]
+    location_column, year_column = TABLES[table_name]['partitioning']
+    expression = None
+
+    def both(left, right):
+        return right if left is None else left & right
+
+    if locations is not None:
+        expression = both(expression, pc.field(location_column).isin(list(locations)))
+    if start_date is not None:
+        start = pd.Timestamp(start_date)
+        expression = both(expression, pc.field(year_column) >= start.year)
+        expression = both(expression, pc.field(date_column) >= pa.scalar(start.date(), pa.date32()))
+    if end_date is not None:
+        end = pd.Timestamp(end_date)
+        expression = both(expression, pc.field(year_column) <= end.year)
+        expression = both(expression, pc.field(date_column) <= pa.scalar(end.date(), pa.date32()))
+    return expression
+
+
+def read_arrow(table_name, root=STORE_ROOT, locations=None, start_date=None, end_date=None, columns=None):
+    """Read a stored table as an Arrow table.
+
+    Location and year filters prune whole partition directories and date filters are pushed
+    down to Parquet row-group statistics, so only matching data is read from disk.
+    """
+    dataset = open_dataset(table_name, root)
+    if dataset is None:
+        return None
+    return dataset.to_table(columns=columns, filter=_filter_expression(table_name, locations, start_date, end_date))
+
+
+def read_table(table_name, root=STORE_ROOT, locations=None, start_date=None, end_date=None, columns=None):
+    """Read a stored table as a DataFrame in the shape the collectors produce"""
+    table = read_arrow(table_name, root, locations, start_date, end_date, columns)
+    if table is None:
+        return pd.DataFrame()
+    df = table.to_pandas(self_destruct=True)
+    return tableSchemas.to_typed(df[[column for column in TABLES[table_name]['columns'] if column in df]], table_name)
+
+
+def iter_table(table_name, root=STORE_ROOT, batch_rows=500_000, columns=None):
+    """Yield a stored table as DataFrames of at most batch_rows rows, scanning one batch at a time"""
+    dataset = open_dataset(table_name, root)
+    if dataset is None:
+        return
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_rows):
+        if batch.num_rows:
+            df = batch.to_pandas()
+            yield tableSchemas.to_typed(df[[column for column in TABLES[table_name]['columns'] if column in df]],
+                                        table_name)
+
+
+def read_weather(root=STORE_ROOT, locations=None, start_date=None, end_date=None, columns=None):
+    return read_table('weather_data', root, locations, start_date, end_date, columns)
+
+
+def read_fire_history(root=STORE_ROOT, start_date=None, end_date=None, columns=None):
+    return read_table('fire_history', root, start_date=start_date, end_date=end_date, columns=columns)
+
+
+def compact_partitions(table_name, root=STORE_ROOT):
+    """Rewrite each partition's small append files as a single sorted file"""
+    dataset = open_dataset(table_name, root)
+    if dataset is None:
+        return 0
+    spec = TABLES[table_name]
+    sort_keys = [(spec['date_columns'][0], 'ascending')]
+    compacted = 0
+    for directory in sorted({os.path.dirname(path) for path in dataset.files}):
+        files = [path for path in dataset.files if os.path.dirname(path) == directory]
+        if len(files) < 2:
+            continue
+        table = ds.dataset(files, format='parquet', schema=spec['schema']).to_table().sort_by(sort_keys)
+        pq.write_table(table, os.path.join(directory, f"part-{uuid.uuid4().hex[:12]}-0.parquet"), compression='zstd')
+        for path in files:
+            os.remove(path)
+        compacted += 1
+    return compacted
+
+
+def prune_partitions(table_name, root=STORE_ROOT, keep_years=1):
+    """Delete a table's year partitions older than the newest keep_years years it holds.
+
+    Returns the number of partition directories removed.
+    """
+    import shutil
+    year_column = TABLES[table_name]['partitioning'][1]
+    pattern = os.path.join(_table_path(table_name, root), '*', f"{year_column}=*")
+    directories = {path: int(path.rsplit('=', 1)[1]) for path in glob.glob(pattern)}
+    if not directories:
+        return 0
+    oldest_kept = max(directories.values()) - keep_years + 1
+    removed = [path for path, year in directories.items() if year < oldest_kept]
+    for path in removed:
+        shutil.rmtree(path)
+    return len(removed)
+
+
+def compact_csv_snapshots(data_dir='./data', root=STORE_ROOT, remove=False):
+    """Fold timestamped weather_data/fire_history CSV backups into the store"""
+    print(f"Compacting CSV snapshots from {data_dir} into {root}...")
+    written = {}
+    for table_name in ('weather_data', 'fire_history'):
+        paths = sorted(glob.glob(os.path.join(data_dir, f"{table_name}_*.csv")))
+        rows = 0
+        for path in paths:
+            rows += write_table(pd.read_csv(path), table_name, root)
+            if remove:
+                os.remove(path)
+        compact_partitions(table_name, root)
+        written[table_name] = rows
+        print(f"  {table_name}: {len(paths)} snapshots, {rows} new rows stored")
+    return written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        compact_csv_snapshots(remove="--remove-csv" in sys.argv)
+    else:
+        print("Usage: python localStore.py compact [--remove-csv]")
@@ -0,0 +1,444 @@
+import argparse
+import json
+import mimetypes
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+
+import runMetrics
+from imageFeatures import IMAGE_EXTENSIONS, IMAGES_DIR, content_hash
+from temporalJoin import DEFAULT_REGION, IMAGE_METADATA_PATH
+from uploadManifest import MANIFEST_DIR
+from weatherMessages import MESSAGES_DIR
+
+# Bucket folder -> (local directory, file extensions); the object tables read these folders
+SYNC_FOLDERS = {
+    'images': (IMAGES_DIR, IMAGE_EXTENSIONS),
+    'alerts': (MESSAGES_DIR, ('.txt',))
+}
+TRANSCODE_DIR = './data/cache/transcoded'
+TRANSCODE_QUALITY = 85
+# Resumable upload chunks must be multiples of 256 KiB
+CHUNK_BYTES = 8 * 2**20
+MAX_WORKERS = 8
+MAX_RETRIES = 5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# (keyword in the file name, image_type, fire_risk_level), first match wins
+IMAGE_TYPES = [
+    ('fire', 'active_fire', 'high'),
+    ('dry', 'dry_vegetation', 'high'),
+    ('green', 'healthy_vegetation', 'low'),
+    ('spring', 'healthy_vegetation', 'low')
+]
+DEFAULT_IMAGE_TYPE = ('general_landscape', 'moderate')
+IMAGE_METADATA_COLUMNS = ['filename', 'gcs_uri', 'image_type', 'fire_risk_level', 'date_captured', 'location',
+                          'vegetation_condition', 'file_description', 'content_hash']
+
+
+def default_bucket_name():
+    return f"{os.environ.get('PROJECT_ID', 'local')}-napa-fire-data"
+
+
+class GCSBucket:
+    """Cloud Storage bucket driven through the JSON API's resumable upload sessions.
+
+    A session URI outlives the process, so an upload interrupted by a crash or a dropped
+    connection continues from the offset GCS has persisted instead of starting over.
+    """
+
+    def __init__(self, bucket_name, project=None):
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import storage
+        self.client = storage.Client(project=project)
+        self.bucket = self.client.bucket(bucket_name)
+        self.name = bucket_name
+        self.session = AuthorizedSession(self.client._credentials)
+
+    def uri(self, name):
+        return f"gs://{self.name}/{name}"
+
+    def start_upload(self, name, size, metadata=None, content_type=None):
+        blob = self.bucket.blob(name)
+        blob.metadata = metadata
+        return blob.create_resumable_upload_session(content_type=content_type, size=size)
+
+    def _put(self, session, data, content_range):
+        response = self.session.put(session, data=data, headers={'Content-Range': content_range})
+        if response.status_code in (404, 410):
+            raise KeyError(f"Upload session expired: {session}")
+        if response.status_code in RETRY_STATUS_CODES:
+            raise ConnectionError(f"GCS returned HTTP {response.status_code}")
+        if response.status_code not in (200, 201, 308):
+            response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _persisted(response, size):
+        """Next offset after a 308 (its Range header is the persisted prefix) or a completed upload"""
+        if response.status_code in (200, 201):
+            return size
+        persisted = response.headers.get('Range')
+        return int(persisted.rsplit('-', 1)[1]) + 1 if persisted else 0
+
+    def upload_offset(self, session, size):
+        return self._persisted(self._put(session, None, f"bytes */{size}"), size)
+
+    def upload_chunk(self, session, data, offset, size):
+        content_range = f"bytes {offset}-{offset + len(data) - 1}/{size}" if data else f"bytes */{size}"
+        return self._persisted(self._put(session, data, content_range), size)
+
+    def copy(self, source, name, metadata=None):
+        blob = self.bucket.copy_blob(self.bucket.blob(source), self.bucket, name)
+        if metadata:
+            blob.metadata = metadata
+            blob.patch()
+
+    def delete(self, name):
+        self.bucket.blob(name).delete()
+
+
+class SyncManifest:
+    """Object name -> what was uploaded for it: source stat, content hashes and upload state.
+
+    Saved after every finished object (and every started upload session), so an interrupted
+    sync resumes where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, name):
+        with self.lock:
+            return dict(self.entries.get(name, {}))
+
+    def update(self, name, **values):
+        with self.lock:
+            entry = self.entries.setdefault(name, {})
+            entry.update(values)
+            for key in [key for key, value in entry.items() if value is None]:
+                del entry[key]
+            self._save()
+
+    def remove(self, name):
+        with self.lock:
+            self.entries.pop(name, None)
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+def manifest_path(bucket_name, directory=MANIFEST_DIR):
+    return os.path.join(directory, f"objects_{bucket_name}.json")
+
+
+def _transcoded(path, digest, max_dimension, transcode_dir=TRANSCODE_DIR):
+    """Path of a copy of the image no larger than max_dimension on its long side (cached by content)"""
+    from PIL import Image
+    target = os.path.join(transcode_dir, f"{digest}_{max_dimension}{os.path.splitext(path)[1].lower()}")
+    if not os.path.exists(target):
+        os.makedirs(transcode_dir, exist_ok=True)
+        with Image.open(path) as image:
+            image_format = image.format
+            # JPEG draft decoding scales by 1/2-1/8 in the decoder, so big captures never decode at full size
+            image.draft('RGB', (max_dimension, max_dimension))
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            options = {'quality': TRANSCODE_QUALITY, 'optimize': True} if image_format == 'JPEG' else {}
+            temporary = f"{target}.tmp"
+            image.save(temporary, image_format, **options)
+        os.replace(temporary, target)
+    return target
+
+
+def _image_size(path):
+    from PIL import Image
+    with Image.open(path) as image:
+        return image.width, image.height
+
+
+def scan(manifest, folders=SYNC_FOLDERS, max_dimension=None, stats=None):
+    """One entry per local file: object name, the bytes to upload and their hash.
+
+    Files whose size and mtime match the manifest reuse its hash instead of being read again.
+    Images larger than max_dimension are uploaded as a bounded-resolution copy.
+    """
+    files = []
+    for folder, (directory, extensions) in folders.items():
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.lower().endswith(extensions):
+                continue
+            path = os.path.join(directory, filename)
+            name = f"{folder}/{filename}"
+            stat = os.stat(path)
+            entry = manifest.get(name)
+            unchanged = entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns
+            digest = entry['content_hash'] if unchanged and 'content_hash' in entry else content_hash(path)
+            if stats is not None and not unchanged:
+                stats['hashed'] = stats.get('hashed', 0) + 1
+            item = {'name': name, 'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                    'content_hash': digest, 'upload_path': path, 'object_hash': digest}
+            if folder == 'images':
+                width, height = ((entry['width'], entry['height']) if unchanged and 'width' in entry
+                                 else _image_size(path))
+                item.update({'width': width, 'height': height})
+                if max_dimension and max(width, height) > max_dimension:
+                    item['upload_path'] = _transcoded(path, digest, max_dimension)
+                    item['object_hash'] = content_hash(item['upload_path'])
+            files.append(item)
+    return files
+
+
+def _upload(bucket, manifest, item, chunk_bytes, stats, max_retries=MAX_RETRIES, backoff=0.5, max_backoff=30.0):
+    """Upload one file through a resumable session, continuing a session left by an earlier run"""
+    name, path = item['name'], item['upload_path']
+    size = os.path.getsize(path)
+    entry = manifest.get(name)
+    session = entry.get('pending_session') if entry.get('pending_hash') == item['object_hash'] else None
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    metadata = {'content_hash': item['object_hash'], 'source_hash': item['content_hash']}
+
+    for attempt in range(max_retries + 1):
+        try:
+            if session is None:
+                session = bucket.start_upload(name, size, metadata, content_type)
+                manifest.update(name, pending_session=session, pending_hash=item['object_hash'])
+                offset = 0
+            else:
+                offset = bucket.upload_offset(session, size)
+                if offset:
+                    _count(stats, 'resumed')
+            with open(path, 'rb') as f:
+                while True:
+                    f.seek(offset)
+                    data = f.read(chunk_bytes)
+                    offset = bucket.upload_chunk(session, data, offset, size)
+                    _count(stats, 'bytes_uploaded', len(data))
+                    if offset >= size:
+                        return size
+        except KeyError:
+            # The session expired or is unknown to the bucket: start a new one
+            session = None
+        except (ConnectionError, TimeoutError):
+            if attempt == max_retries:
+                raise
+            _count(stats, 'retries')
+            time.sleep(min(max_backoff, backoff * (2 ** attempt)) * random.uniform(0.5, 1.5))
+    raise ConnectionError(f"Could not upload {name}")
+
+
+_stats_lock = threading.Lock()
+
+
+def _count(stats, key, amount=1):
+    with _stats_lock:
+        stats[key] = stats.get(key, 0) + amount
+
+
+def _record(manifest, item, generation_source):
+    manifest.update(item['name'], size=item['size'], mtime_ns=item['mtime_ns'], content_hash=item['content_hash'],
+                    object_hash=item['object_hash'], object_size=os.path.getsize(item['upload_path']),
+                    width=item.get('width'), height=item.get('height'), uploaded_at=datetime.now().isoformat(timespec='seconds'),
+                    transcoded=item['upload_path'] != item['path'] or None, copied_from=generation_source,
+                    pending_session=None, pending_hash=None)
+
+
+def sync(bucket, manifest=None, folders=SYNC_FOLDERS, max_dimension=None, prune=False, dry_run=False,
+         max_workers=MAX_WORKERS, chunk_bytes=CHUNK_BYTES, metadata_path=IMAGE_METADATA_PATH):
+    """Upload new or changed files under folders to bucket and regenerate the image metadata.
+
+    Unchanged objects (same content hash as the manifest) are skipped; content already in the
+    bucket under another name is copied server-side; the rest upload in parallel in
+    chunk_bytes pieces through resumable sessions. With prune=True objects whose local file is
+    gone are deleted. Returns a report of the plan and what was transferred.
+    """
+    manifest = manifest if manifest is not None else SyncManifest(manifest_path(bucket.name))
+    stats = {'hashed': 0, 'bytes_uploaded': 0, 'retries': 0, 'resumed': 0}
+    start = time.perf_counter()
+    with runMetrics.span('object_sync') as span:
+        files = scan(manifest, folders, max_dimension, stats)
+        uploaded_names = {name: entry['object_hash'] for name, entry in manifest.entries.items()
+                          if 'uploaded_at' in entry}
+        in_bucket = {}
+        for name, digest in uploaded_names.items():
+            in_bucket.setdefault(digest, name)
+
+        skip, copy, upload, first_upload = [], [], [], {}
+        for item in files:
+            if uploaded_names.get(item['name']) == item['object_hash']:
+                skip.append(item)
+            elif item['object_hash'] in in_bucket:
+                copy.append(item)
+            elif item['object_hash'] in first_upload:
+                # Same content as another file in this run: upload once, copy afterwards
+                copy.append(item)
+            else:
+                first_upload[item['object_hash']] = item['name']
+                upload.append(item)
+        local_names = {item['name'] for item in files}
+        stale = sorted(name for name in manifest.entries if name not in local_names) if prune else []
+
+        report = {'files': len(files), 'skip': len(skip), 'upload': len(upload), 'copy': len(copy),
+                  'delete': len(stale), 'upload_bytes': sum(os.path.getsize(item['upload_path']) for item in upload),
+                  'skip_bytes': sum(item['size'] for item in skip)}
+        if not dry_run:
+            def upload_one(item):
+                _upload(bucket, manifest, item, chunk_bytes, stats)
+                _record(manifest, item, None)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(upload_one, upload))
+            for item in copy:
+                source = in_bucket.get(item['object_hash']) or first_upload[item['object_hash']]
+                bucket.copy(source, item['name'], {'content_hash': item['object_hash'],
+                                                   'source_hash': item['content_hash']})
+                _record(manifest, item, source)
+            for name in stale:
+                bucket.delete(name)
+                manifest.remove(name)
+            if metadata_path:
+                write_image_metadata(manifest, bucket, metadata_path)
+        report.update({key: stats[key] for key in ('hashed', 'bytes_uploaded', 'retries', 'resumed')})
+        report['wall_time_s'] = round(time.perf_counter() - start, 3)
+        span.update({key: report[key] for key in ('files', 'upload', 'copy', 'skip', 'bytes_uploaded')})
+    return report
+
+
+def _capture_date(filename, uploaded_at):
+    match = re.search(r'(\d{4})-?(\d{2})-?(\d{2})', filename)
+    if match:
+        date = pd.to_datetime('-'.join(match.groups()), errors='coerce')
+        if not pd.isna(date):
+            return date.strftime('%Y-%m-%d')
+    return uploaded_at[:10]
+
+
+def image_metadata(manifest, bucket):
+    """The image_metadata.csv rows for every image the manifest records as uploaded"""
+    rows = []
+    for name, entry in sorted(manifest.entries.items()):
+        folder, filename = name.split('/', 1)
+        if folder != 'images' or 'uploaded_at' not in entry:
+            continue
+        lowered = filename.lower()
+        image_type, risk = next(((image_type, risk) for keyword, image_type, risk in IMAGE_TYPES if keyword in lowered),
+                                DEFAULT_IMAGE_TYPE)
+        rows.append({'filename': filename, 'gcs_uri': bucket.uri(name), 'image_type': image_type,
+                     'fire_risk_level': risk, 'date_captured': _capture_date(filename, entry['uploaded_at']),
+                     'location': DEFAULT_REGION, 'vegetation_condition': risk,
+                     'file_description': f"{image_type} imagery for wildfire analysis",
+                     'content_hash': entry['content_hash']})
+    return pd.DataFrame(rows, columns=IMAGE_METADATA_COLUMNS)
+
+
+def write_image_metadata(manifest, bucket, path=IMAGE_METADATA_PATH):
+    metadata = image_metadata(manifest, bucket)
+    metadata.to_csv(path, index=False)
+    return metadata
+
+
+def print_report(report):
+    print(f"  {report['files']} files: {report['upload']} to upload ({report['upload_bytes'] / 2**20:.1f} MB), "
+          f"{report['copy']} server-side copies, {report['skip']} unchanged "
+          f"({report['skip_bytes'] / 2**20:.1f} MB not re-sent), {report['delete']} to delete")
+    print(f"  hashed {report['hashed']} changed files, sent {report['bytes_uploaded'] / 2**20:.1f} MB "
+          f"({report['retries']} retries, {report['resumed']} resumed uploads) in {report['wall_time_s']}s")
+
+
+def check_sync(latency=0.02):
+    """Sync copies of the local folders to a fake bucket through dropped connections, then re-sync"""
+    from devStubs import FakeBucket
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        folders = {}
+        for folder, (directory, extensions) in SYNC_FOLDERS.items():
+            folders[folder] = (shutil.copytree(directory, os.path.join(tmp, folder)), extensions)
+        manifest = SyncManifest(os.path.join(tmp, 'manifest.json'))
+        metadata_path = os.path.join(tmp, 'image_metadata.csv')
+        bucket = FakeBucket(os.path.join(tmp, 'bucket'), default_bucket_name(), fail_every=7, latency=latency)
+
+        print("First sync (every 7th chunk drops the connection):")
+        report = sync(bucket, manifest, folders, chunk_bytes=256 * 1024, metadata_path=metadata_path)
+        print_report(report)
+        intact = all(bucket.read(item['name']) == open(item['path'], 'rb').read()
+                     for item in scan(manifest, folders))
+        print(f"  every object matches its file: {intact}")
+        ok &= intact and report['retries'] > 0 and report['resumed'] > 0
+
+        print("Re-sync with nothing changed:")
+        report = sync(bucket, manifest, folders, metadata_path=metadata_path)
+        print_report(report)
+        ok &= report['upload'] == report['copy'] == report['bytes_uploaded'] == report['hashed'] == 0
+
+        print("Re-sync after editing one alert and bounding images to 1024px:")
+        alert = os.path.join(folders['alerts'][0], sorted(os.listdir(folders['alerts'][0]))[0])
+        with open(alert, 'a') as f:
+            f.write("\nUPDATED\n")
+        report = sync(bucket, manifest, folders, max_dimension=1024, metadata_path=metadata_path)
+        print_report(report)
+        large = [name for name, entry in manifest.entries.items() if entry.get('transcoded')]
+        bounded = all(max(_image_size(os.path.join(bucket.root, 'objects', name))) <= 1024 for name in large)
+        print(f"  {len(large)} images uploaded at bounded resolution: {bounded}")
+        ok &= bounded and report['hashed'] == 1
+
+        metadata = pd.read_csv(metadata_path)
+        shipped = pd.read_csv(IMAGE_METADATA_PATH)
+        # Compare the images both list; the shipped file also names images that are not in the repo
+        joined = metadata.merge(shipped, on='filename', suffixes=('', '_shipped'))
+        same = len(joined) == len(metadata) and (joined['image_type'] == joined['image_type_shipped']).all()
+        print(f"  regenerated image metadata: {len(metadata)} images, types match {IMAGE_METADATA_PATH}: {same}")
+        ok &= same
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync local satellite images and weather alerts to Cloud Storage")
+    parser.add_argument('--bucket', default=default_bucket_name(), help="bucket name (default: %(default)s)")
+    parser.add_argument('--project', default=os.environ.get('PROJECT_ID'))
+    parser.add_argument('--fake-bucket', help="sync to a filesystem-backed bucket at this path instead of GCS")
+    parser.add_argument('--max-dimension', type=int, help="upload images larger than this as a bounded copy")
+    parser.add_argument('--prune', action='store_true', help="delete objects whose local file is gone")
+    parser.add_argument('--dry-run', action='store_true', help="report the plan without uploading")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--check', action='store_true', help="sync to a temporary fake bucket and verify it")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        print("Checking object sync against a fake bucket...")
+        return 0 if check_sync() else 1
+    if args.fake_bucket:
+        from devStubs import FakeBucket
+        bucket = FakeBucket(args.fake_bucket, args.bucket)
+    else:
+        bucket = GCSBucket(args.bucket, args.project)
+    print(f"Syncing {', '.join(f'{directory} -> {folder}/' for folder, (directory, _) in SYNC_FOLDERS.items())} "
+          f"to gs://{args.bucket}" + (" (dry run)" if args.dry_run else ""))
+    report = sync(bucket, max_dimension=args.max_dimension, prune=args.prune, dry_run=args.dry_run,
+                  max_workers=args.workers)
+    print_report(report)
+    if not args.dry_run:
+        print(f"  Wrote {IMAGE_METADATA_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
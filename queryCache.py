@@ -0,0 +1,426 @@
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from responseCache import cache_key
+
+DEFAULT_CACHE_DIR = './data/cache/queries'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DATASET_ID = 'napa_wildfire_demo'
+# deploy_v1.sh creates the object tables with max_staleness = INTERVAL 1 HOUR, and their
+# last-modified time does not move when files change in the bucket
+OBJECT_TABLES = ('weather_alerts', 'satellite_images')
+OBJECT_TABLE_STALENESS_S = 3600
+_METADATA_KEY = b'infernocast.query_cache'
+
+# String literals and quoted identifiers (kept as is), comments, whitespace runs
+_SQL_TOKENS = re.compile(
+    r"""('''.*?'''|\"\"\".*?\"\"\"|'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*"|`[^`]*`)|(--[^\n]*|#[^\n]*|/\*.*?\*/)|(\s+)""",
+    re.DOTALL)
+_TABLE_REFERENCE = re.compile(r'`([\w.-]+)`|\b(?:FROM|JOIN)\s+([A-Za-z_][\w-]*(?:\.[\w-]+){0,2})\b(?!\s*\()',
+                              re.IGNORECASE)
+_CTE_NAME = re.compile(r'\b(\w+)\s+AS\s*\(', re.IGNORECASE)
+_STATEMENT = re.compile(r'\s*(CREATE|DROP|ALTER|INSERT|UPDATE|DELETE|MERGE|TRUNCATE|DECLARE|SET|BEGIN|CALL|EXPORT)\b',
+                        re.IGNORECASE)
+# Table a DDL/DML statement writes, e.g. CREATE OR REPLACE TABLE `p.d.t` AS ...
+_STATEMENT_TARGET = re.compile(
+    r'\s*(?:CREATE\s+(?:OR\s+REPLACE\s+)?(?:TEMP\w*\s+)?(?:TABLE|VIEW)(?:\s+IF\s+NOT\s+EXISTS)?|INSERT\s+(?:INTO\s+)?'
+    r'|MERGE\s+(?:INTO\s+)?|UPDATE|DELETE\s+(?:FROM\s+)?|DROP\s+(?:TABLE|VIEW)(?:\s+IF\s+EXISTS)?)\s*`?([\w.-]+)`?',
+    re.IGNORECASE)
+# Results that differ between runs of the same SQL over the same tables
+_NONDETERMINISTIC = re.compile(
+    r'\b(CURRENT_(DATE|DATETIME|TIME|TIMESTAMP)|RAND|GENERATE_UUID|SESSION_USER|ML\.\w+|AI\.\w+)\s*\(', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """SQL with comments dropped, whitespace collapsed and trailing semicolons removed"""
+    def replace(match):
+        return match.group(1) if match.group(1) is not None else ' '
+    return _SQL_TOKENS.sub(replace, sql).strip().rstrip(';').strip()
+
+
+def referenced_tables(sql, project, dataset_id=DATASET_ID):
+    """Fully qualified ids of the tables a query reads (CTE names excluded)"""
+    sql = normalize_sql(sql)
+    ctes = {name.lower() for name in _CTE_NAME.findall(sql)}
+    tables = set()
+    for quoted, bare in _TABLE_REFERENCE.findall(sql):
+        table_id = quoted or bare
+        if table_id.lower() in ctes or (bare and bare.upper() == 'UNNEST'):
+            continue
+        parts = table_id.split('.')
+        tables.add('.'.join([project, dataset_id][:3 - len(parts)] + parts))
+    return sorted(tables)
+
+
+def _parameters(job_config):
+    parameters = getattr(job_config, 'query_parameters', None) or []
+    return [param.to_api_repr() if hasattr(param, 'to_api_repr') else [param.name, param.value]
+            for param in parameters]
+
+
+class QueryResultCache:
+    """Query results as Parquet files under cache_dir, evicted least recently read first beyond max_bytes.
+
+    A hit touches its file, so file mtimes order the entries for eviction. The job statistics
+    saved with each result (bytes billed, run time) are what a later hit saves.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def get(self, key):
+        """(DataFrame, saved job statistics) for key, or None"""
+        path = self._path(key)
+        with self.lock:
+            try:
+                table = pq.read_table(path)
+                os.utime(path)
+            except (FileNotFoundError, pa.ArrowInvalid):
+                return None
+        return table.to_pandas(), json.loads(table.schema.metadata.get(_METADATA_KEY, b'{}'))
+
+    def put(self, key, df, info):
+        """Store a result; returns False if it cannot be converted to Arrow"""
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError):
+            return False
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _METADATA_KEY: json.dumps(info)})
+        path = self._path(key)
+        with self.lock:
+            pq.write_table(table, f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+            self._evict()
+        return True
+
+    def _entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*.parquet')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(entries)
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def size_bytes(self):
+        with self.lock:
+            return sum(size for _, size, _ in self._entries())
+
+    def __len__(self):
+        with self.lock:
+            return len(self._entries())
+
+    def clear(self):
+        with self.lock:
+            for _, _, path in self._entries():
+                os.remove(path)
+
+
+class CachedQueryJob:
+    """A finished query answered from the cache, with the parts of bigquery.QueryJob the project uses"""
+
+    cache_hit = True
+
+    def __init__(self, key, sql, df, info):
+        self.job_id = f"cached_{key[:16]}"
+        self.query = sql
+        self._df = df
+        self.info = info
+        self.total_bytes_processed = 0
+        self.total_bytes_billed = 0
+        self.total_rows = len(df)
+
+    def result(self, timeout=None):
+        return self
+
+    def to_dataframe(self, **kwargs):
+        return self._df.copy()
+
+    def __iter__(self):
+        return self._df.itertuples(index=False)
+
+
+class _RecordingQueryJob:
+    """A query the cache missed: behaves as the client's job and stores the result on to_dataframe()"""
+
+    cache_hit = False
+
+    def __init__(self, cached_client, key, job, started):
+        self._cached_client = cached_client
+        self._key = key
+        self._job = job
+        self._started = started
+        self._stored = False
+
+    def __getattr__(self, name):
+        return getattr(self._job, name)
+
+    def __iter__(self):
+        return iter(self._job)
+
+    def to_dataframe(self, **kwargs):
+        df = self._job.to_dataframe(**kwargs)
+        if not self._stored:
+            self._stored = True
+            billed = getattr(self._job, 'total_bytes_billed', None) or getattr(self._job, 'total_bytes_processed', 0)
+            self._cached_client._store(self._key, df, {'bytes_billed': billed or 0,
+                                                       'seconds': round(time.perf_counter() - self._started, 6)})
+        return df
+
+
+class CachedClient:
+    """Wraps a bigquery.Client (or LocalClient) so repeated reads are answered from a local cache.
+
+    Results are keyed on the normalized SQL, the query parameters and the version of every table
+    the query reads: last-modified time, rows and bytes for BigQuery tables (views by the tables
+    their SQL reads), file stats for the local store. When a source table changes the key
+    changes, so stale results are never served and age out through eviction. Statements and
+    queries with non-deterministic functions (CURRENT_DATE, RAND, ML.*) always run. Every other
+    attribute is the wrapped client's.
+    """
+
+    def __init__(self, client, cache=None, dataset_id=None):
+        self.client = client
+        self.cache = cache if cache is not None else QueryResultCache()
+        self.dataset_id = dataset_id or getattr(client, 'dataset_id', DATASET_ID)
+        self.stats = {'hits': 0, 'misses': 0, 'uncached': 0, 'bytes_saved': 0, 'seconds_saved': 0.0,
+                      'result_bytes_served': 0}
+        self.lock = threading.Lock()
+        # table id -> unfinished job of a statement that writes it
+        self._pending_writes = {}
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def _bigquery_version(self, table_id, depth=0):
+        table = self.client.get_table(table_id)
+        version = [table.modified.isoformat() if table.modified else None, table.num_rows, table.num_bytes]
+        view_query = getattr(table, 'view_query', None)
+        if view_query and depth < 3:
+            version.append([[source, self._bigquery_version(source, depth + 1)]
+                            for source in referenced_tables(view_query, self.client.project, self.dataset_id)])
+        if table_id.rsplit('.', 1)[-1] in OBJECT_TABLES:
+            version.append(int(time.time() // OBJECT_TABLE_STALENESS_S))
+        return version
+
+    def table_version(self, table_id):
+        """The referenced table's current version, or None if it cannot be determined"""
+        pending = self._pending_writes.pop(table_id, None)
+        if pending is not None:
+            pending.result()
+        if hasattr(self.client, 'table_version'):
+            return self.client.table_version(table_id)
+        try:
+            return self._bigquery_version(table_id)
+        except Exception:
+            return None
+
+    def query_key(self, sql, job_config=None):
+        """Cache key for a query, or None if its result must not be cached"""
+        if (_STATEMENT.match(normalize_sql(sql)) or _NONDETERMINISTIC.search(sql)
+                or getattr(job_config, 'destination', None) or getattr(job_config, 'dry_run', False)):
+            return None
+        versions = []
+        for table_id in referenced_tables(sql, self.client.project, self.dataset_id):
+            version = self.table_version(table_id)
+            if version is None:
+                return None
+            versions.append([table_id, version])
+        if not versions:
+            return None
+        default_dataset = getattr(job_config, 'default_dataset', None)
+        return cache_key('query', normalize_sql(sql), _parameters(job_config), versions,
+                         str(default_dataset) if default_dataset else None)
+
+    def query(self, sql, job_config=None, **kwargs):
+        """Run a query through the cache; returns a CachedQueryJob on a hit and the client's job otherwise"""
+        key = self.query_key(sql, job_config)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                df, info = cached
+                self._count('hits')
+                self._count('bytes_saved', info.get('bytes_billed', 0))
+                self._count('seconds_saved', info.get('seconds', 0.0))
+                self._count('result_bytes_served', int(df.memory_usage(deep=True).sum()))
+                return CachedQueryJob(key, sql, df, info)
+        started = time.perf_counter()
+        job = self.client.query(sql, job_config=job_config, **kwargs)
+        if key is None:
+            self._count('uncached')
+            target = statement_target(sql)
+            if target:
+                self._pending_writes[_qualify(target, self.client.project, self.dataset_id)] = job
+            return job
+        self._count('misses')
+        return _RecordingQueryJob(self, key, job, started)
+
+    def _store(self, key, df, info):
+        self.cache.put(key, df, info)
+
+    def read_table(self, table_id):
+        """Read a whole table by BigQuery id through the cache"""
+        return self.query(f"SELECT * FROM `{table_id}`").to_dataframe()
+
+    def report(self):
+        with self.lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['seconds_saved'] = round(stats['seconds_saved'], 3)
+        stats['cache_entries'] = len(self.cache)
+        stats['cache_bytes'] = self.cache.size_bytes()
+        return stats
+
+    def print_report(self):
+        stats = self.report()
+        print(f"Query cache: {stats['hits']} hits, {stats['misses']} misses, {stats['uncached']} not cacheable "
+              f"(hit rate {stats['hit_rate']:.0%}); saved {stats['bytes_saved'] / 2**20:.1f} MB billed and "
+              f"{stats['seconds_saved']:.2f}s; {stats['cache_entries']} entries, "
+              f"{stats['cache_bytes'] / 2**20:.1f} MB on disk")
+
+
+class CachedFrames:
+    """bigframes.pandas (or LocalFrames) whose read_gbq goes through a CachedClient.
+
+    A cached table comes back through read_pandas, so later operations run on the local copy
+    instead of issuing a query per .shape or .to_pandas() call.
+    """
+
+    def __init__(self, frames, cached_client):
+        self.frames = frames
+        self.client = cached_client
+
+    def __getattr__(self, name):
+        return getattr(self.frames, name)
+
+    def read_gbq(self, table_id, **kwargs):
+        table_id = table_id.strip('`')
+        if kwargs or re.search(r'\s', table_id):
+            return self.frames.read_gbq(table_id, **kwargs)
+        return self.frames.read_pandas(self.client.read_table(table_id))
+
+
+def _qualify(table_id, project, dataset_id):
+    parts = table_id.split('.')
+    return '.'.join([project, dataset_id][:3 - len(parts)] + parts)
+
+
+def statement_target(sql):
+    """The table a DDL/DML statement writes, as written in the SQL, or None"""
+    match = _STATEMENT_TARGET.match(normalize_sql(sql))
+    return match.group(1) if match else None
+
+
+def check_cache(data_dir='./data'):
+    """Run the notebook queries twice against the local backend, then change sources and re-run"""
+    from localQueryEngine import DEMO_QUERIES, LocalClient
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        data = shutil.copytree(data_dir, os.path.join(tmp, 'data'), ignore=shutil.ignore_patterns('cache'))
+        local = LocalClient('local', data_dir=data, store_root=os.path.join(data, 'store'))
+        client = CachedClient(local, QueryResultCache(os.path.join(tmp, 'queries')))
+        dataset_ref = f"{local.project}.{local.dataset_id}"
+
+        def run(label):
+            results = {}
+            before = dict(client.stats)
+            start = time.perf_counter()
+            for name, sql in DEMO_QUERIES.items():
+                job = client.query(sql.format(dataset_ref=dataset_ref))
+                results[name] = (job.to_dataframe(), getattr(job, 'cache_hit', None))
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<44} {client.stats['hits'] - before['hits']} hits, "
+                  f"{client.stats['misses'] - before['misses']} misses, "
+                  f"{client.stats['uncached'] - before['uncached']} not cacheable  {elapsed * 1000:8.1f} ms")
+            return results
+
+        first = run("cold cache")
+        second = run("warm cache (alerts_with_content recreated)")
+        same = all(second[name][0].equals(first[name][0]) for name in first)
+        missed = {name for name, (_, hit) in second.items() if hit is False}
+        print(f"  cached results equal fresh results: {same}; re-run: {', '.join(sorted(missed))}")
+        # The CREATE OR REPLACE re-ran, so only the queries over alerts_with_content miss again
+        ok &= same and missed == {'objectref_fields', 'multimodal_union'}
+
+        # A new weather file changes weather_data and the fire_risk_analysis view over it
+        weather_files = local._source_files('weather_data')
+        extra = pd.read_parquet(weather_files[0]) if weather_files[0].endswith('.parquet') else pd.read_csv(weather_files[0])
+        if weather_files[0].endswith('.parquet'):
+            extra.head(1).to_parquet(weather_files[0].replace('.parquet', '_extra.parquet'), index=False)
+        else:
+            pd.concat([extra, extra.head(1)]).to_csv(weather_files[0], index=False)
+        third = run("after a weather_data change")
+        missed = {name for name, (_, hit) in third.items() if hit is False}
+        print(f"  re-run after the change: {', '.join(sorted(missed))}")
+        ok &= missed == {'high_risk_weather', 'objectref_fields', 'multimodal_union', 'fire_risk_analysis'}
+
+        params_sql = f"SELECT COUNT(*) AS n FROM `{dataset_ref}.weather_data` WHERE location = @location"
+        hits = []
+        for name in ('St_Helena', 'Calistoga', 'St_Helena'):
+            job = client.query(params_sql, SimpleNamespace(query_parameters=[SimpleNamespace(name='location', value=name)]))
+            job.to_dataframe()
+            hits.append(job.cache_hit)
+        print(f"  parameterized query for St_Helena, Calistoga, St_Helena: cache hits {hits}")
+        ok &= hits == [False, False, True]
+
+        client.cache.max_bytes = client.cache.size_bytes() // 2
+        client.cache._evict()
+        print(f"  halving max_bytes evicts to {len(client.cache)} entries, {client.cache.size_bytes():,} bytes")
+        ok &= client.cache.size_bytes() <= client.cache.max_bytes
+        client.print_report()
+        local.close()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local cache of BigQuery query results")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--clear', action='store_true', help="delete every cached result")
+    parser.add_argument('--check', action='store_true', help="exercise the cache on the local backend")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        print("Checking the query cache against the local backend...")
+        return 0 if check_cache() else 1
+    cache = QueryResultCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+    print(f"{args.cache_dir}: {len(cache)} cached results, {cache.size_bytes() / 2**20:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,573 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+
+import runMetrics
+import tableSchemas
+from fireRiskScoring import score_frame
+from localStore import STORE_ROOT, TABLES, read_files, read_weather, write_table
+from temporalJoin import (DEFAULT_REGION, IMAGE_METADATA_PATH, REGION_OFFICES, STATION_REGIONS, fuse,
+                          load_alert_windows, load_images)
+from weatherMessages import MESSAGE_INDEX_PATH, MESSAGES_DIR, MessageIndex
+
+POLL_SECONDS = 5.0
+# One Parquet file per month of station-days, so an event rewrites only the months it touches
+LIVE_RISK_PATH = './data/features/live_risk'
+STATE_PATH = './data/features/risk_watcher_state.json'
+EVENT_LOG_PATH = os.path.join(runMetrics.RUNS_DIR, 'risk_events.jsonl')
+# Same cut-off the notebook uses for high-risk weather; these rows (and rows under an alert) go to the model
+HIGH_RISK_SCORE = 0.6
+RISK_COLUMNS = ['location', 'date', 'temp_max', 'humidity', 'wind_speed', 'fire_risk_score', 'risk_category',
+                'haines_index', 'active_alerts', 'alert_types', 'alert_reference', 'image_uri', 'image_lag_days']
+MODEL_COLUMNS = {'risk_score': 'ai_risk_score', 'recommendation': 'ai_recommendation'}
+_LOCATION_PARTITION = re.compile(r'location=([^/\\]+)')
+
+
+def _stat_files(directory, suffix, recursive=False):
+    """path -> [size, mtime_ns] for the files under directory ending in suffix"""
+    files = {}
+    if not os.path.isdir(directory):
+        return files
+    if recursive:
+        paths = (os.path.join(root, name) for root, _, names in os.walk(directory) for name in names)
+    else:
+        paths = (entry.path for entry in os.scandir(directory) if entry.is_file())
+    for path in paths:
+        if path.endswith(suffix):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files[path] = [stat.st_size, stat.st_mtime_ns]
+    return files
+
+
+def message_days(messages):
+    """(office, date) for every day a message's window touches; messages without one cover their issue day"""
+    if messages.empty:
+        return pd.DataFrame(columns=['office', 'date'])
+    start = messages['effective_start'].fillna(messages['issue_time']).dt.floor('D')
+    end = messages['effective_end'].fillna(start + pd.Timedelta(days=1))
+    # fuse() counts an alert on a day when its window overlaps [day, day + 1)
+    days = ((end - pd.Timedelta(nanoseconds=1)).dt.floor('D') - start).dt.days.clip(lower=0) + 1
+    offices = np.repeat(messages['office'].astype(str).to_numpy(object), days)
+    offsets = np.arange(int(days.sum())) - np.repeat(np.cumsum(days.to_numpy()) - days.to_numpy(), days)
+    dates = np.repeat(start.dt.tz_localize(None).to_numpy('datetime64[D]'), days) + offsets.astype('timedelta64[D]')
+    return pd.DataFrame({'office': offices, 'date': dates.astype('datetime64[s]')}).drop_duplicates(ignore_index=True)
+
+
+def affected_keys(messages, locations, station_regions=None, region_offices=None):
+    """Station-days whose fused alert columns can change with these messages"""
+    station_regions = station_regions or STATION_REGIONS
+    region_offices = region_offices or REGION_OFFICES
+    office_regions = pd.DataFrame([(office, region) for region, offices in region_offices.items() for office in offices],
+                                  columns=['office', 'region'])
+    stations = pd.DataFrame({'location': sorted(locations)})
+    stations['region'] = stations['location'].map(station_regions).fillna(DEFAULT_REGION)
+    keys = message_days(messages).merge(office_regions, on='office').merge(stations, on='region')
+    return keys[['location', 'date']].drop_duplicates(ignore_index=True)
+
+
+def _row_map(key_hashes, row_hashes):
+    """Station-day key hash -> row_hash, keeping the last row of a repeated key"""
+    row_map = pd.Series(np.asarray(row_hashes, dtype=np.uint64), index=np.asarray(key_hashes, dtype=np.uint64))
+    return row_map[~row_map.index.duplicated(keep='last')]
+
+
+def _merge_row_maps(row_map, newer):
+    return _row_map(np.concatenate([row_map.index.to_numpy(np.uint64), newer.index.to_numpy(np.uint64)]),
+                    np.concatenate([row_map.to_numpy(), newer.to_numpy()]))
+
+
+class RiskWatcher:
+    """Re-scores only the station-days touched by new alerts or observations.
+
+    Two polls run on an asyncio loop: one over the NWS message folder and one over the store's
+    weather_data Parquet files. A changed message maps through its office's regions to their
+    stations and the days its window covers. A new store file maps to the station-days whose
+    row_hash differs from the row last scored for them; compaction and upserts rewrite files
+    with rows that were already scored, so those add nothing. Each event's rows are scored as
+    fire_risk_analysis does and fused with the active alerts and nearest image (optionally also
+    sent to the model). They are then upserted into the live risk table, and the event is
+    logged with its end-to-end latency from file arrival.
+
+    What has been scored is checkpointed in state_path (files) and a row-hash file beside it
+    after each event, so a restart picks up whatever arrived while the watcher was down. An
+    event whose re-score fails is not checkpointed and is retried with the next one.
+    """
+
+    def __init__(self, messages_dir=MESSAGES_DIR, store_root=STORE_ROOT, output_path=LIVE_RISK_PATH,
+                 state_path=STATE_PATH, event_log=EVENT_LOG_PATH, images_path=IMAGE_METADATA_PATH,
+                 interval=POLL_SECONDS, model=None, inference_cache=None, on_update=None):
+        self.messages_dir = messages_dir
+        self.store_root = store_root
+        self.weather_dir = os.path.join(store_root, 'weather_data')
+        self.index_path = os.path.join(store_root, os.path.basename(MESSAGE_INDEX_PATH))
+        self.output_path = output_path
+        self.state_path = state_path
+        self.rows_path = f"{os.path.splitext(state_path)[0]}_rows.npy"
+        self.event_log = event_log
+        self.images_path = images_path
+        self.interval = interval
+        self.model = model
+        self.inference_cache = inference_cache
+        self.on_update = on_update
+        self.lock = threading.Lock()
+        self.index = MessageIndex.load(self.index_path)
+        # state/scored_rows (station-day key hash -> row_hash) are checkpointed once an event is
+        # re-scored; seen/seen_rows move on as soon as a scan hands an event over, so the next
+        # scan does not report it again
+        self.state = None
+        self.scored_rows = None
+        self.seen = None
+        self.seen_rows = None
+        self._images = (None, None)
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        with open(f"{self.state_path}.tmp", 'w') as f:
+            json.dump(self.state, f)
+        with open(f"{self.rows_path}.tmp", 'wb') as f:
+            np.save(f, np.column_stack([self.scored_rows.index.to_numpy(np.uint64), self.scored_rows.to_numpy()]))
+        os.replace(f"{self.rows_path}.tmp", self.rows_path)
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+    def _read_rows(self, paths, columns=None):
+        """(rows, station-day key hashes, row_hashes) of some weather_data files"""
+        columns = columns or TABLES['weather_data']['columns']
+        if not paths:
+            return tableSchemas.empty_frame('weather_data')[columns], np.empty(0, np.uint64), np.empty(0, np.uint64)
+        table = read_files('weather_data', paths, self.store_root, columns=list(dict.fromkeys(
+            columns + ['location', 'date', 'row_hash'])))
+        rows = table.to_pandas()
+        keys = pd.util.hash_pandas_object(pd.DataFrame({
+            'location': rows['location'].astype(str),
+            'date': pd.to_datetime(rows['date']).astype('datetime64[s]')
+        }), index=False).to_numpy(np.uint64)
+        return rows[columns], keys, rows['row_hash'].to_numpy(np.uint64)
+
+    def baseline(self):
+        """Load the checkpoint, or on the first run take what is on disk now as already scored"""
+        first_run = not os.path.exists(self.state_path)
+        if first_run:
+            with self.lock:
+                self.index.update(self.messages_dir)
+                self.index.save(self.index_path)
+            self.state = {'messages': _stat_files(self.messages_dir, '.txt'),
+                          'weather_files': _stat_files(self.weather_dir, '.parquet', recursive=True)}
+        else:
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        if not first_run and os.path.exists(self.rows_path):
+            scored = np.load(self.rows_path)
+            self.scored_rows = _row_map(scored[:, 0], scored[:, 1])
+        else:
+            # First run, or a checkpoint from before rows were tracked: the checkpointed files' rows were scored
+            current = _stat_files(self.weather_dir, '.parquet', recursive=True)
+            _, keys, row_hashes = self._read_rows(
+                sorted(path for path, stat in self.state['weather_files'].items() if current.get(path) == stat),
+                columns=['row_hash'])
+            self.scored_rows = _row_map(keys, row_hashes)
+        self.seen = {source: dict(files) for source, files in self.state.items()}
+        self.seen_rows = self.scored_rows
+        self._save_state()
+        return first_run
+
+    def stations(self):
+        """Stations with stored weather, plus the registry's"""
+        stored = {match.group(1) for match in map(_LOCATION_PARTITION.search, self.state['weather_files']) if match}
+        return stored | set(STATION_REGIONS)
+
+    def scan_messages(self):
+        """An event for new, changed or removed message files, or None"""
+        current = _stat_files(self.messages_dir, '.txt')
+        seen = self.seen['messages']
+        changed = sorted(path for path, stat in current.items() if seen.get(path) != stat)
+        removed = sorted(set(seen) - set(current))
+        if not changed and not removed:
+            return None
+        detected = time.time()
+        names = {os.path.basename(path) for path in changed + removed}
+        with self.lock:
+            before = self.index.df[self.index.df['file'].isin(names)]
+            self.index.update(self.messages_dir)
+            self.index.save(self.index_path)
+            after = self.index.df[self.index.df['file'].isin(names)]
+        keys = affected_keys(pd.concat([before, after], ignore_index=True), self.stations())
+        arrived = max((current[path][1] / 1e9 for path in changed), default=detected)
+        self.seen['messages'] = current
+        return {'source': 'alerts', 'files': sorted(names), 'keys': keys, 'rows': None, 'arrived': arrived,
+                'detected': detected, 'state': ('messages', current)}
+
+    def scan_observations(self):
+        """An event for weather_data rows written since the last scan, or None.
+
+        Only rows whose row_hash has not been seen count: files rewritten by compaction or by an
+        upsert dropping replaced keys hold rows that were already scored.
+        """
+        current = _stat_files(self.weather_dir, '.parquet', recursive=True)
+        seen = self.seen['weather_files']
+        new = sorted(path for path, stat in current.items() if seen.get(path) != stat)
+        if not new:
+            # Compaction or pruning only removed files
+            self.seen['weather_files'] = current
+            return None
+        detected = time.time()
+        frames, maps, added = [], [], []
+        for path in sorted(new, key=lambda path: current[path][1]):
+            rows, keys, row_hashes = self._read_rows([path])
+            # A station-day is new when its stored row differs from the one last scored for it
+            position = self.seen_rows.index.get_indexer(keys)
+            fresh = (position < 0) | (self.seen_rows.to_numpy()[position] != row_hashes)
+            if fresh.any():
+                frames.append(rows[fresh])
+                maps.append(_row_map(keys[fresh], row_hashes[fresh]))
+                added.append(path)
+        self.seen['weather_files'] = current
+        if not added:
+            return None
+        rows = tableSchemas.to_typed(tableSchemas.concat(frames), 'weather_data')
+        row_map = pd.concat(maps)
+        self.seen_rows = _merge_row_maps(self.seen_rows, row_map)
+        keys = rows[['location', 'date']].drop_duplicates(ignore_index=True)
+        keys['location'] = keys['location'].astype(str)
+        return {'source': 'observations', 'files': [os.path.relpath(path, self.weather_dir) for path in added],
+                'keys': keys, 'rows': rows, 'row_map': row_map,
+                'arrived': max(current[path][1] / 1e9 for path in added),
+                'detected': detected, 'state': ('weather_files', current)}
+
+    def _weather_for(self, keys):
+        if keys.empty:
+            return tableSchemas.empty_frame('weather_data')
+        weather = read_weather(self.store_root, locations=sorted(keys['location'].unique()),
+                               start_date=keys['date'].min(), end_date=keys['date'].max())
+        weather = weather.assign(location=weather['location'].astype(str), date=pd.to_datetime(weather['date']))
+        return weather.merge(keys.assign(date=pd.to_datetime(keys['date'])), on=['location', 'date'])
+
+    def _load_images(self):
+        mtime = os.path.getmtime(self.images_path)
+        if self._images[0] != mtime:
+            self._images = (mtime, load_images(self.images_path))
+        return self._images[1]
+
+    def rescore(self, events):
+        """Score and fuse the station-days of one or more coalesced events and publish the rows"""
+        with runMetrics.span('rescore', events=len(events)) as span:
+            # New observations bring their own rows; alert events re-read the affected days from the store
+            frames = [event['rows'] for event in events if event['rows'] is not None]
+            alert_keys = [event['keys'] for event in events if event['rows'] is None]
+            if alert_keys:
+                frames.append(self._weather_for(pd.concat(alert_keys, ignore_index=True).drop_duplicates()))
+            weather = tableSchemas.concat(frames, 'weather_data')
+            weather = weather.assign(location=weather['location'].astype(str))
+            # Events are in arrival order, so the last row of a station-day is its newest
+            weather = weather.drop_duplicates(['location', 'date'], keep='last', ignore_index=True)
+            scored = weather.assign(**score_frame(weather, columns=['risk_category', 'haines_index']))
+            with self.lock:
+                alerts = load_alert_windows(self.index)
+            fused = fuse(scored, alerts, self._load_images())[RISK_COLUMNS]
+            model_report = self._analyse(fused) if self.model is not None else None
+            fused['updated_at'] = pd.Timestamp.now().floor('s')
+            self._publish(fused)
+            span['rows'] = len(fused)
+
+        emitted = time.time()
+        for event in events:
+            source, current = event['state']
+            self.state[source] = current
+            if 'row_map' in event:
+                self.scored_rows = _merge_row_maps(self.scored_rows, event['row_map'])
+            keys = event['keys']
+            rows = fused.merge(keys.assign(date=pd.to_datetime(keys['date'])), on=['location', 'date'])
+            record = {
+                'event_id': uuid.uuid4().hex[:12], 'source': event['source'], 'files': event['files'][:20],
+                'file_count': len(event['files']), 'station_days': len(keys), 'rows': len(rows),
+                'high_risk': int((rows['fire_risk_score'] > HIGH_RISK_SCORE).sum()),
+                'under_alert': int((rows['active_alerts'] > 0).sum()),
+                'detection_lag_s': round(event['detected'] - event['arrived'], 3),
+                'processing_s': round(emitted - event['detected'], 3),
+                'latency_s': round(emitted - event['arrived'], 3),
+                'emitted_at': pd.Timestamp(emitted, unit='s').isoformat(timespec='seconds'),
+                'model': model_report
+            }
+            runMetrics.count('rescore_events', source=event['source'])
+            runMetrics.observe('rescore_latency_seconds', record['latency_s'], source=event['source'])
+            self._log(record)
+            print(f"[{event['source']}] {record['file_count']} files -> {record['rows']} station-days re-scored "
+                  f"({record['high_risk']} high risk, {record['under_alert']} under an alert); "
+                  f"{record['latency_s']:.2f}s after arrival ({record['processing_s']:.2f}s processing)")
+            if self.on_update is not None:
+                self.on_update(record, rows)
+        self._save_state()
+        return fused
+
+    def _analyse(self, fused):
+        from batchInference import score_rows
+        selected = (fused['fire_risk_score'] > HIGH_RISK_SCORE) | (fused['active_alerts'] > 0)
+        for column in MODEL_COLUMNS.values():
+            fused[column] = None
+        if not selected.any():
+            return None
+        results, report = score_rows(fused[selected], self.model, self.inference_cache)
+        for source, column in MODEL_COLUMNS.items():
+            fused.loc[selected, column] = results[source].to_numpy(object)
+        return report
+
+    def _publish(self, fused):
+        """Upsert rows into the live risk table by (location, date), rewriting only the months they fall in"""
+        os.makedirs(self.output_path, exist_ok=True)
+        fused = fused.assign(risk_category=fused['risk_category'].astype(str))
+        for month, rows in fused.groupby(fused['date'].dt.strftime('%Y-%m')):
+            path = os.path.join(self.output_path, f"{month}.parquet")
+            if os.path.exists(path):
+                existing = pd.read_parquet(path)
+                replaced = existing.set_index(['location', 'date']).index.isin(rows.set_index(['location', 'date']).index)
+                rows = pd.concat([existing[~replaced], rows], ignore_index=True)
+            rows = rows.sort_values(['date', 'location'], ignore_index=True)
+            rows.to_parquet(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+
+    def _log(self, record):
+        os.makedirs(os.path.dirname(os.path.abspath(self.event_log)), exist_ok=True)
+        with open(self.event_log, 'a') as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+    async def _poll(self, scan, queue, stop):
+        while not stop.is_set():
+            try:
+                event = await asyncio.to_thread(scan)
+            except Exception as e:
+                print(f"  {scan.__name__} failed: {e}")
+                event = None
+            if event is not None:
+                await queue.put(event)
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, stop=None, max_events=None):
+        """Watch until stop is set (or max_events events have been handled)"""
+        stop = stop or asyncio.Event()
+        if await asyncio.to_thread(self.baseline):
+            print(f"First run: took {len(self.state['messages'])} messages and "
+                  f"{len(self.state['weather_files'])} weather files as already scored")
+        queue = asyncio.Queue()
+        pollers = [asyncio.create_task(self._poll(scan, queue, stop))
+                   for scan in (self.scan_messages, self.scan_observations)]
+        handled = 0
+        failed = []
+        try:
+            while not stop.is_set() and (max_events is None or handled < max_events):
+                # Events whose re-score failed are retried, with anything new, after the next wait
+                try:
+                    events = failed + [await asyncio.wait_for(queue.get(), self.interval)]
+                except asyncio.TimeoutError:
+                    if not failed:
+                        continue
+                    events = failed
+                # Coalesce whatever else arrived meanwhile into one re-score
+                while not queue.empty():
+                    events.append(queue.get_nowait())
+                try:
+                    await asyncio.to_thread(self.rescore, events)
+                except Exception as e:
+                    # Nothing is checkpointed, so a restart would also pick these events up again
+                    print(f"  re-score of {len(events)} events failed, will retry: {e}")
+                    runMetrics.count('rescore_errors')
+                    self._log({'source': 'error', 'error': repr(e), 'events': len(events),
+                               'files': sorted({path for event in events for path in event['files']})[:20],
+                               'emitted_at': pd.Timestamp.now().isoformat(timespec='seconds')})
+                    failed = events
+                    continue
+                failed = []
+                handled += len(events)
+        finally:
+            stop.set()
+            await asyncio.gather(*pollers)
+        return handled
+
+    def run_once(self):
+        """One scan of each source, for cron: returns the number of events handled"""
+        self.baseline()
+        events = [event for event in (self.scan_messages(), self.scan_observations()) if event is not None]
+        if events:
+            self.rescore(events)
+        return len(events)
+
+
+RED_FLAG_MESSAGE = """URGENT - FIRE WEATHER MESSAGE
+National Weather Service {office}
+{issued:%I:%M %p} PDT {issued:%a %b %d %Y}
+
+...RED FLAG WARNING IN EFFECT FROM 11 AM PDT {start:%a} UNTIL 08 PM PDT {end:%a} FOR GUSTY OFFSHORE WINDS AND LOW HUMIDITY...
+
+AFFECTED AREA...North Bay interior valleys and mountains.
+
+WINDS...Northeast winds 20 to 30 mph with gusts up to 55 mph.
+
+RELATIVE HUMIDITY...as low as 8 to 15 percent.
+
+IMPACTS...Any fires that develop will likely spread rapidly.
+"""
+
+
+def check_watcher(interval=0.2):
+    """Drop a red-flag warning and a new day of observations into a watched store and time the updates.
+
+    The first publish of the new day fails, so the event has to be retried. Afterwards
+    compaction must add no event and an upsert of one station-day exactly that station-day.
+    """
+    from generateSimulatedData import generate_weather_data_vectorized
+    from localStore import compact_partitions
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        messages_dir = shutil.copytree(MESSAGES_DIR, os.path.join(tmp, 'messages'))
+        store_root = os.path.join(tmp, 'store')
+        history = generate_weather_data_vectorized('2024-08-01', '2024-08-31', seed=0)
+        write_table(history, 'weather_data', store_root)
+        records = []
+        watcher = RiskWatcher(messages_dir, store_root, os.path.join(tmp, 'live_risk'),
+                              os.path.join(tmp, 'state.json'), os.path.join(tmp, 'events.jsonl'),
+                              interval=interval, on_update=lambda record, rows: records.append((record, rows)))
+        publish, failures = watcher._publish, []
+
+        def flaky_publish(fused):
+            if not failures and fused['date'].max() >= pd.Timestamp('2024-09-01'):
+                failures.append(len(fused))
+                raise OSError("simulated write failure")
+            publish(fused)
+
+        watcher._publish = flaky_publish
+
+        async def scenario():
+            stop = asyncio.Event()
+            watching = asyncio.create_task(watcher.run(stop, max_events=2))
+            await asyncio.sleep(interval * 3)
+            issued = pd.Timestamp('2024-08-20 03:30')
+            with open(os.path.join(messages_dir, 'red_flag_warning_MTR_2024-08-20_0_0.txt'), 'w') as f:
+                f.write(RED_FLAG_MESSAGE.format(office='MTR', issued=issued, start=issued,
+                                                end=issued + pd.Timedelta(days=1)))
+            await asyncio.sleep(interval * 5)
+            new_day = generate_weather_data_vectorized('2024-09-01', '2024-09-01', seed=1)
+            await asyncio.to_thread(write_table, new_day, 'weather_data', store_root)
+            await asyncio.wait_for(watching, timeout=60)
+
+        asyncio.run(scenario())
+        stations = len(history['location'].unique())
+        by_source = {record['source']: (record, rows) for record, rows in records}
+        alert_record, alert_rows = by_source.get('alerts', ({}, pd.DataFrame()))
+        days = sorted(alert_rows['date'].dt.strftime('%m-%d').unique()) if len(alert_rows) else []
+        print(f"  red-flag warning: {alert_record.get('rows')} station-days ({', '.join(days)}), "
+              f"{alert_record.get('under_alert')} under the alert, {alert_record.get('latency_s')}s after arrival")
+        # 11 AM PDT on the 20th until 8 PM PDT on the 21st is 18:00 UTC on the 20th to 03:00 UTC on the 22nd
+        ok &= days == ['08-20', '08-21', '08-22'] and alert_record.get('under_alert') == 3 * stations
+        observed_record, observed_rows = by_source.get('observations', ({}, pd.DataFrame()))
+        print(f"  new observations: {observed_record.get('rows')} station-days, "
+              f"{observed_record.get('latency_s')}s after arrival")
+        ok &= observed_record.get('rows') == stations
+
+        # The live table must match scoring and fusing the whole history from scratch
+        weather = read_weather(store_root)
+        weather = weather.assign(location=weather['location'].astype(str), date=pd.to_datetime(weather['date']))
+        scored = weather.assign(**score_frame(weather, columns=['risk_category', 'haines_index']))
+        expected = fuse(scored, load_alert_windows(watcher.index), load_images())[RISK_COLUMNS]
+        live = pd.read_parquet(watcher.output_path)
+        compared = live.merge(expected, on=['location', 'date'], suffixes=('', '_expected'))
+        mismatched = [column for column in ('fire_risk_score', 'haines_index', 'active_alerts', 'alert_reference',
+                                            'image_uri')
+                      if not compared[column].astype(str).equals(compared[f"{column}_expected"].astype(str))]
+        mismatched += [] if (compared['risk_category'] == compared['risk_category_expected'].astype(str)).all() \
+            else ['risk_category']
+        print(f"  {len(live)} live rows vs a full recompute: mismatched columns {mismatched or 'none'}")
+        ok &= len(compared) == len(live) and not mismatched
+
+        print(f"  failed publishes retried: {len(failures)}")
+        ok &= len(failures) == 1
+
+        restarted = RiskWatcher(messages_dir, store_root, watcher.output_path, watcher.state_path, watcher.event_log)
+        handled = restarted.run_once()
+        print(f"  restart with nothing new: {handled} events")
+        ok &= handled == 0
+
+        compacted = compact_partitions('weather_data', store_root)
+        handled = restarted.run_once()
+        print(f"  compaction rewrote {compacted} partitions: {handled} events")
+        ok &= compacted > 0 and handled == 0
+
+        records.clear()
+        restarted.on_update = lambda record, rows: records.append((record, rows))
+        new_day_row = read_weather(store_root, start_date='2024-09-01').head(1)
+        changed = new_day_row.assign(temp_max=new_day_row['temp_max'] + 10)
+        write_table(changed, 'weather_data', store_root)
+        restarted.run_once()
+        rescored = sum(record['rows'] for record, _ in records)
+        print(f"  upsert of one station-day: {rescored} station-days re-scored")
+        ok &= rescored == 1
+    return ok
+
+
+def _model(name):
+    if name == 'mock':
+        from batchInference import MockGeminiModel
+        return MockGeminiModel()
+    if name == 'bigquery':
+        from batchInference import DATASET_ID, MODEL_NAME, BigQueryModel
+        from localQueryEngine import get_client
+        project_id = os.environ["PROJECT_ID"]
+        return BigQueryModel(get_client(project_id, backend='bigquery'), f"{project_id}.{DATASET_ID}.{MODEL_NAME}")
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score station-days as new alerts and observations arrive")
+    parser.add_argument('--messages-dir', default=MESSAGES_DIR)
+    parser.add_argument('--store-root', default=STORE_ROOT)
+    parser.add_argument('--output', default=LIVE_RISK_PATH)
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS, help="seconds between polls")
+    parser.add_argument('--model', choices=['none', 'mock', 'bigquery'], default='none',
+                        help="also run the multimodal analysis on high-risk or alerted rows")
+    parser.add_argument('--once', action='store_true', help="handle what arrived since the last run and exit")
+    parser.add_argument('--check', action='store_true', help="drop an alert and observations into a temporary store")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        print("Checking incremental re-scoring...")
+        return 0 if check_watcher() else 1
+    model = _model(args.model)
+    cache = None
+    if model is not None:
+        from batchInference import INFERENCE_CACHE_PATH
+        from responseCache import ResponseCache
+        cache = ResponseCache(INFERENCE_CACHE_PATH)
+    watcher = RiskWatcher(args.messages_dir, args.store_root, args.output, interval=args.interval, model=model,
+                          inference_cache=cache)
+    if args.once:
+        print(f"{watcher.run_once()} events -> {args.output}")
+        return 0
+
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        print(f"Watching {args.messages_dir} and {watcher.weather_dir} every {args.interval}s -> {args.output}")
+        return await watcher.run(stop)
+
+    print(f"Handled {asyncio.run(serve())} events; log in {watcher.event_log}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+
+RUNS_DIR = './data/runs'
+METRICS_PREFIX = 'infernocast'
+PROFILE_TOP = 20
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class RunMetrics:
+    """Spans, counters and latency observations for one workflow run.
+
+    Spans nest per thread and record wall time plus any attributes set on them (rows, bytes,
+    paths). Counters and observations are keyed by name and label set. Everything is
+    thread-safe, so collector worker threads can record into the same run.
+    """
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.counters = defaultdict(float)
+        self.observations = defaultdict(list)
+        self.jobs = []
+        self.profile = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a stage; yields the span dict so callers can attach attributes such as rows"""
+        stack = self.local.__dict__.setdefault('stack', [])
+        record = {'name': name, 'parent': stack[-1]['name'] if stack else None,
+                  'thread': threading.current_thread().name,
+                  'start_s': round(time.perf_counter() - self.origin, 6), **attributes}
+        stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record['duration_s'] = round(time.perf_counter() - start, 6)
+            stack.pop()
+            with self.lock:
+                self.spans.append(record)
+
+    def count(self, name, amount=1, **labels):
+        with self.lock:
+            self.counters[(name, _label_key(labels))] += amount
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            self.observations[(name, _label_key(labels))].append(value)
+
+    def record_rows(self, stage, rows, num_bytes=None):
+        """Count rows (and optionally bytes) moved by a stage"""
+        self.count('rows', rows, stage=stage)
+        if num_bytes is not None:
+            self.count('bytes', num_bytes, stage=stage)
+
+    def record_job(self, job, stage):
+        """Record a finished BigQuery job's id and the bytes it processed or loaded"""
+        info = {'stage': stage, 'job_id': getattr(job, 'job_id', None),
+                'job_type': getattr(job, 'job_type', None) or type(job).__name__}
+        for field in ('total_bytes_processed', 'total_bytes_billed', 'output_rows', 'output_bytes',
+                      'num_dml_affected_rows', 'slot_millis'):
+            value = getattr(job, field, None)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                info[field] = value
+        with self.lock:
+            self.jobs.append(info)
+        self.count('bigquery_jobs', stage=stage)
+        self.count('bigquery_bytes_processed', info.get('total_bytes_processed', 0) or 0, stage=stage)
+        return job
+
+    def report(self):
+        """Plain-dict run report: span timings, stage totals, counters, latency summaries and jobs"""
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span['start_s'])
+            counters = dict(self.counters)
+            observations = {key: list(values) for key, values in self.observations.items()}
+            jobs = list(self.jobs)
+
+        stages = defaultdict(lambda: {'calls': 0, 'seconds': 0.0})
+        for span in spans:
+            stages[span['name']]['calls'] += 1
+            stages[span['name']]['seconds'] = round(stages[span['name']]['seconds'] + span['duration_s'], 6)
+        return {
+            'run_id': self.run_id,
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'wall_time_s': round(time.perf_counter() - self.origin, 3),
+            'argv': sys.argv,
+            'stages': dict(stages),
+            'spans': spans,
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(counters.items())],
+            'latencies': [{'name': name, 'labels': dict(labels), **_summary(values)}
+                          for (name, labels), values in sorted(observations.items())],
+            'bigquery_jobs': jobs,
+            'profile': self.profile
+        }
+
+    def write_report(self, path=None):
+        """Write the JSON run report (default ./data/runs/run_<run_id>.json) and return its path"""
+        path = path or os.path.join(RUNS_DIR, f"run_{self.run_id}.json")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=1, default=str)
+        return path
+
+    def write_prometheus(self, path):
+        """Write the run as a Prometheus text-format file (e.g. for node_exporter's textfile collector)"""
+        report = self.report()
+        lines = []
+
+        def metric(name, kind, samples):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{str(val)}"' for key, val in labels.items())
+                label_text = f"{{{label_text}}}" if label_text else ''
+                lines.append(f"{METRICS_PREFIX}_{name}{suffix}{label_text} {value:g}")
+
+        metric('stage_duration_seconds', 'gauge',
+               [('', {'stage': stage}, totals['seconds']) for stage, totals in report['stages'].items()])
+        metric('stage_calls', 'gauge',
+               [('', {'stage': stage}, totals['calls']) for stage, totals in report['stages'].items()])
+        by_name = defaultdict(list)
+        for counter in report['counters']:
+            by_name[counter['name']].append(('', counter['labels'], counter['value']))
+        for name, samples in by_name.items():
+            metric(f"{name}_total", 'counter', samples)
+        by_name = defaultdict(list)
+        for latency in report['latencies']:
+            for quantile in ('0.5', '0.95', '0.99'):
+                by_name[latency['name']].append(('', {**latency['labels'], 'quantile': quantile},
+                                                 latency[f"p{int(float(quantile) * 100)}"]))
+            by_name[latency['name']].append(('_sum', latency['labels'], latency['sum']))
+            by_name[latency['name']].append(('_count', latency['labels'], latency['count']))
+        for name, samples in by_name.items():
+            metric(name, 'summary', samples)
+        metric('run_wall_time_seconds', 'gauge', [('', {}, report['wall_time_s'])])
+
+        # Write then rename so a scraper never reads a half-written file
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(f"{path}.tmp", 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(f"{path}.tmp", path)
+        return path
+
+
+def _summary(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'count': int(len(values)), 'sum': round(float(values.sum()), 6),
+        'p50': round(float(np.percentile(values, 50)), 6), 'p95': round(float(np.percentile(values, 95)), 6),
+        'p99': round(float(np.percentile(values, 99)), 6), 'max': round(float(values.max()), 6)
+    }
+
+
+class StackSampler:
+    """Sampling profiler: records the stacks of every thread at a fixed interval.
+
+    Unlike cProfile it sees the collector's worker threads and costs little enough to leave on
+    for a whole run. Reports how often each function was on a stack (inclusive) and on top (self).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.inclusive = Counter()
+        self.exclusive = Counter()
+        self.samples = 0
+        self.running = False
+        self.thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                seen = set()
+                top = True
+                while frame is not None:
+                    code = frame.f_code
+                    key = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+                    if top:
+                        self.exclusive[key] += 1
+                        top = False
+                    if key not in seen:
+                        self.inclusive[key] += 1
+                        seen.add(key)
+                    frame = frame.f_back
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name='stack-sampler')
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def top(self, limit=PROFILE_TOP):
+        return [{'function': key, 'inclusive': count, 'self': self.exclusive[key]}
+                for key, count in self.inclusive.most_common(limit)]
+
+
+class PeakMemory:
+    """Sample resident set size on a background thread while a stage runs"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.baseline = self.peak = _rss_bytes()
+        self.running = False
+        self.thread = None
+
+    def _sample(self):
+        while self.running:
+            self.peak = max(self.peak, _rss_bytes())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # ru_maxrss is a high-water mark (KiB on Linux, bytes on macOS); good enough off Linux
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+@contextmanager
+def profiled(mode=None, output=None, run=None):
+    """Opt-in profiling of the enclosed block: mode 'cprofile' or 'sample' (None does nothing).
+
+    cProfile stats are dumped to output (a .prof file for snakeviz/pstats); sampled stacks are
+    printed and attached to the run report.
+    """
+    run = run or metrics
+    if not mode:
+        yield None
+        return
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            output = output or os.path.join(RUNS_DIR, f"profile_{run.run_id}.prof")
+            os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+            profiler.dump_stats(output)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            print(text.getvalue())
+            run.profile = {'mode': mode, 'output': output}
+    elif mode == 'sample':
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield sampler
+        finally:
+            sampler.stop()
+            top = sampler.top()
+            print(f"Sampled {sampler.samples} stack snapshots; hottest functions (inclusive / self samples):")
+            for entry in top:
+                print(f"  {entry['inclusive']:>6} {entry['self']:>6}  {entry['function']}")
+            run.profile = {'mode': mode, 'samples': sampler.samples, 'top': top}
+    else:
+        raise ValueError(f"Unknown profile mode: {mode} (use 'cprofile' or 'sample')")
+
+
+# Process-wide run that the collection, generation and upload code records into
+metrics = RunMetrics()
+
+
+def span(name, **attributes):
+    return metrics.span(name, **attributes)
+
+
+def count(name, amount=1, **labels):
+    metrics.count(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    metrics.observe(name, value, **labels)
+
+
+def record_rows(stage, rows, num_bytes=None):
+    metrics.record_rows(stage, rows, num_bytes)
+
+
+def record_job(job, stage):
+    return metrics.record_job(job, stage)
+
+
+def traced(name):
+    """Decorator that wraps every call of a function in a span"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def reset(run_id=None):
+    """Start a fresh process-wide run, e.g. between benchmark cases"""
+    global metrics
+    metrics = RunMetrics(run_id)
+    return metrics
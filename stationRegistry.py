@@ -0,0 +1,345 @@
+import os
+import sys
+import time
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+STATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stations.csv')
+STATION_COLUMNS = ['name', 'latitude', 'longitude', 'county', 'region', 'nws_office', 'ghcnd_id']
+EARTH_RADIUS_KM = 6371.0088
+
+# (min lat, max lat, min lon, max lon) of California, used to scatter synthetic stations
+CALIFORNIA_BOUNDS = (32.5, 42.0, -124.4, -114.1)
+
+# Rings of grid cells scanned around a query before falling back to a brute-force scan
+SEARCH_RINGS = (1, 2, 4)
+# Cap on query x cell lookups held in memory at once
+_CHUNK_LOOKUPS = 2_000_000
+_CODE_BITS = 21
+_CODE_OFFSET = 1 << (_CODE_BITS - 1)
+
+
+def unit_vectors(latitudes, longitudes):
+    """Latitude/longitude in degrees -> (n, 3) points on the unit sphere"""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1).reshape(-1, 3)
+
+
+def chord_to_km(chord):
+    """Straight-line distance between unit vectors -> great-circle distance in km"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _default_cell_km(latitudes, longitudes):
+    """Cell size giving a few points per occupied cell for points spread over their bounding box"""
+    latitudes, longitudes = np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64)
+    if len(latitudes) < 2:
+        return 50.0
+    km_per_degree = np.pi * EARTH_RADIUS_KM / 180
+    height = np.ptp(latitudes) * km_per_degree
+    width = np.ptp(longitudes) * km_per_degree * np.cos(np.radians(np.abs(latitudes).mean()))
+    return float(np.clip(1.4 * np.sqrt(max(height * width, height ** 2, width ** 2, 1.0) / len(latitudes)), 0.5, 1000))
+
+
+class GridIndex:
+    """Uniform grid over unit-sphere coordinates for bulk k-nearest and radius queries.
+
+    Points are bucketed into cubic cells of about cell_km; a query scans the cells within a few
+    rings of its own and only falls back to a brute-force scan when those hold too few points.
+    Straight-line distance between unit vectors ranks points exactly like great-circle distance,
+    so results match a brute-force haversine search.
+    """
+
+    def __init__(self, latitudes, longitudes, cell_km=None):
+        self.points = unit_vectors(latitudes, longitudes)
+        self.cell_km = cell_km or _default_cell_km(latitudes, longitudes)
+        self.cell = self.cell_km / EARTH_RADIUS_KM
+        codes = self._codes(np.floor(self.points / self.cell).astype(np.int64))
+        self.order = np.argsort(codes, kind='stable')
+        self.cell_codes, self.cell_starts, self.cell_counts = np.unique(codes[self.order], return_index=True,
+                                                                        return_counts=True)
+
+    def __len__(self):
+        return len(self.points)
+
+    @staticmethod
+    def _codes(cells):
+        cells = cells + _CODE_OFFSET
+        return (cells[..., 0] << (2 * _CODE_BITS)) | (cells[..., 1] << _CODE_BITS) | cells[..., 2]
+
+    def _candidates(self, queries, ring):
+        """(query position, point index) pairs for every point in the cells within ring of each query"""
+        if not len(self.cell_codes):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        steps = np.arange(-ring, ring + 1)
+        offsets = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'), axis=-1).reshape(-1, 3)
+        codes = self._codes(np.floor(queries / self.cell).astype(np.int64)[:, None, :] + offsets)
+        slots = np.minimum(np.searchsorted(self.cell_codes, codes), len(self.cell_codes) - 1)
+        hit = self.cell_codes[slots] == codes
+        starts, counts = self.cell_starts[slots[hit]], self.cell_counts[slots[hit]]
+        owners = np.repeat(np.nonzero(hit)[0], counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return owners, self.order[np.repeat(starts, counts) + within]
+
+    def _chunks(self, num_queries, ring):
+        size = max(1, _CHUNK_LOOKUPS // (2 * ring + 1) ** 3)
+        return range(0, num_queries, size), size
+
+    def _brute_force(self, queries, k):
+        size = max(1, _CHUNK_LOOKUPS // max(len(self.points), 1))
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        for start in range(0, len(queries), size):
+            # |q - p|^2 = 2 - 2 q.p for unit vectors
+            squared = 2 - 2 * queries[start:start + size] @ self.points.T
+            nearest = np.argpartition(squared, k - 1, axis=1)[:, :k] if k < len(self.points) else \
+                np.broadcast_to(np.arange(len(self.points)), (len(squared), len(self.points))).copy()
+            order = np.argsort(np.take_along_axis(squared, nearest, axis=1), axis=1, kind='stable')
+            indices[start:start + size] = np.take_along_axis(nearest, order, axis=1)
+        return indices
+
+    def query(self, latitudes, longitudes, k=1):
+        """Indices and great-circle distances (km) of the k nearest points to each query, nearest first.
+
+        Both arrays are (num_queries, k); when the index holds fewer than k points the extra
+        slots are -1 and inf.
+        """
+        queries = unit_vectors(latitudes, longitudes)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        chords = np.full((len(queries), k), np.inf)
+        k_found = min(k, len(self.points))
+        if not k_found:
+            return indices, chords
+        pending = np.arange(len(queries))
+        for ring in SEARCH_RINGS:
+            chunks, size = self._chunks(len(pending), ring)
+            resolved = np.zeros(len(pending), dtype=bool)
+            for start in chunks:
+                rows = pending[start:start + size]
+                owners, candidates = self._candidates(queries[rows], ring)
+                distance = np.linalg.norm(queries[rows][owners] - self.points[candidates], axis=1)
+                # Chords are at most 2, so owner * 4 + chord sorts by query, then distance
+                order = np.argsort(owners * 4 + distance)
+                owners, candidates, distance = owners[order], candidates[order], distance[order]
+                rank = np.arange(len(owners)) - np.searchsorted(owners, owners)
+                keep = rank < k_found
+                indices[rows[owners[keep]], rank[keep]] = candidates[keep]
+                chords[rows[owners[keep]], rank[keep]] = distance[keep]
+                # Every point closer than ring cells lies inside the scanned cube, so a k-th
+                # neighbour within that distance cannot be beaten by a point outside it
+                resolved[start:start + size] = chords[rows, k_found - 1] <= ring * self.cell
+            pending = pending[~resolved]
+            if not len(pending):
+                break
+        if len(pending):
+            found = self._brute_force(queries[pending], k_found)
+            indices[pending, :k_found] = found
+            chords[pending, :k_found] = np.linalg.norm(queries[pending][:, None, :] - self.points[found], axis=2)
+        return indices, chord_to_km(chords)
+
+    def within(self, latitudes, longitudes, radius_km):
+        """Every (query, point, distance_km) pair within radius_km, sorted by query then distance"""
+        queries = unit_vectors(latitudes, longitudes)
+        limit = km_to_chord(radius_km)
+        ring = int(np.ceil(limit / self.cell))
+        owners, candidates = [], []
+        if ring <= SEARCH_RINGS[-1]:
+            chunks, size = self._chunks(len(queries), ring)
+            for start in chunks:
+                chunk_owners, chunk_candidates = self._candidates(queries[start:start + size], ring)
+                owners.append(chunk_owners + start)
+                candidates.append(chunk_candidates)
+        else:
+            size = max(1, _CHUNK_LOOKUPS // max(len(self.points), 1))
+            for start in range(0, len(queries), size):
+                rows, points = np.nonzero(2 - 2 * queries[start:start + size] @ self.points.T <= (limit * 1.0001) ** 2)
+                owners.append(rows + start)
+                candidates.append(points)
+        owners = np.concatenate(owners) if owners else np.array([], dtype=np.int64)
+        candidates = np.concatenate(candidates) if candidates else np.array([], dtype=np.int64)
+        distance = np.linalg.norm(queries[owners] - self.points[candidates], axis=1)
+        inside = distance <= limit
+        owners, candidates, distance = owners[inside], candidates[inside], distance[inside]
+        order = np.lexsort((distance, owners))
+        return owners[order], candidates[order], chord_to_km(distance[order])
+
+
+class StationRegistry:
+    """Weather stations loaded from a data file, with a spatial index for nearest-station lookups"""
+
+    def __init__(self, stations, cell_km=None):
+        self.stations = stations.reset_index(drop=True)
+        self.index = GridIndex(self.stations['latitude'].to_numpy(), self.stations['longitude'].to_numpy(), cell_km)
+
+    @classmethod
+    def from_csv(cls, path=STATIONS_PATH, cell_km=None):
+        stations = pd.read_csv(path, dtype={'name': str, 'county': str, 'region': str, 'nws_office': str, 'ghcnd_id': str})
+        missing = [column for column in ('name', 'latitude', 'longitude') if column not in stations]
+        if missing:
+            raise ValueError(f"{path} is missing station columns {missing}")
+        if stations['name'].duplicated().any():
+            raise ValueError(f"{path} has duplicate station names: {sorted(stations['name'][stations['name'].duplicated()])}")
+        return cls(stations.reindex(columns=STATION_COLUMNS), cell_km)
+
+    @classmethod
+    def synthetic(cls, num_stations, bounds=CALIFORNIA_BOUNDS, seed=0, cell_km=None):
+        """The shipped stations plus Station_NNNNN points scattered over bounds, for scale tests.
+
+        Names follow generateSimulatedData.station_names, so simulated weather for N stations
+        lines up with a synthetic registry of N stations.
+        """
+        base = cls.from_csv().stations.iloc[:num_stations]
+        extra = num_stations - len(base)
+        rng = np.random.default_rng(seed)
+        min_lat, max_lat, min_lon, max_lon = bounds
+        scattered = pd.DataFrame({
+            'name': [f"Station_{i:05d}" for i in range(len(base), num_stations)],
+            'latitude': rng.uniform(min_lat, max_lat, extra).round(4),
+            'longitude': rng.uniform(min_lon, max_lon, extra).round(4),
+            'region': 'California'
+        })
+        return cls(pd.concat([base, scattered], ignore_index=True).reindex(columns=STATION_COLUMNS), cell_km)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def names(self):
+        return self.stations['name'].tolist()
+
+    def locations(self):
+        """Stations in the {'name', 'lat', 'lon'} form the collectors take, plus 'ghcnd_id' for NOAA stations"""
+        locations = []
+        for name, lat, lon, ghcnd_id in self.stations[['name', 'latitude', 'longitude', 'ghcnd_id']].itertuples(index=False):
+            location = {'name': name, 'lat': float(lat), 'lon': float(lon)}
+            if isinstance(ghcnd_id, str) and ghcnd_id:
+                location['ghcnd_id'] = ghcnd_id
+            locations.append(location)
+        return locations
+
+    def station_regions(self):
+        stations = self.stations.dropna(subset=['region'])
+        return dict(zip(stations['name'], stations['region']))
+
+    def region_offices(self):
+        """Region -> the NWS offices whose alerts cover its stations"""
+        stations = self.stations.dropna(subset=['region', 'nws_office'])
+        return {region: sorted(offices.unique()) for region, offices in stations.groupby('region')['nws_office']}
+
+    def select(self, region):
+        """Stations whose region or county matches (case-insensitive)"""
+        wanted = region.lower()
+        match = (self.stations['region'].astype(str).str.lower() == wanted) | \
+            (self.stations['county'].astype(str).str.lower() == wanted)
+        if not match.any():
+            raise ValueError(f"No stations in region or county {region!r}")
+        return StationRegistry(self.stations[match], self.index.cell_km)
+
+    def nearest(self, latitudes, longitudes, k=1):
+        """Long frame of the k nearest stations per query point: query (position), rank, location, distance_km"""
+        indices, distances = self.index.query(latitudes, longitudes, k)
+        found = indices >= 0
+        queries, ranks = np.nonzero(found)
+        return pd.DataFrame({
+            'query': queries,
+            'rank': ranks + 1,
+            'location': self.stations['name'].to_numpy()[indices[found]],
+            'distance_km': distances[found].round(3)
+        })
+
+    def within(self, latitudes, longitudes, radius_km):
+        """Long frame of every station within radius_km of each query point"""
+        queries, stations, distances = self.index.within(latitudes, longitudes, radius_km)
+        return pd.DataFrame({'query': queries, 'location': self.stations['name'].to_numpy()[stations],
+                             'distance_km': distances.round(3)})
+
+
+@lru_cache(maxsize=None)
+def load_registry(path=STATIONS_PATH):
+    """The station registry at path, loaded once per process"""
+    return StationRegistry.from_csv(path)
+
+
+def match_fires(fires, registry=None, k=3, columns=('fire_name', 'fire_year')):
+    """Link each fire origin to its k nearest stations.
+
+    Returns one row per (fire, station) with the fire's columns, rank (1 = nearest), location
+    and distance_km. Fires without coordinates are dropped.
+    """
+    registry = registry or load_registry()
+    fires = fires.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    matches = registry.nearest(fires['latitude'].to_numpy(), fires['longitude'].to_numpy(), k)
+    origin = fires[list(columns)].iloc[matches['query']].reset_index(drop=True)
+    return pd.concat([origin, matches.drop(columns='query')], axis=1)
+
+
+def verify_index(num_stations=3000, num_queries=2000, k=5, radius_km=25.0, seed=0):
+    """Check grid k-nearest and radius results against a brute-force haversine scan"""
+    rng = np.random.default_rng(seed)
+    # Uniform stations plus a dense cluster, so both sparse and crowded cells are exercised
+    registry = StationRegistry.synthetic(num_stations, seed=seed)
+    clustered = registry.stations.copy()
+    clustered.loc[:num_stations // 3, ['latitude', 'longitude']] = np.column_stack([
+        rng.normal(38.4, 0.05, num_stations // 3 + 1), rng.normal(-122.4, 0.05, num_stations // 3 + 1)])
+    ok = True
+    for label, stations in (('uniform', registry.stations), ('clustered', clustered)):
+        registry = StationRegistry(stations)
+        lat = rng.uniform(32.0, 42.5, num_queries)
+        lon = rng.uniform(-125.0, -113.5, num_queries)
+        brute = haversine_km(lat[:, None], lon[:, None], stations['latitude'].to_numpy()[None, :],
+                             stations['longitude'].to_numpy()[None, :])
+        indices, distances = registry.index.query(lat, lon, k)
+        expected = np.sort(brute, axis=1)[:, :k]
+        knn_errors = int((np.abs(distances - expected) > 1e-6).any(axis=1).sum())
+
+        queries, points, _ = registry.index.within(lat, lon, radius_km)
+        expected_pairs = set(zip(*np.nonzero(brute <= radius_km)))
+        radius_errors = len(expected_pairs.symmetric_difference(zip(queries, points)))
+        print(f"  {label}: k={k} nearest mismatches {knn_errors}/{num_queries}, "
+              f"{radius_km:g} km radius pair mismatches {radius_errors} of {len(expected_pairs)}")
+        ok &= knn_errors == 0 and radius_errors == 0
+    return ok
+
+
+def benchmark_lookups(num_stations=5000, num_fires=100_000, k=3, seed=0):
+    """Time building the index and matching num_fires random fire origins to their k nearest stations"""
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    registry = StationRegistry.synthetic(num_stations, seed=seed)
+    build = time.perf_counter() - start
+    min_lat, max_lat, min_lon, max_lon = CALIFORNIA_BOUNDS
+    fires = pd.DataFrame({'fire_name': [f"Fire {i}" for i in range(num_fires)], 'fire_year': 2020,
+                          'latitude': rng.uniform(min_lat, max_lat, num_fires),
+                          'longitude': rng.uniform(min_lon, max_lon, num_fires)})
+    start = time.perf_counter()
+    matches = match_fires(fires, registry, k)
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {num_stations:,} stations in {build * 1000:.1f} ms (cell {registry.index.cell_km:.1f} km); "
+          f"matched {num_fires:,} fires to {k} nearest stations in {elapsed:.3f}s "
+          f"({elapsed / num_fires * 1e6:.2f} us per lookup, {len(matches):,} matches)")
+    return elapsed / num_fires
+
+
+if __name__ == "__main__":
+    if "--verify" in sys.argv:
+        print("Checking grid index against brute-force haversine search...")
+        sys.exit(0 if verify_index() else 1)
+    elif "--benchmark" in sys.argv:
+        benchmark_lookups()
+    else:
+        from collectRealData import collect_real_fire_data
+        registry = load_registry()
+        print(f"{len(registry)} stations in {STATIONS_PATH}")
+        with pd.option_context('display.width', 200):
+            print(match_fires(collect_real_fire_data(), registry, k=2).to_string(index=False))
@@ -0,0 +1,250 @@
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+
+# One definition per table: (name, BigQuery type, in-memory/on-disk type, description).
+# Frames use the compact type directly: categorical strings, datetime64 dates, float32
+# measurements and the smallest integer that holds each field's range. Capitalised integer
+# kinds (Int8, ...) are pandas nullable integers, for fields some sources do not observe
+# (NOAA station rows have no humidity, wind or pressure). BigQuery keeps its 64-bit types;
+# the load converts on the way in.
+TABLE_FIELDS = {
+    'weather_data': [
+        ('location', 'STRING', 'category', 'Weather station location name'),
+        ('date', 'DATE', 'date', 'Date of weather observation'),
+        ('temp_max', 'FLOAT64', 'float32', 'Maximum temperature in Fahrenheit'),
+        ('humidity', 'INT64', 'Int8', 'Relative humidity percentage'),
+        ('wind_speed', 'FLOAT64', 'float32', 'Wind speed in mph'),
+        ('wind_deg', 'INT64', 'Int16', 'Wind direction in degrees'),
+        ('pressure', 'INT64', 'Int16', 'Atmospheric pressure in hPa'),
+        ('visibility', 'INT64', 'Int32', 'Visibility in meters'),
+        ('uvi', 'FLOAT64', 'float32', 'UV index'),
+        ('fire_risk_score', 'FLOAT64', 'float32', 'Calculated fire risk score 0-1'),
+        ('temp_min', 'FLOAT64', 'float32', 'Minimum temperature in Fahrenheit'),
+        ('precipitation', 'FLOAT64', 'float32', 'Precipitation in inches'),
+        ('sunshine', 'INT64', 'Int32', 'Seconds of sunshine in the day'),
+        ('source', 'STRING', 'category', 'Origin of the row: simulated, open_meteo, open_meteo_hourly or noaa')
+    ],
+    'fire_history': [
+        ('fire_name', 'STRING', 'string', 'Name of the fire incident'),
+        ('fire_year', 'INT64', 'int16', 'Year the fire occurred'),
+        ('alarm_date', 'DATE', 'date', 'Date fire was first reported'),
+        ('contained_date', 'DATE', 'date', 'Date fire was contained'),
+        ('acres', 'FLOAT64', 'float32', 'Total acres burned'),
+        ('cause', 'STRING', 'category', 'Cause of fire ignition'),
+        ('latitude', 'FLOAT64', 'float64', 'Latitude of fire origin'),
+        ('longitude', 'FLOAT64', 'float64', 'Longitude of fire origin'),
+        ('county', 'STRING', 'category', 'County where fire occurred')
+    ],
+    'fuel_dryness': [
+        ('location', 'STRING', 'category', 'Weather station location name'),
+        ('date', 'DATE', 'date', 'Date the features describe'),
+        ('days_since_wet', 'FLOAT64', 'float32', 'Days since humidity last reached the wet-day threshold'),
+        ('humidity_min_7d', 'FLOAT64', 'float32', 'Lowest humidity over the last 7 days'),
+        ('humidity_min_30d', 'FLOAT64', 'float32', 'Lowest humidity over the last 30 days'),
+        ('heat_accum_7d', 'FLOAT64', 'float32', 'Degree-days above 80F over the last 7 days'),
+        ('heat_accum_30d', 'FLOAT64', 'float32', 'Degree-days above 80F over the last 30 days'),
+        ('heat_since_wet', 'FLOAT64', 'float32', 'Degree-days above 80F since the last wet day'),
+        ('wind_events_7d', 'INT64', 'int8', 'Days with wind of 25 mph or more in the last 7 days'),
+        ('wind_events_30d', 'INT64', 'int8', 'Days with wind of 25 mph or more in the last 30 days')
+    ],
+    'weather_hourly': [
+        ('location', 'STRING', 'category', 'Weather station location name'),
+        ('date', 'DATE', 'date', 'Local date of the observation'),
+        ('hour', 'INT64', 'int8', 'Local hour of the observation (0-23)'),
+        ('temperature', 'FLOAT64', 'float32', 'Temperature in Fahrenheit'),
+        ('humidity', 'INT64', 'int8', 'Relative humidity percentage'),
+        ('wind_speed', 'FLOAT64', 'float32', 'Wind speed in mph'),
+        ('wind_gust', 'FLOAT64', 'float32', 'Wind gust in mph'),
+        ('wind_deg', 'INT64', 'int16', 'Wind direction in degrees'),
+        ('pressure', 'INT64', 'int16', 'Atmospheric pressure in hPa'),
+        ('sunshine', 'INT64', 'int16', 'Seconds of sunshine in the hour')
+    ],
+    'fire_weather_daily': [
+        ('location', 'STRING', 'category', 'Weather station location name'),
+        ('date', 'DATE', 'date', 'Local date the rollup covers'),
+        ('hours_observed', 'INT64', 'int8', 'Hourly observations in the day'),
+        ('min_humidity', 'INT64', 'int8', 'Lowest hourly relative humidity'),
+        ('max_gust', 'FLOAT64', 'float32', 'Highest hourly wind gust in mph'),
+        ('hours_rh_below_15', 'INT64', 'int8', 'Hours with relative humidity below 15%'),
+        ('hours_rh_below_25', 'INT64', 'int8', 'Hours with relative humidity below 25%'),
+        ('red_flag_hours', 'INT64', 'int8', 'Hours meeting red-flag humidity and wind criteria together'),
+        ('longest_red_flag_run', 'INT64', 'int8', 'Longest run of consecutive red-flag hours'),
+        ('first_red_flag_hour', 'INT64', 'int8', 'Local hour of the first red-flag hour, -1 if none')
+    ]
+}
+
+TABLE_OPTIONS = {
+    'weather_data': 'Weather data for Napa Valley fire risk analysis',
+    'fire_history': 'Historical fire incidents in Napa County',
+    'fuel_dryness': 'Rolling fuel-dryness features per station and day',
+    'weather_hourly': 'Hourly weather observations per station',
+    'fire_weather_daily': 'Daily fire-weather rollups of the hourly observations'
+}
+
+DATE_DTYPE = 'datetime64[s]'
+
+# int16 indices leave room for non-partition categoricals with many values (fire_history.cause)
+_ARROW_TYPES = {
+    'category': pa.dictionary(pa.int16(), pa.string()),
+    'string': pa.string(),
+    'date': pa.date32(),
+    'float32': pa.float32(),
+    'float64': pa.float64(),
+    'int8': pa.int8(),
+    'int16': pa.int16(),
+    'int32': pa.int32(),
+    'Int8': pa.int8(),
+    'Int16': pa.int16(),
+    'Int32': pa.int32()
+}
+
+
+def columns(table_name):
+    return [name for name, _, _, _ in TABLE_FIELDS[table_name]]
+
+
+def date_columns(table_name):
+    return [name for name, _, kind, _ in TABLE_FIELDS[table_name] if kind == 'date']
+
+
+def pandas_dtypes(table_name):
+    """Column -> pandas dtype of the compact in-memory representation"""
+    dtypes = {}
+    for name, _, kind, _ in TABLE_FIELDS[table_name]:
+        dtypes[name] = DATE_DTYPE if kind == 'date' else 'str' if kind == 'string' else kind
+    return dtypes
+
+
+def _typed_column(values, kind):
+    if kind == 'date':
+        return pd.to_datetime(values).astype(DATE_DTYPE)
+    if kind == 'category':
+        return values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+    if kind == 'string':
+        return values
+    if kind.lower().startswith('int'):
+        # Round first so a float column holding whole numbers casts exactly
+        values = pd.to_numeric(values)
+        return (values.round() if values.dtype.kind == 'f' else values).astype(kind)
+    return pd.to_numeric(values).astype(kind)
+
+
+def to_typed(df, table_name):
+    """Return df with the table's columns cast to their compact types (a no-op for typed frames)"""
+    if df is None or df.empty and not len(df.columns):
+        return empty_frame(table_name)
+    typed = {}
+    for name, _, kind, _ in TABLE_FIELDS[table_name]:
+        if name in df:
+            typed[name] = _typed_column(df[name], kind)
+    return df.assign(**typed)
+
+
+def empty_frame(table_name):
+    return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in pandas_dtypes(table_name).items()})
+
+
+def concat(frames, table_name=None):
+    """Concatenate frames, merging categorical columns' categories instead of falling back to object.
+
+    With a table_name every frame is first cast to that table's compact types.
+    """
+    frames = [frame for frame in frames if frame is not None and len(frame)]
+    if table_name is not None:
+        frames = [to_typed(frame, table_name) for frame in frames]
+    if not frames:
+        return empty_frame(table_name) if table_name is not None else pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    for name in frames[0].columns:
+        if all(isinstance(frame[name].dtype, pd.CategoricalDtype) for frame in frames if name in frame):
+            categories = union_categoricals([frame[name].array for frame in frames if name in frame]).categories
+            frames = [frame.assign(**{name: frame[name].cat.set_categories(categories)}) if name in frame else frame
+                      for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def widen_float32(values):
+    """float32 -> float64 at the shortest decimal that round-trips (0.6 stays 0.6, not 0.6000000238)"""
+    narrow = np.asarray(values, dtype=np.float32)
+    wide = narrow.astype(np.float64)
+    todo = np.flatnonzero(np.isfinite(wide) & (wide != 0))
+    magnitude = np.floor(np.log10(np.abs(wide[todo])))
+    # Every float32 round-trips through 9 significant digits; most stored values need 6
+    for digits in range(6, 10):
+        scale = 10.0 ** (digits - 1 - magnitude)
+        candidate = np.round(wide[todo] * scale) / scale
+        exact = candidate.astype(np.float32) == narrow[todo]
+        wide[todo[exact]] = candidate[exact]
+        todo, magnitude = todo[~exact], magnitude[~exact]
+        if not len(todo):
+            break
+    return wide
+
+
+def for_bigquery(df, table_name):
+    """The table's columns in compact types, with float32 widened decimally for BigQuery's FLOAT64.
+
+    A plain cast would store 0.6 as 0.6000000238, and the notebook's `fire_risk_score > 0.6`
+    would then count it.
+    """
+    # Nullable fields a source does not produce at all are sent as NULL
+    typed = to_typed(df.reindex(columns=columns(table_name)), table_name)
+    return typed.assign(**{name: widen_float32(typed[name]) for name, _, kind, _ in TABLE_FIELDS[table_name]
+                           if kind == 'float32'})
+
+
+def bigquery_schema(table_name):
+    """google.cloud.bigquery SchemaFields for a table (imports the SDK on use)"""
+    from google.cloud import bigquery
+    return [bigquery.SchemaField(name, bq_type, description=description)
+            for name, bq_type, _, description in TABLE_FIELDS[table_name]]
+
+
+def add_missing_bigquery_fields(bq_client, table, table_name):
+    """Add schema fields a table created before they existed lacks (nullable, so old rows read NULL)"""
+    present = {field.name for field in table.schema}
+    missing = [field for field in bigquery_schema(table_name) if field.name not in present]
+    if missing:
+        table.schema = list(table.schema) + missing
+        bq_client.update_table(table, ['schema'])
+    return [field.name for field in missing]
+
+
+def arrow_schema(table_name, exclude=(), wide_floats=False):
+    """pyarrow schema of the compact on-disk representation (partition columns can be excluded).
+
+    wide_floats keeps float32 columns as float64, for frames from for_bigquery.
+    """
+    return pa.schema([(name, pa.float64() if wide_floats and kind == 'float32' else _ARROW_TYPES[kind])
+                      for name, _, kind, _ in TABLE_FIELDS[table_name] if name not in exclude])
+
+
+def create_table_sql(table_ref, table_name):
+    """CREATE OR REPLACE TABLE statement used by deploy_v1.sh"""
+    fields = ",\n".join(f"  {name} {bq_type} OPTIONS(description='{description}')"
+                        for name, bq_type, _, description in TABLE_FIELDS[table_name])
+    return (f"CREATE OR REPLACE TABLE `{table_ref}.{table_name}` (\n{fields}\n)\n"
+            f"OPTIONS(\n  description='{TABLE_OPTIONS[table_name]}',\n"
+            f"  labels=[('environment', 'demo'), ('project', 'wildfire')]\n);")
+
+
+def memory_per_row(df):
+    return df.memory_usage(deep=True, index=False).sum() / max(len(df), 1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and sys.argv[1] == "--ddl":
+        print(create_table_sql(sys.argv[3], sys.argv[2]))
+    else:
+        from generateSimulatedData import generate_weather_data_vectorized
+        typed = generate_weather_data_vectorized(locations=50, seed=0)
+        untyped = typed.astype({'location': object, 'humidity': np.int64, 'wind_deg': np.int64,
+                                'pressure': np.int64, 'visibility': np.int64, 'temp_max': np.float64,
+                                'wind_speed': np.float64, 'uvi': np.float64, 'fire_risk_score': np.float64})
+        untyped['date'] = typed['date'].dt.strftime('%Y-%m-%d').astype(object)
+        print(f"weather_data, {len(typed):,} rows: {memory_per_row(untyped):.1f} bytes/row untyped, "
+              f"{memory_per_row(typed):.1f} bytes/row typed")
@@ -0,0 +1,278 @@
+import os
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from stationRegistry import load_registry
+from weatherMessages import MessageIndex
+
+IMAGE_METADATA_PATH = './data/image_metadata.csv'
+
+# Weather stations -> region, and region -> the NWS offices whose alerts cover it, both from the
+# station registry. Napa County is served by the San Francisco Bay Area office (MTR); stations
+# not listed fall back to DEFAULT_REGION.
+DEFAULT_REGION = 'Napa_Valley'
+STATION_REGIONS = load_registry().station_regions()
+REGION_OFFICES = load_registry().region_offices() or {DEFAULT_REGION: ['MTR']}
+
+
+def _key_codes(left, right):
+    """Integer codes for two key columns over a shared vocabulary"""
+    codes, _ = pd.factorize(pd.concat([pd.Series(left, dtype=object), pd.Series(right, dtype=object)],
+                                      ignore_index=True))
+    return codes[:len(left)].astype(np.int64), codes[len(left):].astype(np.int64)
+
+
+def _ns(values):
+    return pd.to_datetime(pd.Series(values)).to_numpy('datetime64[ns]').view(np.int64)
+
+
+def interval_overlaps(left_key, left_start, left_end, right_key, right_start, right_end):
+    """All (left, right) index pairs with equal keys whose [start, end) intervals overlap.
+
+    The right side is sorted once by (key, start) and, per key, bounded by its longest
+    interval, so each left interval is two binary searches plus its matching candidates:
+    O((n + m) log m + candidates) rather than a per-row query.
+    """
+    left_codes, right_codes = _key_codes(left_key, right_key)
+    left_start, left_end = _ns(left_start), _ns(left_end)
+    right_start, right_end = _ns(right_start), _ns(right_end)
+    if not len(right_codes) or not len(left_codes):
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    order = np.lexsort((right_start, right_codes))
+    sorted_codes, sorted_start, sorted_end = right_codes[order], right_start[order], right_end[order]
+    longest = np.zeros(max(left_codes.max(), right_codes.max()) + 1, dtype=np.int64)
+    np.maximum.at(longest, sorted_codes, sorted_end - sorted_start)
+
+    # Each key is a contiguous run of the sorted right side; binary-search start times within it
+    key_lo = np.searchsorted(sorted_codes, left_codes, side='left')
+    key_hi = np.searchsorted(sorted_codes, left_codes, side='right')
+    lo, hi = np.empty(len(left_codes), dtype=np.int64), np.empty(len(left_codes), dtype=np.int64)
+    for code in np.unique(left_codes):
+        rows = np.flatnonzero(left_codes == code)
+        first, last = key_lo[rows[0]], key_hi[rows[0]]
+        starts = sorted_start[first:last]
+        lo[rows] = first + np.searchsorted(starts, left_start[rows] - longest[code], side='right')
+        hi[rows] = first + np.searchsorted(starts, left_end[rows], side='left')
+
+    counts = np.maximum(hi - lo, 0)
+    left_index = np.repeat(np.arange(len(left_codes)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_sorted = np.repeat(lo, counts) + offsets
+    overlapping = sorted_end[right_sorted] > left_start[left_index]
+    return left_index[overlapping], order[right_sorted[overlapping]]
+
+
+def asof_nearest(left_key, left_time, right_key, right_time, direction='nearest', tolerance=None):
+    """For each left row, the index of the right row with the same key closest in time (-1 if none).
+
+    direction is 'backward' (latest at or before), 'forward' (earliest at or after) or 'nearest'.
+    tolerance is an optional pd.Timedelta bound on the gap.
+    """
+    left_codes, right_codes = _key_codes(left_key, right_key)
+    left_time, right_time = _ns(left_time), _ns(right_time)
+    result = np.full(len(left_codes), -1, dtype=np.int64)
+    if not len(right_codes):
+        return result
+
+    order = np.lexsort((right_time, right_codes))
+    sorted_codes, sorted_time = right_codes[order], right_time[order]
+    key_lo = np.searchsorted(sorted_codes, left_codes, side='left')
+    key_hi = np.searchsorted(sorted_codes, left_codes, side='right')
+    for code in np.unique(left_codes):
+        rows = np.flatnonzero(left_codes == code)
+        first, last = key_lo[rows[0]], key_hi[rows[0]]
+        if first == last:
+            continue
+        times = sorted_time[first:last]
+        after = np.searchsorted(times, left_time[rows], side='left')
+        before = np.searchsorted(times, left_time[rows], side='right') - 1
+        has_before, has_after = before >= 0, after < len(times)
+        gap_before = np.where(has_before, left_time[rows] - times[np.maximum(before, 0)], np.iinfo(np.int64).max)
+        gap_after = np.where(has_after, times[np.minimum(after, len(times) - 1)] - left_time[rows],
+                             np.iinfo(np.int64).max)
+        if direction == 'backward':
+            pick, gap, found = before, gap_before, has_before
+        elif direction == 'forward':
+            pick, gap, found = after, gap_after, has_after
+        else:
+            use_before = gap_before <= gap_after
+            pick = np.where(use_before, before, after)
+            gap = np.minimum(gap_before, gap_after)
+            found = has_before | has_after
+        if tolerance is not None:
+            found &= gap <= pd.Timedelta(tolerance).value
+        result[rows[found]] = order[first + pick[found]]
+    return result
+
+
+def load_alert_windows(index=None):
+    """Alerts with an IN EFFECT window from the message index, with the region each office covers"""
+    df = (index or MessageIndex.load()).df
+    df = df[df['effective_start'].notna() & df['effective_end'].notna()]
+    office_regions = [(office, region) for region, offices in REGION_OFFICES.items() for office in offices]
+    regions = pd.DataFrame(office_regions, columns=['office', 'region'])
+    df = df.assign(office=df['office'].astype(str)).merge(regions, on='office', how='inner')
+    return df.reset_index(drop=True)
+
+
+def load_images(path=IMAGE_METADATA_PATH):
+    """Satellite image metadata with capture dates taken from the file name where it has one.
+
+    date_captured in image_metadata.csv is the upload date for most files, while names such as
+    napa_dry_vegetation_20200915.jpg carry the real capture date.
+    """
+    df = pd.read_csv(path)
+    from_name = df['filename'].str.extract(r'(\d{4})-?(\d{2})-?(\d{2})')
+    named = pd.to_datetime(from_name[0] + '-' + from_name[1] + '-' + from_name[2], errors='coerce')
+    df['capture_date'] = named.fillna(pd.to_datetime(df['date_captured']))
+    return df.rename(columns={'location': 'region'})
+
+
+def fuse(weather, alerts, images, station_regions=None, image_direction='nearest', image_tolerance=None):
+    """Match every weather row with the alerts in effect that day and the nearest image in time.
+
+    weather needs location and date; alerts need region, effective_start, effective_end,
+    alert_type, issue_time and file; images need region, capture_date and gcs_uri. Returns the
+    weather rows with active_alerts, alert_types, alert_reference (latest issued active alert),
+    image_uri, image_capture_date and image_lag_days, computed in one vectorized pass.
+    """
+    station_regions = station_regions or STATION_REGIONS
+    regions = weather['location'].astype(object).map(station_regions).fillna(DEFAULT_REGION).to_numpy(object)
+    day_start = pd.to_datetime(weather['date']).to_numpy('datetime64[ns]')
+    day_end = day_start + np.timedelta64(1, 'D')
+
+    left, right = interval_overlaps(regions, day_start, day_end, alerts['region'].to_numpy(object),
+                                    alerts['effective_start'], alerts['effective_end'])
+    fused = weather.reset_index(drop=True).copy()
+    fused['active_alerts'] = np.bincount(left, minlength=len(fused)).astype(np.int16)
+    fused['alert_types'] = None
+    fused['alert_reference'] = None
+    if len(left):
+        # Alert types are few: OR one bit per type into each row, then spell out each distinct mask
+        type_codes, type_names = pd.factorize(alerts['alert_type'].astype(str).to_numpy(object), sort=True)
+        masks = np.zeros(len(fused), dtype=np.uint64)
+        np.bitwise_or.at(masks, left, np.left_shift(np.uint64(1), type_codes[right].astype(np.uint64)))
+        distinct, inverse = np.unique(masks, return_inverse=True)
+        spelled = np.array([','.join(name for bit, name in enumerate(type_names) if int(mask) >> bit & 1) or None
+                            for mask in distinct], dtype=object)
+        fused['alert_types'] = spelled[inverse]
+
+        order = np.lexsort((_ns(alerts['issue_time'])[right], left))
+        last = np.flatnonzero(np.r_[left[order][1:] != left[order][:-1], True])
+        fused.loc[left[order][last], 'alert_reference'] = alerts['file'].to_numpy(object)[right[order][last]]
+
+    nearest = asof_nearest(regions, day_start, images['region'].to_numpy(object), images['capture_date'],
+                           image_direction, image_tolerance)
+    found = nearest >= 0
+    capture = pd.to_datetime(images['capture_date']).to_numpy('datetime64[ns]')
+    fused['image_uri'] = np.where(found, images['gcs_uri'].to_numpy(object)[np.maximum(nearest, 0)], None)
+    fused['image_capture_date'] = pd.to_datetime(np.where(found, capture[np.maximum(nearest, 0)],
+                                                          np.datetime64('NaT')))
+    fused['image_lag_days'] = ((day_start - fused['image_capture_date'].to_numpy('datetime64[ns]'))
+                               / np.timedelta64(1, 'D')).astype(np.float32)
+    return fused
+
+
+def _fuse_row_by_row(weather, alerts, images, station_regions=None):
+    """Reference implementation: one filter per weather row, used to verify fuse()"""
+    station_regions = station_regions or STATION_REGIONS
+    counts, uris = [], []
+    for row in weather.itertuples(index=False):
+        region = station_regions.get(row.location, DEFAULT_REGION)
+        day = pd.Timestamp(row.date)
+        active = alerts[(alerts['region'] == region) & (alerts['effective_start'] < day + pd.Timedelta(days=1))
+                        & (alerts['effective_end'] > day)]
+        counts.append(len(active))
+        candidates = images[images['region'] == region]
+        if len(candidates):
+            gaps = (pd.to_datetime(candidates['capture_date']) - day).abs()
+            uris.append(candidates['gcs_uri'].iloc[int(np.argmin(gaps.to_numpy()))])
+        else:
+            uris.append(None)
+    return counts, uris
+
+
+def _synthetic_alerts(num_alerts, regions, start='2017-01-01', days=2900, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 24, num_alerts), unit='h')
+    return pd.DataFrame({
+        'region': rng.choice(regions, num_alerts),
+        'alert_type': rng.choice(['RED_FLAG_WARNING', 'FIRE_WEATHER_WATCH'], num_alerts),
+        'issue_time': starts - pd.Timedelta(hours=2),
+        'effective_start': starts,
+        'effective_end': starts + pd.to_timedelta(rng.integers(3, 72, num_alerts), unit='h'),
+        'file': [f"alert_{i}.txt" for i in range(num_alerts)]
+    })
+
+
+def verify_fuse(num_rows=2000, seed=0):
+    """Compare fuse() with the row-by-row reference on random stations, alerts and images"""
+    rng = np.random.default_rng(seed)
+    regions = ['Napa_Valley', 'Sonoma', 'Lake']
+    station_regions = {f"S{i}": regions[i % 3] for i in range(9)}
+    weather = pd.DataFrame({'location': rng.choice(list(station_regions), num_rows),
+                            'date': pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 2900, num_rows), 'D')})
+    alerts = _synthetic_alerts(400, regions, seed=seed)
+    images = pd.DataFrame({'region': rng.choice(regions, 60), 'gcs_uri': [f"gs://b/images/{i}.jpg" for i in range(60)],
+                           'capture_date': pd.Timestamp('2017-01-01') + pd.to_timedelta(rng.integers(0, 2900, 60), 'D')})
+    fused = fuse(weather, alerts, images, station_regions)
+    counts, uris = _fuse_row_by_row(weather, alerts, images, station_regions)
+    count_mismatches = int((fused['active_alerts'].to_numpy() != np.array(counts)).sum())
+    # Equidistant captures may resolve to either image; compare the gap instead of the uri
+    capture_by_uri = dict(zip(images['gcs_uri'], images['capture_date']))
+    expected_gap = np.array([abs((capture_by_uri[uri] - day).days) for uri, day in zip(uris, weather['date'])])
+    gap_mismatches = int((np.abs(fused['image_lag_days'].to_numpy()) != expected_gap).sum())
+    print(f"  active_alerts: {count_mismatches} mismatches, nearest image: {gap_mismatches} mismatches "
+          f"in {num_rows:,} rows")
+    return count_mismatches == 0 and gap_mismatches == 0
+
+
+def benchmark_fuse(num_stations=500, num_alerts=50_000):
+    """Time fusing 8 years of daily weather for num_stations with num_alerts alerts"""
+    from generateSimulatedData import generate_weather_data_vectorized
+    weather = generate_weather_data_vectorized(locations=num_stations, seed=0)[['location', 'date']]
+    regions = [f"Region_{i}" for i in range(20)]
+    station_regions = {name: regions[i % len(regions)] for i, name in enumerate(weather['location'].unique())}
+    alerts = _synthetic_alerts(num_alerts, regions)
+    images = load_images()
+    images = pd.concat([images.assign(region=region) for region in regions], ignore_index=True)
+    start = time.perf_counter()
+    fused = fuse(weather, alerts, images, station_regions)
+    elapsed = time.perf_counter() - start
+    print(f"  Fused {len(fused):,} weather rows with {num_alerts:,} alerts and {len(images)} images "
+          f"in {elapsed:.2f}s ({len(fused) / elapsed:,.0f} rows/sec, "
+          f"{int((fused['active_alerts'] > 0).sum()):,} rows under an alert)")
+    return elapsed
+
+
+def fused_history(weather=None):
+    """Fuse the stored weather history with the indexed alerts and the image catalogue"""
+    if weather is None:
+        from localStore import read_weather
+        weather = read_weather()
+        if weather.empty:
+            snapshots = sorted(f for f in os.listdir('./data') if re.match(r'weather_data_\d+_\d+\.csv$', f))
+            weather = pd.read_csv(os.path.join('./data', snapshots[-1]))
+    index = MessageIndex.load()
+    alerts = load_alert_windows(index)
+    covered = {office for offices in REGION_OFFICES.values() for office in offices}
+    unmapped = sorted(set(index.df['office'].dropna().astype(str)) - covered)
+    if alerts.empty and unmapped:
+        print(f"  Warning: no indexed alert office ({', '.join(unmapped)}) covers a registry region "
+              f"(expected {', '.join(sorted(covered))}); no alerts will be attached")
+    return fuse(weather, alerts, load_images())
+
+
+if __name__ == "__main__":
+    if "--verify" in sys.argv:
+        print("Checking vectorized temporal join against row-by-row lookups...")
+        sys.exit(0 if verify_fuse() else 1)
+    elif "--benchmark" in sys.argv:
+        benchmark_fuse()
+    else:
+        with pd.option_context('display.width', 200, 'display.max_columns', 20):
+            print(fused_history().sort_values('date').tail(10))
@@ -0,0 +1,19 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Generated output that a fresh checkout does not have
+_GENERATED = ('store', 'cache', 'features', 'manifests', 'runs', 'benchmarks')
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A scratch copy of ./data as the working directory, so checks never touch the real store"""
+    shutil.copytree(os.path.join(REPO_DIR, 'data'), tmp_path / 'data', ignore=shutil.ignore_patterns(*_GENERATED))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fireRiskScoring
+from fireRiskScoring import (_legacy_category, _legacy_open_meteo_score, _legacy_simulated_score, score_arrays,
+                             risk_scores)
+from generateSimulatedData import generate_weather_data_loop, iter_weather_data
+
+
+def _observations(num_rows=5_000, seed=0):
+    """Random observations plus every combination of the rule thresholds themselves"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'temp_max': np.round(rng.uniform(30, 115, num_rows), 1),
+        'humidity': rng.integers(5, 96, num_rows).astype(np.float64),
+        'wind_speed': np.round(rng.uniform(0, 60, num_rows), 1),
+        'sunshine': rng.uniform(0, 50000, num_rows)
+    })
+    edges = pd.MultiIndex.from_product([[75, 85, 95], [15, 25, 30, 35], [10, 15, 25]],
+                                       names=['temp_max', 'humidity', 'wind_speed']).to_frame(index=False)
+    return pd.concat([df, edges.astype(np.float64).assign(sunshine=10800.0)], ignore_index=True)
+
+
+def test_kernel_matches_open_meteo_rules():
+    df = _observations()
+    scored = score_arrays(df['temp_max'], df['humidity'], df['wind_speed'], df['sunshine'], version='open_meteo_v1')
+    expected = [_legacy_open_meteo_score(*row) for row in df[['temp_max', 'humidity', 'wind_speed', 'sunshine']]
+                .itertuples(index=False)]
+    np.testing.assert_array_equal(scored['fire_risk_score'], expected)
+
+
+def test_kernel_matches_generator_loop_rules():
+    """The if-chain in generate_weather_data_loop, applied row by row, against the vectorized kernel"""
+    df = _observations()
+    rng = np.random.default_rng(1)
+    base = rng.choice([0.1, 0.2, 0.5, 0.8], len(df))
+    noise = rng.uniform(-0.1, 0.1, len(df))
+    scores = risk_scores(df['temp_max'].to_numpy(), df['humidity'].to_numpy(), df['wind_speed'].to_numpy(),
+                         base=base, noise=noise, version='simulated_v1')
+    expected = [_legacy_simulated_score(*row) for row in zip(base, df['temp_max'], df['humidity'],
+                                                             df['wind_speed'], noise)]
+    np.testing.assert_array_equal(scores, expected)
+
+
+def test_generator_paths_share_columns():
+    loop = generate_weather_data_loop(50)
+    vectorized = next(iter_weather_data(num_records=50, seed=0))
+    assert list(loop.columns) == list(vectorized.columns)
+    for df in (loop, vectorized):
+        assert df['fire_risk_score'].between(0, 1).all()
+        assert set(df['source'].astype(str)) == {'simulated'}
+
+
+def test_view_sql_matches_kernel_on_duckdb():
+    duckdb = pytest.importorskip('duckdb')
+    from localQueryEngine import to_duckdb_sql
+
+    df = _observations()
+    df.insert(0, 'location', 'Napa_Valley')
+    df.insert(1, 'date', pd.date_range('2020-01-01', periods=len(df)).date)
+    df['fire_risk_score'] = score_arrays(df['temp_max'], df['humidity'], df['wind_speed'],
+                                         df['sunshine'])['fire_risk_score']
+    conn = duckdb.connect()
+    conn.register('weather_frame', df)
+    conn.execute("CREATE TABLE weather_data AS SELECT * FROM weather_frame")
+    conn.execute(to_duckdb_sql(fireRiskScoring.fire_risk_view_sql('project.dataset')))
+    view = conn.execute("SELECT date, risk_category, haines_index FROM fire_risk_analysis ORDER BY date").df()
+
+    scored = score_arrays(df['temp_max'], df['humidity'], df['wind_speed'])
+    assert list(view['risk_category']) == [str(category) for category in scored['risk_category']]
+    assert list(view['risk_category']) == [_legacy_category(*row) for row in df[['temp_max', 'humidity',
+                                                                                  'wind_speed']].itertuples(index=False)]
+    np.testing.assert_allclose(view['haines_index'], scored['haines_index'], atol=0.01 + 1e-9)
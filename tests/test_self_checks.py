@@ -0,0 +1,80 @@
+"""The modules' --verify / --check self-checks, run against a scratch copy of ./data"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingestPipeline import RollingKeyDeduper
+
+
+def _weather(rows):
+    return pd.DataFrame(rows, columns=['location', 'date', 'temp_max', 'humidity', 'wind_speed'])
+
+
+def test_deduper_keeps_the_last_row_per_key():
+    dedupe = RollingKeyDeduper()
+    first = _weather([('Napa_Valley', '2020-09-01', 90.0, 20, 10.0),
+                      ('Napa_Valley', '2020-09-01', 91.0, 20, 10.0),
+                      ('St_Helena', '2020-09-01', 88.0, 25, 12.0)])
+    repeat = _weather([('St_Helena', '2020-09-01', 88.0, 25, 12.0),
+                       ('Napa_Valley', '2020-09-01', 95.0, 10, 30.0)])
+    kept = list(dedupe([first, repeat]))
+
+    assert kept[0]['temp_max'].tolist() == [91.0, 88.0]
+    # An exact repeat is dropped; a changed row for a seen key passes through for the store to upsert
+    assert kept[1]['temp_max'].tolist() == [95.0]
+    assert dedupe.dropped == 2
+
+
+def test_deduper_forgets_keys_outside_the_window():
+    dedupe = RollingKeyDeduper(window_days=7)
+    day = _weather([('Napa_Valley', '2020-09-01', 90.0, 20, 10.0)])
+    later = _weather([('Napa_Valley', '2020-12-01', 90.0, 20, 10.0)])
+    list(dedupe([day, later]))
+    assert len(dedupe.seen_hashes) == 1
+    assert np.array_equal(dedupe.seen_dates, np.array(['2020-12-01'], dtype='datetime64[D]'))
+
+
+def test_temporal_join(workdir):
+    from temporalJoin import verify_fuse
+    assert verify_fuse(num_rows=500)
+
+
+def test_fuel_dryness(workdir):
+    from fuelDryness import verify_features
+    assert verify_features()
+
+
+def test_hourly_rollups(workdir):
+    from hourlyWeather import verify_rollups
+    assert verify_rollups()
+
+
+def test_noaa_collector(workdir):
+    from collectRealData import check_noaa
+    assert check_noaa(station_counts=(4, 16), latency=0.01)
+
+
+def test_risk_watcher(workdir):
+    from riskWatcher import check_watcher
+    assert check_watcher()
+
+
+def test_ignition_windows(workdir):
+    from ignitionWindows import verify_windows
+    assert verify_windows()
+
+
+def test_station_index(workdir):
+    from stationRegistry import verify_index
+    assert verify_index(num_stations=1000, num_queries=500)
+
+
+def test_object_sync(workdir):
+    from objectSync import check_sync
+    assert check_sync(latency=0.005)
+
+
+def test_query_cache(workdir):
+    pytest.importorskip('duckdb')
+    from queryCache import check_cache
+    assert check_cache()
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pandas as pd
+
+MANIFEST_DIR = './data/manifests'
+
+# Natural key of each table; the local store and the manifests keep one row per key
+UPSERT_KEYS = {
+    'weather_data': ['location', 'date'],
+    'fire_history': ['fire_name', 'fire_year', 'alarm_date'],
+    'fuel_dryness': ['location', 'date'],
+    'weather_hourly': ['location', 'date', 'hour'],
+    'fire_weather_daily': ['location', 'date']
+}
+
+
+def _hash_rows(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy(np.uint64)
+
+
+def row_hashes(df, table_name):
+    """Return (key_hash, row_hash) arrays for a frame about to be uploaded"""
+    normalized = df.copy()
+    for column in normalized.columns:
+        if normalized[column].dtype == object or str(normalized[column].dtype).startswith(('datetime', 'string', 'category')):
+            normalized[column] = normalized[column].astype(str)
+    return _hash_rows(normalized[UPSERT_KEYS[table_name]]), _hash_rows(normalized[sorted(normalized.columns)])
+
+
+def manifest_path(table_id, directory=MANIFEST_DIR):
+    return os.path.join(directory, f"{table_id}.parquet")
+
+
+def load_manifest(table_id, directory=MANIFEST_DIR):
+    """Load the key_hash -> row_hash manifest of what has been uploaded to table_id"""
+    path = manifest_path(table_id, directory)
+    if not os.path.exists(path):
+        return pd.Series(dtype=np.uint64, index=pd.Index([], dtype=np.uint64), name='row_hash')
+    manifest = pd.read_parquet(path)
+    return pd.Series(manifest['row_hash'].to_numpy(np.uint64), index=manifest['key_hash'].to_numpy(np.uint64),
+                     name='row_hash')
+
+
+def save_manifest(manifest, table_id, directory=MANIFEST_DIR):
+    os.makedirs(directory, exist_ok=True)
+    pd.DataFrame({'key_hash': manifest.index.to_numpy(np.uint64), 'row_hash': manifest.to_numpy(np.uint64)}) \
+        .to_parquet(manifest_path(table_id, directory), index=False)
+
+
+def diff_rows(df, table_name, manifest):
+    """Compare a frame's rows with a manifest.
+
+    Returns (send, report, key_hash, row_hash): a boolean mask of the rows of df that are new or
+    changed, the insert/update/skip counts, and the hashes of the rows kept (duplicate keys in df
+    keep their last row) for update_manifest.
+    """
+    key_hash, row_hash = row_hashes(df, table_name)
+    keep = ~pd.Series(key_hash).duplicated(keep='last').to_numpy()
+    key_hash, row_hash = key_hash[keep], row_hash[keep]
+
+    positions = manifest.index.get_indexer(key_hash)
+    is_new = positions < 0
+    stored = manifest.to_numpy(np.uint64)[np.maximum(positions, 0)] if len(manifest) else row_hash
+    is_changed = ~is_new & (stored != row_hash)
+
+    report = {
+        'insert': int(is_new.sum()),
+        'update': int(is_changed.sum()),
+        'skip': int((~is_new & ~is_changed).sum())
+    }
+    send = keep.copy()
+    send[keep] = is_new | is_changed
+    return send, report, key_hash, row_hash
+
+
+def update_manifest(manifest, key_hash, row_hash):
+    """The manifest with the given keys' row hashes added or replaced"""
+    updated = pd.Series(row_hash, index=key_hash, name='row_hash')
+    return pd.concat([manifest[~manifest.index.isin(key_hash)], updated])
+
+
+def plan_delta(df, table_name, manifest):
+    """Split a frame into rows to insert, rows to update and rows already uploaded unchanged.
+
+    Returns (delta_df, report, updated_manifest). Duplicate keys in df keep their last row.
+    """
+    send, report, key_hash, row_hash = diff_rows(df, table_name, manifest)
+    return df[send], report, update_manifest(manifest, key_hash, row_hash)
+
+
+def merge_sql(final_table_id, staging_table_id, columns, keys):
+    """MERGE statement that upserts staging rows into the final table on keys"""
+    on = "\n       AND ".join(f"T.{key} = S.{key}" for key in keys)
+    updates = ",\n        ".join(f"{column} = S.{column}" for column in columns if column not in keys)
+    return f"""
+    MERGE `{final_table_id}` T
+    USING `{staging_table_id}` S
+    ON {on}
+    WHEN MATCHED THEN
+      UPDATE SET
+        {updates}
+    WHEN NOT MATCHED THEN
+      INSERT ROW
+    """
@@ -0,0 +1,316 @@
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+from localStore import STORE_ROOT
+
+MESSAGES_DIR = './data/weather_messages'
+MESSAGE_INDEX_PATH = os.path.join(STORE_ROOT, 'weather_messages.parquet')
+
+MESSAGE_COLUMNS = ['file', 'size', 'mtime_ns', 'office', 'product', 'alert_type', 'issue_time',
+                   'effective_start', 'effective_end', 'wind_direction', 'wind_min_mph', 'wind_max_mph',
+                   'gust_max_mph', 'rh_min_pct', 'rh_max_pct', 'headline', 'affected_area', 'impacts']
+CATEGORY_COLUMNS = ['office', 'product', 'alert_type', 'wind_direction']
+INT_COLUMNS = ['wind_min_mph', 'wind_max_mph', 'gust_max_mph', 'rh_min_pct', 'rh_max_pct']
+TIME_COLUMNS = ['issue_time', 'effective_start', 'effective_end']
+
+# Product line -> alert_type for messages without an "...X IN EFFECT..." headline
+PRODUCT_ALERT_TYPES = {
+    'FIRE WEATHER OUTLOOK': 'FIRE_WEATHER_OUTLOOK',
+    'URGENT - FIRE WEATHER MESSAGE': 'FIRE_WEATHER_ALERT'
+}
+TIMEZONE_OFFSETS = {'UTC': 0, 'GMT': 0, 'Z': 0, 'PST': -8, 'PDT': -7, 'MST': -7, 'MDT': -6}
+WEEKDAYS = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN']
+
+_OFFICE = re.compile(r'^National Weather Service\s+(\w+)', re.MULTILINE)
+_ISSUED = re.compile(r'^(\d{1,2}):?(\d{2})\s*(AM|PM)\s+([A-Z]{1,3})\s+\w{3}\s+(\w{3})\s+(\d{1,2})\s+(\d{4})\s*$',
+                     re.MULTILINE | re.IGNORECASE)
+_HEADLINE = re.compile(r'^\.\.\.(.+?)\.\.\.\s*$', re.MULTILINE)
+_IN_EFFECT = re.compile(r'^(.+?)\s+IN EFFECT\b(.*)$')
+_TIME = r'(\d{1,2})(?::?(\d{2}))?\s*(AM|PM)\s+([A-Z]{1,3})(?:\s+(MON|TUE|WED|THU|FRI|SAT|SUN)\w*)?'
+_FROM = re.compile(r'\bFROM\s+' + _TIME)
+_UNTIL = re.compile(r'\b(?:UNTIL|THROUGH)\s+' + _TIME)
+_WINDS = re.compile(r'^WINDS\.\.\.(?:(\w+)\s+winds\s+)?(\d+)(?:\s+to\s+(\d+))?\s*mph(?:.*?gusts\s+(?:up\s+to\s+)?(\d+)\s*mph)?',
+                    re.MULTILINE | re.IGNORECASE)
+_HUMIDITY = re.compile(r'^RELATIVE HUMIDITY\.\.\.(?:as low as\s+)?(\d+)(?:\s+to\s+(\d+))?\s*percent',
+                       re.MULTILINE | re.IGNORECASE)
+_SECTION = r'^{}\.\.\.(.*?)(?=\n\s*\n|\Z)'
+_AFFECTED = re.compile(_SECTION.format('AFFECTED AREA'), re.MULTILINE | re.DOTALL)
+_IMPACTS = re.compile(_SECTION.format('IMPACTS'), re.MULTILINE | re.DOTALL)
+
+
+def _hour(hour, minute, meridiem):
+    return int(hour) % 12 + (12 if meridiem.upper() == 'PM' else 0), int(minute or 0)
+
+
+def _resolve_time(match, reference):
+    """Turn an 'HH AM TZ Day' headline time into UTC, on or after the day of reference"""
+    hour, minute = _hour(match.group(1), match.group(2), match.group(3))
+    offset = TIMEZONE_OFFSETS.get(match.group(4).upper(), 0)
+    local_reference = reference + timedelta(hours=offset)
+    days = 0
+    if match.group(5):
+        days = (WEEKDAYS.index(match.group(5).upper()) - local_reference.weekday()) % 7
+    local = local_reference.replace(hour=hour, minute=minute, second=0, microsecond=0) + timedelta(days=days)
+    return local - timedelta(hours=offset)
+
+
+def parse_message(text, file=None):
+    """Parse one NWS fire weather message into a dict of MESSAGE_COLUMNS values.
+
+    Times are naive UTC. The effective window comes from the "...X IN EFFECT FROM ... UNTIL ..."
+    headline, with weekday-relative times resolved against the issue time; messages without
+    one have no window.
+    """
+    lines = text.lstrip().splitlines()
+    product = lines[0].strip().upper() if lines else ''
+    record = dict.fromkeys(MESSAGE_COLUMNS)
+    record.update(file=file, product=product, alert_type=PRODUCT_ALERT_TYPES.get(product, 'OTHER'))
+
+    office = _OFFICE.search(text)
+    if office:
+        record['office'] = office.group(1).upper()
+
+    issued = _ISSUED.search(text)
+    if issued:
+        hour, minute = _hour(issued.group(1), issued.group(2), issued.group(3))
+        local = datetime.strptime(f"{issued.group(5)} {issued.group(6)} {issued.group(7)}", '%b %d %Y')
+        local = local.replace(hour=hour, minute=minute)
+        record['issue_time'] = local - timedelta(hours=TIMEZONE_OFFSETS.get(issued.group(4).upper(), 0))
+
+    for headline in _HEADLINE.findall(text):
+        in_effect = _IN_EFFECT.match(headline.strip().upper())
+        if not in_effect:
+            continue
+        record['headline'] = headline.strip()
+        record['alert_type'] = re.sub(r'\W+', '_', in_effect.group(1).strip())
+        if record['issue_time'] is not None:
+            window = in_effect.group(2)
+            start_match, end_match = _FROM.search(window), _UNTIL.search(window)
+            start = _resolve_time(start_match, record['issue_time']) if start_match else record['issue_time']
+            record['effective_start'] = start
+            if end_match:
+                end = _resolve_time(end_match, start)
+                record['effective_end'] = end if end > start else end + timedelta(days=7)
+        break
+
+    winds = _WINDS.search(text)
+    if winds:
+        record['wind_direction'] = winds.group(1).upper() if winds.group(1) else None
+        record['wind_min_mph'] = int(winds.group(2))
+        record['wind_max_mph'] = int(winds.group(3) or winds.group(2))
+        record['gust_max_mph'] = int(winds.group(4)) if winds.group(4) else None
+
+    humidity = _HUMIDITY.search(text)
+    if humidity:
+        record['rh_min_pct'] = int(humidity.group(1))
+        record['rh_max_pct'] = int(humidity.group(2) or humidity.group(1))
+
+    for column, pattern in (('affected_area', _AFFECTED), ('impacts', _IMPACTS)):
+        section = pattern.search(text)
+        if section:
+            record[column] = ' '.join(section.group(1).split())
+    return record
+
+
+def _typed(records):
+    """Build the typed columnar message table from parsed records"""
+    df = pd.DataFrame.from_records(records, columns=MESSAGE_COLUMNS)
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    for column in INT_COLUMNS:
+        df[column] = df[column].astype('Int16')
+    for column in TIME_COLUMNS:
+        df[column] = pd.to_datetime(df[column])
+    df['size'] = df['size'].astype(np.int64)
+    df['mtime_ns'] = df['mtime_ns'].astype(np.int64)
+    return df
+
+
+def parse_messages(paths):
+    """Parse message files in bulk into the typed table"""
+    records = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            record = parse_message(f.read(), os.path.basename(path))
+        stat = os.stat(path)
+        record['size'], record['mtime_ns'] = stat.st_size, stat.st_mtime_ns
+        records.append(record)
+    return _typed(records)
+
+
+class MessageIndex:
+    """Typed table of parsed messages with lookups by office, alert type, issue time and validity.
+
+    Rows are kept sorted by (alert_type, office, effective_start), so each (alert_type, office)
+    group is a contiguous slice found from a dict. Within a group, effective windows are found
+    by binary search on the start times (bounded by the group's longest window) and issue times
+    through a per-group sorted permutation, so lookups never scan the table.
+    """
+
+    def __init__(self, df=None):
+        self.df = _typed([]) if df is None else df
+        self._build()
+
+    def _build(self):
+        # Messages without an IN EFFECT window are valid for their issue date
+        window_start = self.df['effective_start'].fillna(self.df['issue_time'].dt.floor('D'))
+        df = self.df.assign(_window_start=window_start).sort_values(
+            ['alert_type', 'office', '_window_start', 'issue_time'], kind='stable', ignore_index=True)
+        starts = df.pop('_window_start')
+        ends = df['effective_end'].fillna(starts.dt.floor('D') + pd.Timedelta(days=1))
+        self.df = df
+        self._starts = starts.to_numpy('datetime64[ns]')
+        self._ends = ends.to_numpy('datetime64[ns]')
+        self._issued = df['issue_time'].to_numpy('datetime64[ns]')
+
+        self.groups = {}
+        alert_types = df['alert_type'].astype(str).to_numpy()
+        offices = df['office'].astype(str).to_numpy()
+        changes = np.flatnonzero((alert_types[1:] != alert_types[:-1]) | (offices[1:] != offices[:-1])) + 1
+        bounds = np.concatenate([[0], changes, [len(df)]]) if len(df) else []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            duration = (self._ends[lo:hi] - self._starts[lo:hi]).max()
+            issue_order = lo + np.argsort(self._issued[lo:hi], kind='stable')
+            self.groups[(alert_types[lo], offices[lo])] = (lo, hi, duration, issue_order)
+
+    def _slices(self, alert_type=None, office=None):
+        for (group_type, group_office), group in self.groups.items():
+            if (alert_type is None or group_type == alert_type) and (office is None or group_office == office):
+                yield group
+
+    def active(self, on, alert_type=None, office=None, until=None):
+        """Messages whose effective window overlaps the day on (or the span on..until).
+
+        Messages without an IN EFFECT window count as active on their issue date.
+        """
+        span_start = np.datetime64(pd.Timestamp(on).floor('D'), 'ns')
+        span_end = np.datetime64(pd.Timestamp(until or on).floor('D') + pd.Timedelta(days=1), 'ns')
+        rows = []
+        for lo, hi, duration, _ in self._slices(alert_type, office):
+            first = lo + np.searchsorted(self._starts[lo:hi], span_start - duration, side='left')
+            last = lo + np.searchsorted(self._starts[lo:hi], span_end, side='left')
+            candidates = np.arange(first, last)
+            rows.append(candidates[self._ends[first:last] > span_start])
+        return self.df.iloc[np.concatenate(rows) if rows else []]
+
+    def issued(self, start=None, end=None, alert_type=None, office=None):
+        """Messages issued in [start, end)"""
+        low = np.datetime64(pd.Timestamp(start), 'ns') if start is not None else None
+        high = np.datetime64(pd.Timestamp(end), 'ns') if end is not None else None
+        rows = []
+        for lo, hi, _, issue_order in self._slices(alert_type, office):
+            times = self._issued[issue_order]
+            first = np.searchsorted(times, low, side='left') if low is not None else 0
+            last = np.searchsorted(times, high, side='left') if high is not None else len(times)
+            rows.append(issue_order[first:last])
+        return self.df.iloc[np.sort(np.concatenate(rows)) if rows else []]
+
+    def update(self, directory=MESSAGES_DIR):
+        """Re-index a message folder, parsing only files that are new or changed since the last run"""
+        indexed = dict(zip(self.df['file'], zip(self.df['size'], self.df['mtime_ns'])))
+        current, changed = set(), []
+        for entry in os.scandir(directory):
+            if not entry.is_file() or not entry.name.endswith('.txt'):
+                continue
+            current.add(entry.name)
+            stat = entry.stat()
+            if indexed.get(entry.name) != (stat.st_size, stat.st_mtime_ns):
+                changed.append(entry.path)
+
+        removed = set(indexed) - current
+        stale = removed | {os.path.basename(path) for path in changed}
+        kept = self.df[~self.df['file'].isin(stale)]
+        report = {'parsed': len(changed), 'unchanged': len(kept), 'removed': len(removed)}
+        if changed or removed:
+            parsed = parse_messages(sorted(changed))
+            frames = [frame for frame in (kept, parsed) if len(frame)]
+            combined = pd.concat(frames, ignore_index=True) if frames else _typed([])
+            for column in CATEGORY_COLUMNS:
+                combined[column] = combined[column].astype('category')
+            self.df = combined
+            self._build()
+        return report
+
+    def save(self, path=MESSAGE_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.df.to_parquet(path, index=False, compression='zstd')
+
+    @classmethod
+    def load(cls, path=MESSAGE_INDEX_PATH):
+        if not os.path.exists(path):
+            return cls()
+        return cls(pd.read_parquet(path))
+
+
+def index_messages(directory=MESSAGES_DIR, path=MESSAGE_INDEX_PATH):
+    """Bring the on-disk message index up to date with a folder and return it"""
+    start = time.perf_counter()
+    index = MessageIndex.load(path)
+    report = index.update(directory)
+    if report['parsed'] or report['removed']:
+        index.save(path)
+    print(f"Indexed {directory}: {report['parsed']} parsed, {report['unchanged']} unchanged, "
+          f"{report['removed']} removed in {time.perf_counter() - start:.3f}s")
+    return index
+
+
+def benchmark_messages(num_files=10_000, directory='./data/cache/message_benchmark'):
+    """Time a cold bulk index of num_files messages, an incremental re-index and an active-on lookup"""
+    templates = [os.path.join(MESSAGES_DIR, name) for name in sorted(os.listdir(MESSAGES_DIR))]
+    texts = [open(path, encoding='utf-8').read() for path in templates]
+    offices = ['HNX', 'REV', 'MTR', 'STO', 'EKA', 'LOX', 'SGX', 'MFR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    rng = np.random.default_rng(0)
+    base = datetime(2017, 1, 1)
+    for i in range(num_files):
+        issued = base + timedelta(days=int(rng.integers(0, 2900)), minutes=int(rng.integers(0, 1440)))
+        office = offices[i % len(offices)]
+        text = re.sub(r'(National Weather Service )\w+', rf'\g<1>{office}', texts[i % len(texts)])
+        text = re.sub(r'^\d{2}:\d{2} [AP]M UTC \w{3} \w{3} \d{2} \d{4}$',
+                      issued.strftime('%I:%M %p UTC %a %b %d %Y'), text, flags=re.MULTILINE)
+        text = re.sub(r'FROM \d{2} [AP]M UTC \w{3} UNTIL \d{2} [AP]M UTC \w{3}',
+                      issued.strftime('FROM %I %p UTC %a UNTIL ') +
+                      (issued + timedelta(hours=int(rng.integers(3, 30)))).strftime('%I %p UTC %a'), text)
+        with open(os.path.join(directory, f"message_{i:06d}.txt"), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    path = os.path.join(directory, 'index.parquet')
+    start = time.perf_counter()
+    index_messages(directory, path)
+    cold = time.perf_counter() - start
+    print(f"  Cold index: {num_files:,} messages in {cold:.3f}s ({num_files / cold:,.0f} messages/sec)")
+
+    with open(os.path.join(directory, 'message_new.txt'), 'w', encoding='utf-8') as f:
+        f.write(texts[0])
+    start = time.perf_counter()
+    index = index_messages(directory, path)
+    print(f"  Incremental re-index (1 new file): {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    lookups = 1000
+    for day in pd.date_range('2018-01-01', periods=lookups, freq='D'):
+        index.active(day, 'RED_FLAG_WARNING', 'HNX')
+    elapsed = time.perf_counter() - start
+    print(f"  active(date, RED_FLAG_WARNING, HNX): {elapsed / lookups * 1e6:.0f} µs per lookup")
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        benchmark_messages()
+    elif len(sys.argv) > 2 and sys.argv[1] == "active":
+        args = sys.argv[2:]
+        index = index_messages()
+        alert_type = args[args.index('--type') + 1] if '--type' in args else None
+        office = args[args.index('--office') + 1] if '--office' in args else None
+        with pd.option_context('display.width', 200, 'display.max_columns', 12):
+            print(index.active(args[0], alert_type, office)[['file', 'office', 'alert_type', 'issue_time',
+                                                             'effective_start', 'effective_end']])
+    else:
+        index_messages(sys.argv[1] if len(sys.argv) > 1 else MESSAGES_DIR)